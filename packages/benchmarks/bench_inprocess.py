@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+PreFigure: in-process build benchmarks, per example and per element tag.
+
+`bench_build.py` times whole `prefig build` subprocesses, so interpreter
+startup, the numpy/scipy/shapely/lxml imports and the node + MathJax spawn
+dominate each number and hide regressions in the element code itself. This
+driver instead imports PreFigure once and builds each source under
+`tests/examples/` in-process, repeatedly, with MathJax either
+
+  - cached (default): the first build of an example runs MathJax and every
+    later build reuses its output, so node is never timed, or
+  - mocked (`--mathjax mock`): every label gets a small placeholder SVG of a
+    fixed size, so no node/MathJax installation is needed at all.
+
+Each timed build runs with the build profiler (`prefig build --profile`)
+attached, so besides the per-example wall time we report the self time spent
+in each element tag (`graph`, `label`, `repeat`, ...) summed over the corpus.
+Builds go through `mk_diagram(..., return_string=True)`, so nothing is written.
+
+Results can be saved as a JSON baseline and later runs compared against it;
+any example or tag whose median time grows beyond the threshold is flagged
+and the script exits non-zero, so it can gate changes to the element modules.
+
+Usage:
+    python benchmarks/bench_inprocess.py [--runs N] [--category hand_crafted]
+    python benchmarks/bench_inprocess.py --save-baseline baseline.json
+    python benchmarks/bench_inprocess.py --baseline baseline.json --threshold 0.15
+"""
+
+import argparse
+import json
+import logging
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import lxml.etree as ET
+
+# ============================================================================
+# Configuration
+# ============================================================================
+
+PACKAGES_DIR = Path(__file__).resolve().parent.parent   # packages/
+TESTS_DIR = PACKAGES_DIR / "tests"
+EXAMPLES_DIR = TESTS_DIR / "examples"
+
+# Import prefig from this checkout and reuse the test suite's build helper so
+# that the benchmark builds sources exactly the way the snapshot tests do.
+sys.path.insert(0, str(PACKAGES_DIR))
+sys.path.insert(0, str(TESTS_DIR))
+
+from prefig.core import label_tools, parse, profile   # noqa: E402
+from helpers.build_helper import find_publication, load_source, pushd   # noqa: E402
+
+DEFAULT_RUNS = 5
+DEFAULT_WARMUP = 1
+DEFAULT_THRESHOLD = 0.10   # flag medians more than 10% slower than baseline
+DEFAULT_MIN_DELTA_MS = 0.5  # ...and at least this much slower in absolute terms
+
+
+# ============================================================================
+# MathJax substitutes
+# ============================================================================
+
+MATHJAX_OUTPUT = {}   # (format, input bytes) -> MathJax output bytes
+MATHJAX_MODE = "cache"
+
+SVG_NS = "http://www.w3.org/2000/svg"
+
+
+def mock_mathjax_output(html_bytes, format):
+    """Build MathJax-shaped output with a placeholder for every label div."""
+    html = ET.fromstring(html_bytes)
+    out_html = ET.Element("html")
+    body = ET.SubElement(out_html, "body")
+    for div in html.iter("div"):
+        out_div = ET.SubElement(body, "div", id=div.get("id"))
+        data = ET.SubElement(out_div, "mjx-data")
+        text = (div.text or "").strip()
+        if format == "tactile":
+            ET.SubElement(data, "mjx-braille").text = "⠿" * max(len(text) // 2, 1)
+            continue
+        container = ET.SubElement(data, "mjx-container")
+        width = 0.6 * max(len(text) - 4, 1)
+        svg = ET.SubElement(container, f"{{{SVG_NS}}}svg", nsmap={None: SVG_NS})
+        svg.set("style", "vertical-align: -0.186ex;")
+        svg.set("width", f"{width:.3f}ex")
+        svg.set("height", "1.717ex")
+        svg.set("viewBox", f"0 -677 {int(width * 442)} 759")
+        ET.SubElement(svg, f"{{{SVG_NS}}}defs")
+        g = ET.SubElement(svg, f"{{{SVG_NS}}}g")
+        ET.SubElement(g, f"{{{SVG_NS}}}rect",
+                      width=str(int(width * 442)), height="677")
+    return ET.tostring(out_html)
+
+
+class BenchMathLabels(label_tools.LocalMathLabels):
+    """LocalMathLabels whose MathJax run is served from a cache or mocked."""
+
+    def run_mathjax(self, mj_input, mj_output):
+        html_bytes = Path(mj_input).read_bytes()
+        key = (self.format, html_bytes)
+        output = MATHJAX_OUTPUT.get(key)
+        if output is None:
+            if MATHJAX_MODE == "mock":
+                output = mock_mathjax_output(html_bytes, self.format)
+            else:
+                if not super().run_mathjax(mj_input, mj_output):
+                    return False
+                output = Path(mj_output).read_bytes()
+            MATHJAX_OUTPUT[key] = output
+        Path(mj_output).write_bytes(output)
+        return True
+
+
+def install_math_labels(mode):
+    global MATHJAX_MODE
+    MATHJAX_MODE = mode
+    label_tools.LocalMathLabels = BenchMathLabels
+
+
+# ============================================================================
+# Timing
+# ============================================================================
+
+def discover(categories, names):
+    sources = []
+    for category in sorted(p for p in EXAMPLES_DIR.iterdir() if p.is_dir()):
+        if categories and category.name not in categories:
+            continue
+        for source in sorted(category.glob("*.xml")):
+            if source.name == "pf_publication.xml":
+                continue
+            if names and source.name not in names and source.stem not in names:
+                continue
+            sources.append(source)
+    return sources
+
+
+def build_once(source):
+    """Build `source` in-process; return (elapsed_ms, profiler, ok)."""
+    profiler = profile.BuildProfiler()
+    with pushd(source.parent):
+        diagram = load_source(source)
+        if diagram is None:
+            return None, profiler, False
+        publication = find_publication()
+        start = time.perf_counter()
+        result = parse.mk_diagram(diagram, "svg", publication, source.stem,
+                                  False, None, "pf_cli",
+                                  return_string=True, profiler=profiler)
+        elapsed = (time.perf_counter() - start) * 1000.0
+    return elapsed, profiler, result is not None
+
+
+def tag_times(profiler):
+    times = {}
+    for record in profiler.records:
+        times[record["tag"]] = times.get(record["tag"], 0.0) + 1000.0 * record["self"]["time"]
+    return times
+
+
+def summary(samples):
+    return {
+        "mean": statistics.mean(samples),
+        "median": statistics.median(samples),
+        "std": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        "min": min(samples),
+        "runs": len(samples),
+    }
+
+
+def bench(sources, runs, warmup):
+    examples = {}
+    tag_samples = {}
+    for source in sources:
+        rel = str(source.relative_to(EXAMPLES_DIR).with_suffix(""))
+        samples = []
+        per_tag = []
+        ok = True
+        for i in range(warmup + runs):
+            elapsed, profiler, ok = build_once(source)
+            if not ok:
+                break
+            if i >= warmup:
+                samples.append(elapsed)
+                per_tag.append(tag_times(profiler))
+        if not ok:
+            print(f"  {rel}: build failed, skipping", file=sys.stderr)
+            continue
+        examples[rel] = summary(samples)
+        # per-tag samples are summed over the corpus for each repeat
+        for run, times in enumerate(per_tag):
+            for tag, ms in times.items():
+                tag_samples.setdefault(tag, [0.0] * runs)[run] += ms
+    tags = {tag: summary(samples) for tag, samples in tag_samples.items()}
+    return {"examples": examples, "tags": tags}
+
+
+# ============================================================================
+# Reporting
+# ============================================================================
+
+def print_table(title, entries, baseline=None, flagged=()):
+    if not entries:
+        return
+    name_w = max([len(name) for name in entries] + [len(title)])
+    header = f"  {title.ljust(name_w)}   {'median':>9}   {'mean':>9} {'±std':>7}   {'min':>9}"
+    if baseline is not None:
+        header += f"   {'baseline':>9}   {'change':>7}"
+    print(header)
+    print("  " + "-" * (len(header) - 2))
+    for name, s in sorted(entries.items(), key=lambda kv: -kv[1]["median"]):
+        row = (f"  {name.ljust(name_w)}   {s['median']:9.2f}   {s['mean']:9.2f} "
+               f"{s['std']:7.2f}   {s['min']:9.2f}")
+        if baseline is not None:
+            base = baseline.get(name)
+            if base is None:
+                row += f"   {'new':>9}   {'':>7}"
+            else:
+                change = (s["median"] - base["median"]) / base["median"] if base["median"] else 0.0
+                row += f"   {base['median']:9.2f}   {change:+6.1%}"
+            if name in flagged:
+                row += "  REGRESSION"
+        print(row)
+    print()
+
+
+def regressions(current, baseline, threshold, min_delta):
+    flagged = []
+    for name, s in current.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        delta = s["median"] - base["median"]
+        if delta > min_delta and delta > threshold * base["median"]:
+            flagged.append(name)
+    return flagged
+
+
+# ============================================================================
+# Main
+# ============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1],
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=DEFAULT_RUNS,
+                        help=f"timed builds per example (default {DEFAULT_RUNS})")
+    parser.add_argument("--warmup", type=int, default=DEFAULT_WARMUP,
+                        help=f"discarded builds per example (default {DEFAULT_WARMUP})")
+    parser.add_argument("--category", nargs="*", default=None,
+                        help="only these example categories (e.g. hand_crafted)")
+    parser.add_argument("--examples", nargs="*", default=None,
+                        help="only these examples (file names or stems)")
+    parser.add_argument("--mathjax", choices=["cache", "mock"], default="cache",
+                        help="reuse real MathJax output (cache) or use placeholders (mock)")
+    parser.add_argument("--baseline", type=Path, default=None,
+                        help="compare against this JSON baseline and flag regressions")
+    parser.add_argument("--save-baseline", type=Path, default=None,
+                        help="write these results as a JSON baseline")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help=f"relative slowdown of the median to flag (default {DEFAULT_THRESHOLD})")
+    parser.add_argument("--min-delta", type=float, default=DEFAULT_MIN_DELTA_MS,
+                        help=f"absolute slowdown in ms required to flag (default {DEFAULT_MIN_DELTA_MS})")
+    args = parser.parse_args()
+
+    # element errors are part of some examples; keep the output readable
+    logging.getLogger("prefigure").setLevel(logging.CRITICAL)
+    install_math_labels(args.mathjax)
+
+    sources = discover(args.category, args.examples)
+    if not sources:
+        print("No examples selected.", file=sys.stderr)
+        return 2
+
+    print(f"Building {len(sources)} examples in-process, "
+          f"{args.runs} runs (+{args.warmup} warmup), MathJax {args.mathjax}d\n")
+    results = bench(sources, args.runs, args.warmup)
+    results["settings"] = {"runs": args.runs, "warmup": args.warmup, "mathjax": args.mathjax}
+
+    baseline = None
+    flagged_examples, flagged_tags = [], []
+    if args.baseline is not None:
+        baseline = json.loads(args.baseline.read_text())
+        flagged_examples = regressions(results["examples"], baseline["examples"],
+                                       args.threshold, args.min_delta)
+        flagged_tags = regressions(results["tags"], baseline["tags"],
+                                   args.threshold, args.min_delta)
+
+    print_table("example (ms)", results["examples"],
+                baseline["examples"] if baseline else None, flagged_examples)
+    print_table("tag, self time summed over examples (ms)", results["tags"],
+                baseline["tags"] if baseline else None, flagged_tags)
+
+    if args.save_baseline is not None:
+        args.save_baseline.write_text(json.dumps(results, indent=2) + "\n")
+        print(f"Baseline written to {args.save_baseline}")
+
+    if flagged_examples or flagged_tags:
+        print(f"{len(flagged_examples)} example(s) and {len(flagged_tags)} tag(s) "
+              f"regressed by more than {args.threshold:.0%}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+PreFigure: synthetic scaling benchmarks for large diagrams.
+
+The example corpus is made of small, hand-sized diagrams, so code whose cost
+grows faster than the size of the diagram never shows up in `bench_build.py`
+or `bench_inprocess.py`. This driver generates diagrams of a single family at
+increasing size N, builds each one in-process, and records the build time and
+the peak memory (via tracemalloc) as N grows:
+
+  scatter         N points in a <scatter>
+  repeat          a <repeat> of N iterations, each drawing a <point>
+  labels          N math labels (MathJax is mocked, see bench_inprocess.py)
+  network         a <network> with N nodes and 2N edges
+  slope-field     a <slope-field> with about N line segments
+  implicit-curve  an <implicit-curve> refined to an N x N grid
+  graph           a <graph> sampled at N points
+
+For every family the exponent k of the fit time ~ N^k is reported; a family
+whose exponent exceeds --flag-exponent is marked SUPERLINEAR and the script
+exits non-zero. The smallest size is left out of the fit since it is mostly
+fixed per-build cost. The curves can be written as JSON or CSV and plotted on
+log-log axes with matplotlib.
+
+Usage:
+    python benchmarks/bench_scaling.py [--families scatter labels] [--steps 6]
+    python benchmarks/bench_scaling.py --json scaling.json --output scaling.png
+    python benchmarks/bench_scaling.py --emit generated/    # write the sources
+"""
+
+import argparse
+import csv
+import json
+import logging
+import math
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import lxml.etree as ET
+
+from bench_inprocess import install_math_labels   # also puts prefig on sys.path
+
+from prefig.core import metrics, parse   # noqa: E402
+
+# ============================================================================
+# Configuration
+# ============================================================================
+
+DEFAULT_RUNS = 3
+DEFAULT_STEPS = 5
+DEFAULT_FLAG_EXPONENT = 1.3
+
+BBOX = "(-4, -4, 4, 4)"
+
+
+# ============================================================================
+# Generators
+# ============================================================================
+# Each generator returns the body of a <coordinates> element for size N.
+# Values come from a seeded generator so the sources are reproducible.
+
+def gen_scatter(n):
+    rng = random.Random(n)
+    points = ",".join(f"({rng.uniform(-4, 4):.4f},{rng.uniform(-4, 4):.4f})"
+                      for _ in range(n))
+    return f'<scatter points="[{points}]" size="2"/>'
+
+
+def gen_repeat(n):
+    return (f'<repeat parameter="k=1..{n}">'
+            f'<point p="(8*k/{n}-4, 3*sin(k))" size="2"/>'
+            f'</repeat>')
+
+
+def gen_labels(n):
+    rng = random.Random(n)
+    return "".join(f'<label p="({rng.uniform(-4, 4):.3f},{rng.uniform(-4, 4):.3f})">'
+                   f'<m>x_{{{k}}}</m></label>'
+                   for k in range(n))
+
+
+def gen_network(n):
+    # a ring with one chord out of every node, so 2N edges
+    rng = random.Random(n)
+    graph = ",".join(f"{k}:[{(k + 1) % n},{rng.randrange(n)}]" for k in range(n))
+    return (f'<definition>graph={{{graph}}}</definition>'
+            f'<network graph="graph" seed="1" node-size="3"/>')
+
+
+def gen_slope_field(n):
+    side = max(int(round(math.sqrt(n))), 2)
+    step = 8 / side
+    return (f'<definition>f(t,y) = t - y</definition>'
+            f'<slope-field function="f" '
+            f'spacings="((-4,{step:.6f},4),(-4,{step:.6f},4))"/>')
+
+
+def gen_implicit_curve(n):
+    depth = max(int(round(math.log2(n))), 4)
+    return (f'<definition>f(x,y) = y^2 - x^3 + x - sin(3*x*y)</definition>'
+            f'<implicit-curve function="f" k="0" depth="{depth}" initial-depth="4"/>')
+
+
+def gen_graph(n):
+    return (f'<definition>f(x) = sin(5*x) + cos(13*x)/3</definition>'
+            f'<graph function="f" N="{n}"/>')
+
+
+# family -> (generator, smallest N); sizes double from there
+FAMILIES = {
+    "scatter": (gen_scatter, 250),
+    "repeat": (gen_repeat, 50),
+    "labels": (gen_labels, 25),
+    "network": (gen_network, 10),
+    "slope-field": (gen_slope_field, 100),
+    "implicit-curve": (gen_implicit_curve, 64),
+    "graph": (gen_graph, 500),
+}
+
+
+def sizes(family, steps):
+    start = FAMILIES[family][1]
+    return [start * 2 ** i for i in range(steps)]
+
+
+def source_text(family, n):
+    body = FAMILIES[family][0](n)
+    return (f'<diagram dimensions="(400,400)" margins="5">'
+            f'<coordinates bbox="{BBOX}">{body}</coordinates>'
+            f'</diagram>')
+
+
+# ============================================================================
+# Timing
+# ============================================================================
+
+def build_once(family, n, trace_memory=False):
+    """Build one generated diagram; return its metrics record or None."""
+    diagram = ET.fromstring(source_text(family, n))
+    build_metrics = metrics.BuildMetrics(trace_memory=trace_memory)
+    result = parse.mk_diagram(diagram, "svg", None, f"{family}-{n}",
+                              False, None, "pf_cli", return_string=True,
+                              build_metrics=build_metrics)
+    if result is None or build_metrics.status != "ok":
+        return None
+    return build_metrics.record()
+
+
+def bench(families, steps, runs):
+    results = {}
+    for family in families:
+        curve = []
+        for n in sizes(family, steps):
+            # tracemalloc slows the build down, so the peak memory comes
+            # from a separate build that is not timed
+            record = build_once(family, n, trace_memory=True)
+            if record is None:
+                print(f"  {family} N={n}: build failed, skipping", file=sys.stderr)
+                break
+            peak = record["peak-memory"]
+            samples = []
+            for _ in range(runs):
+                start = time.perf_counter()
+                build_once(family, n)
+                samples.append((time.perf_counter() - start) * 1000.0)
+            curve.append({
+                "n": n,
+                "median-ms": statistics.median(samples),
+                "min-ms": min(samples),
+                "peak-memory-kb": peak / 1024.0,
+            })
+            print(f"  {family:<15} N={n:<6} {curve[-1]['median-ms']:10.1f} ms"
+                  f" {curve[-1]['peak-memory-kb']:10.0f} KiB", file=sys.stderr)
+        results[family] = {
+            "points": curve,
+            "time-exponent": exponent(curve, "median-ms"),
+            "memory-exponent": exponent(curve, "peak-memory-kb"),
+        }
+    return results
+
+
+def exponent(curve, key):
+    """Least-squares slope of log(value) against log(N), skipping the smallest N."""
+    points = [(math.log(p["n"]), math.log(p[key])) for p in curve[1:] if p[key] > 0]
+    if len(points) < 2:
+        return None
+    mean_x = statistics.mean(x for x, _ in points)
+    mean_y = statistics.mean(y for _, y in points)
+    sxx = sum((x - mean_x) ** 2 for x, _ in points)
+    sxy = sum((x - mean_x) * (y - mean_y) for x, y in points)
+    return sxy / sxx
+
+
+# ============================================================================
+# Reporting
+# ============================================================================
+
+def fmt_exponent(k):
+    return "   -" if k is None else f"{k:4.2f}"
+
+
+def print_table(results, flag_exponent):
+    flagged = []
+    print(f"  {'family':<15} {'sizes':<22} {'time ms (largest)':>18}"
+          f" {'time ~N^k':>10} {'memory ~N^k':>12}")
+    print("  " + "-" * 80)
+    for family, r in results.items():
+        points = r["points"]
+        if not points:
+            continue
+        span = f"{points[0]['n']}..{points[-1]['n']}"
+        row = (f"  {family:<15} {span:<22} {points[-1]['median-ms']:18.1f}"
+               f" {fmt_exponent(r['time-exponent']):>10}"
+               f" {fmt_exponent(r['memory-exponent']):>12}")
+        if r["time-exponent"] is not None and r["time-exponent"] > flag_exponent:
+            row += "  SUPERLINEAR"
+            flagged.append(family)
+        print(row)
+    print()
+    return flagged
+
+
+def write_csv(results, path):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["family", "n", "median-ms", "min-ms", "peak-memory-kb"])
+        for family, r in results.items():
+            for p in r["points"]:
+                writer.writerow([family, p["n"], f"{p['median-ms']:.3f}",
+                                 f"{p['min-ms']:.3f}", f"{p['peak-memory-kb']:.1f}"])
+
+
+def plot(results, path):
+    try:
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+    except ImportError:
+        print("matplotlib is needed for --output", file=sys.stderr)
+        return
+    fig, (ax_time, ax_mem) = plt.subplots(1, 2, figsize=(12, 5))
+    for family, r in results.items():
+        n = [p["n"] for p in r["points"]]
+        ax_time.loglog(n, [p["median-ms"] for p in r["points"]], "o-", label=family)
+        ax_mem.loglog(n, [p["peak-memory-kb"] for p in r["points"]], "o-", label=family)
+    ax_time.set(xlabel="N", ylabel="median build time (ms)", title="Build time")
+    ax_mem.set(xlabel="N", ylabel="peak memory (KiB)", title="Peak memory")
+    for ax in (ax_time, ax_mem):
+        ax.grid(True, which="both", alpha=0.3)
+        ax.legend()
+    fig.tight_layout()
+    fig.savefig(path, dpi=120)
+    print(f"Chart written to {path}")
+
+
+# ============================================================================
+# Main
+# ============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1],
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--families", nargs="*", default=list(FAMILIES),
+                        choices=list(FAMILIES), metavar="FAMILY",
+                        help=f"families to run (default all: {', '.join(FAMILIES)})")
+    parser.add_argument("--steps", type=int, default=DEFAULT_STEPS,
+                        help=f"number of sizes, doubling N each time (default {DEFAULT_STEPS})")
+    parser.add_argument("--runs", type=int, default=DEFAULT_RUNS,
+                        help=f"timed builds per size (default {DEFAULT_RUNS})")
+    parser.add_argument("--flag-exponent", type=float, default=DEFAULT_FLAG_EXPONENT,
+                        help=f"flag families whose time grows faster than N^k "
+                             f"(default {DEFAULT_FLAG_EXPONENT})")
+    parser.add_argument("--json", type=Path, default=None, help="write the curves as JSON")
+    parser.add_argument("--csv", type=Path, default=None, help="write the curves as CSV")
+    parser.add_argument("--output", type=Path, default=None,
+                        help="write a log-log PNG chart (needs matplotlib)")
+    parser.add_argument("--emit", type=Path, default=None,
+                        help="write the generated sources to this directory and exit")
+    args = parser.parse_args()
+
+    if args.emit is not None:
+        args.emit.mkdir(parents=True, exist_ok=True)
+        for family in args.families:
+            for n in sizes(family, args.steps):
+                (args.emit / f"{family}-{n}.xml").write_text(source_text(family, n) + "\n")
+        print(f"Sources written to {args.emit}")
+        return 0
+
+    logging.getLogger("prefigure").setLevel(logging.CRITICAL)
+    install_math_labels("mock")
+
+    print(f"Building {len(args.families)} families at {args.steps} sizes, "
+          f"{args.runs} runs each\n", file=sys.stderr)
+    results = bench(args.families, args.steps, args.runs)
+    print()
+    flagged = print_table(results, args.flag_exponent)
+
+    if args.json is not None:
+        args.json.write_text(json.dumps(results, indent=2) + "\n")
+        print(f"Results written to {args.json}")
+    if args.csv is not None:
+        write_csv(results, args.csv)
+        print(f"Results written to {args.csv}")
+    if args.output is not None:
+        plot(results, args.output)
+
+    if flagged:
+        print(f"{len(flagged)} family(ies) scale worse than N^{args.flag_exponent}: "
+              f"{', '.join(flagged)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
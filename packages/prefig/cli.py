@@ -6,6 +6,7 @@ except:
     click_log = ErrorOnAccess('click_log')
 import os
 import sys
+import json
 import socket
 import shutil
 import subprocess
@@ -193,17 +194,92 @@ def examples():
     default=False,
     help="Suppress the creation of a diagram caption when creating tactile diagrams"
 )
+@click.option(
+    "--profile",
+    is_flag=True,
+    default=False,
+    help="Record the time, evaluations, and SVG output of each element in output/<name>-profile.json and output/<name>-profile.folded"
+)
+@click.option(
+    "--metrics",
+    is_flag=True,
+    default=False,
+    help="Print a JSON record of phase timings, label counts, bytes written, and cache hit rates for each diagram built"
+)
+@click.option(
+    "--metrics-file",
+    type=click.Path(),
+    default=None,
+    help="Append a JSON record of phase timings, label counts, bytes written, and cache hit rates for this build to the given file"
+)
+@click.option(
+    "--trace-memory",
+    is_flag=True,
+    default=False,
+    help="Include peak memory use, measured with tracemalloc, in the build metrics"
+)
+@click.option(
+    "--braille-cache",
+    type=click.Path(),
+    default=None,
+    help="Keep braille translations for tactile diagrams in the given file so they can be reused by later builds"
+)
+@click.option(
+    "--layout-cache",
+    type=click.Path(),
+    default=None,
+    help="Keep network layouts in the given file so that later builds can reuse them"
+)
+@click.option(
+    "--compact",
+    is_flag=True,
+    default=False,
+    help="Write smaller SVG without indentation, using relative path commands and CSS classes for repeated styles"
+)
+@click.option(
+    "--precision",
+    type=click.IntRange(min=0),
+    default=None,
+    help="Number of digits after the decimal point in SVG coordinates (default 1)"
+)
+@click.option(
+    "--parallel",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Do the expensive work of elements such as implicit curves, slope fields, and network layouts in a pool of this many processes"
+)
 @click.argument(
     "filename",
     type=click.Path()
 )
-def build(format, publication, ignore_publication, suppress_caption, filename):
-    return engine.build(format,
-                        filename,
-                        publication=publication,
-                        ignore_publication=ignore_publication,
-                        suppress_caption=suppress_caption,
-                        environment="pf_cli")
+def build(format, publication, ignore_publication, suppress_caption, profile,
+          metrics, metrics_file, trace_memory, braille_cache, layout_cache,
+          compact, precision, parallel, filename):
+    profile_report = []
+    result = engine.build(format,
+                          filename,
+                          publication=publication,
+                          ignore_publication=ignore_publication,
+                          suppress_caption=suppress_caption,
+                          environment="pf_cli",
+                          profile=profile,
+                          profile_report=profile_report,
+                          metrics=metrics,
+                          trace_memory=trace_memory,
+                          metrics_file=metrics_file,
+                          braille_cache=braille_cache,
+                          layout_cache=layout_cache,
+                          compact=compact,
+                          precision=precision,
+                          parallel=parallel)
+    for report in profile_report:
+        click.echo(report)
+    if metrics:
+        filename, records = result
+        for record in records:
+            click.echo(json.dumps(record))
+        return filename
+    return result
 
 @main.command(
     help="Convert the PreFigure SVG into a PDF"
@@ -152,6 +152,15 @@ class CTM:
         transformed_point = [math_util.dot(self.ctm[i], p) for i in range(2)]
         return np.array(transformed_point)
 
+    # transform an array of points at once
+    def transform_points(self, points):
+        points = np.asarray(points, dtype=float)
+        x = self.scale_x(points[:, 0])
+        y = self.scale_y(points[:, 1])
+        m = self.ctm
+        return np.column_stack([m[0][0]*x + m[0][1]*y + m[0][2],
+                                m[1][0]*x + m[1][1]*y + m[1][2]])
+
     def project_to_screen(self, p):
         # permute the coordinates and make homogeneous
         p = np.array([p[1], p[2], p[0], 1])
@@ -7,7 +7,9 @@ from . import (
     circle,
     circuit,
     clip,
+    compact,
     coordinates,
+    decimate,
     CTM,
     definition,
     diagram,
@@ -20,11 +22,14 @@ from . import (
     label_tools,
     line,
     math_utilities,
+    metrics,
+    parallel,
     parametric_curve,
     parse,
     path,
     point,
     polygon,
+    profile,
     read,
     rectangle,
     repeat,
@@ -148,6 +148,7 @@ pronounciations = {
     'implicit-curve': 'implicit curve',
     'parametric-curve': 'parametric curve',
     'plot-de-solution': 'plot D E solution',
+    'plot-de-solutions': 'plot D E solutions',
     'riemann-sum': 'Riemann sum',
     'slope-field': 'slope field',
     'tick-mark': 'tick mark',
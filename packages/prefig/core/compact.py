@@ -0,0 +1,177 @@
+import re
+import lxml.etree as ET
+from . import utilities as util
+
+# Compact output.  With prefig build --compact, the SVG is written
+# without indentation, path data uses relative commands, numbers are
+# written without trailing zeros, and sets of presentation attributes
+# shared by several elements are replaced by a class defined in a
+# <style> element.  The ids of elements are left alone so that the
+# annotations and diagcess continue to find the elements they refer to.
+
+enabled = False
+
+def init(compact=False, precision=None):
+    global enabled
+    enabled = compact
+    util.set_precision(precision, trim=compact)
+
+# presentation attributes that may be moved into a class
+presentation_attributes = ['stroke', 'stroke-width', 'stroke-dasharray',
+                           'stroke-opacity', 'stroke-linecap',
+                           'stroke-linejoin', 'fill', 'fill-opacity',
+                           'fill-rule', 'opacity']
+
+def compact_svg(root):
+    relative_paths(root)
+    hoist_styles(root)
+
+# Find the sets of presentation attributes appearing on more than one
+# element and replace each with a class.  The rules are scoped by the
+# id of the diagram so that several diagrams can be included in the
+# same HTML page.  Without an id, the rules couldn't be kept from
+# applying to other figures so the attributes are left in place.
+def hoist_styles(root):
+    scope = root.get('id')
+    if scope is None:
+        return
+    styles = {}
+    for element in root.iter():
+        if element is root or not isinstance(element.tag, str):
+            continue
+        attributes = tuple([(name, element.get(name))
+                            for name in presentation_attributes
+                            if element.get(name) is not None])
+        if len(attributes) == 0:
+            continue
+        styles.setdefault(attributes, []).append(element)
+
+    rules = []
+    for attributes, elements in styles.items():
+        if len(elements) < 2:
+            continue
+        name = 's' + str(len(rules))
+        declarations = ';'.join([f'{attr}:{value}'
+                                 for attr, value in attributes])
+        rules.append(f'.{name}{{{declarations}}}')
+        for element in elements:
+            for attr, value in attributes:
+                element.attrib.pop(attr)
+            classes = element.get('class')
+            if classes is None:
+                element.set('class', name)
+            else:
+                element.set('class', classes + ' ' + name)
+
+    if len(rules) == 0:
+        return
+    rules = [f'#{scope} {rule}' for rule in rules]
+    style = ET.Element('style')
+    style.text = ''.join(rules)
+    root.insert(0, style)
+
+# Rewrite the path data in the diagram using relative commands
+def relative_paths(root):
+    for path in root.iter('path'):
+        d = path.get('d')
+        if d is not None:
+            path.set('d', relative_path(d))
+
+path_token = re.compile(r'[A-Za-z]|[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?')
+
+# the number of arguments taken by each path command
+path_arguments = {'M': 2, 'L': 2, 'T': 2, 'H': 1, 'V': 1, 'C': 6,
+                  'S': 4, 'Q': 4, 'A': 7, 'Z': 0}
+
+# The coordinates are rounded to the output precision before the
+# differences are formed so that rounding errors don't accumulate
+# along the path.
+def relative_path(d):
+    digits = util.precision
+    tokens = path_token.findall(d)
+    current = [0, 0]
+    start = [0, 0]
+    output = []
+    command = None
+    last_letter = None
+    index = 0
+    while index < len(tokens):
+        token = tokens[index]
+        if token.isalpha():
+            command = token
+            index += 1
+            if command.upper() == 'Z':
+                output.append('z')
+                last_letter = 'z'
+                current = start
+                continue
+        elif command is None:
+            return d
+        name = command.upper()
+        count = path_arguments.get(name)
+        if count is None:
+            return d
+        try:
+            args = [float(t) for t in tokens[index:index+count]]
+        except ValueError:
+            return d
+        if len(args) < count:
+            return d
+        index += count
+
+        if command.islower():
+            # a relative command is made absolute first
+            if name == 'H':
+                args = [current[0] + args[0]]
+            elif name == 'V':
+                args = [current[1] + args[0]]
+            elif name == 'A':
+                args[5:7] = [current[0] + args[5], current[1] + args[6]]
+            else:
+                args = [args[i] + current[i % 2] for i in range(count)]
+
+        if name == 'H':
+            x = round(args[0], digits)
+            numbers = [x - current[0]]
+            current = [x, current[1]]
+        elif name == 'V':
+            y = round(args[0], digits)
+            numbers = [y - current[1]]
+            current = [current[0], y]
+        elif name == 'A':
+            point = [round(c, digits) for c in args[5:7]]
+            numbers = args[:5] + [point[0] - current[0], point[1] - current[1]]
+            current = point
+        else:
+            points = [round(c, digits) for c in args]
+            numbers = [points[i] - current[i % 2] for i in range(count)]
+            current = points[-2:]
+
+        if name == 'M':
+            start = current
+            # the first moveto is absolute either way
+            if len(output) == 0:
+                numbers = current
+        # a command letter isn't needed when the last command repeats
+        letter = name.lower()
+        numbers = join_numbers(numbers)
+        if letter == last_letter and letter not in 'mz':
+            if not numbers.startswith('-'):
+                numbers = ' ' + numbers
+            output.append(numbers)
+        else:
+            output.append(letter + numbers)
+        last_letter = letter
+        # further coordinate pairs after a moveto are linetos
+        if name == 'M':
+            command = 'L' if command == 'M' else 'l'
+    return ''.join(output)
+
+def join_numbers(numbers):
+    text = ''
+    for number in numbers:
+        string = util.trim_number(util.float_format % number)
+        if len(text) > 0 and not string.startswith('-'):
+            text += ' '
+        text += string
+    return text
@@ -0,0 +1,87 @@
+import math
+import numpy as np
+import logging
+
+log = logging.getLogger('prefigure')
+
+# Reduce a long series of data points, in a <scatter> or <polygon>, to
+# about two points for each pixel of width in the current coordinate
+# system before anything is drawn.  The reduction is performed in SVG
+# coordinates so that it respects the current transform, including any
+# logarithmic scales.
+#
+#   decimate="min-max" keeps, from each run of consecutive points in the
+#       same pixel column, the points with the smallest and largest
+#       vertical coordinates, along with the first and last points of
+#       the whole series.
+#   decimate="lttb" uses the Largest-Triangle-Three-Buckets algorithm to
+#       choose one point in each of a fixed number of buckets.
+
+methods = ['min-max', 'lttb']
+
+def decimate(element, diagram, points):
+    method = element.get('decimate', None)
+    if method is None or method == 'no':
+        return points
+    if method not in methods:
+        log.error(f"@decimate in <{element.tag}> should be one of {', '.join(methods)}")
+        return points
+
+    N = len(points)
+    ctm, bbox = diagram.ctm_bbox()
+    corners = ctm.transform_points([bbox[:2], bbox[2:]])
+    width = max(math.ceil(abs(corners[1][0] - corners[0][0])), 1)
+    if N <= 2 * width:
+        return points
+
+    try:
+        svg_points = ctm.transform_points(points)
+    except (TypeError, ValueError):
+        log.error(f"Unable to decimate the points in <{element.tag}>")
+        return points
+
+    if method == 'min-max':
+        keep = min_max(svg_points)
+    else:
+        keep = lttb(svg_points, 2 * width)
+
+    log.debug(f"Decimating <{element.tag}> with {method}: kept {len(keep)} of {N} points and dropped {N - len(keep)}")
+    return [points[i] for i in keep]
+
+def min_max(svg_points):
+    N = len(svg_points)
+    columns = np.floor(svg_points[:, 0])
+    # label each run of consecutive points in the same column
+    starts = np.concatenate([[True], columns[1:] != columns[:-1]])
+    runs = np.cumsum(starts) - 1
+
+    # sorting by run and then by y puts each run's minimum first
+    # and its maximum last
+    order = np.lexsort((svg_points[:, 1], runs))
+    sorted_runs = runs[order]
+    first = np.concatenate([[True], sorted_runs[1:] != sorted_runs[:-1]])
+    last = np.concatenate([sorted_runs[1:] != sorted_runs[:-1], [True]])
+    keep = np.concatenate([order[first], order[last], [0, N-1]])
+    return np.unique(keep)
+
+def lttb(svg_points, threshold):
+    N = len(svg_points)
+    if threshold >= N or threshold < 3:
+        return np.arange(N)
+    # the first and last points are kept and the others are divided
+    # into threshold - 2 buckets
+    edges = np.linspace(1, N - 1, threshold - 1).astype(int)
+    keep = [0]
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i+1]
+        if i < threshold - 3:
+            next_average = svg_points[edges[i+1]:edges[i+2]].mean(axis=0)
+        else:
+            next_average = svg_points[-1]
+        a = svg_points[keep[-1]]
+        bucket = svg_points[start:end]
+        areas = np.abs((a[0] - next_average[0]) * (bucket[:, 1] - a[1]) -
+                       (a[0] - bucket[:, 0]) * (next_average[1] - a[1]))
+        keep.append(start + int(np.argmax(areas)))
+    keep.append(N - 1)
+    return np.array(keep)
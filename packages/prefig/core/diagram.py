@@ -4,6 +4,7 @@ import numpy as np
 import math
 import logging
 import copy
+import contextlib
 import re
 from pathlib import Path
 from . import tags
@@ -13,6 +14,9 @@ from . import CTM
 from . import label
 from . import math_utilities as math_util
 from . import annotations
+from . import metrics
+from . import parallel
+from . import compact
 from . import repeat
 
 log = logging.getLogger('prefigure')
@@ -29,7 +33,8 @@ class Diagram:
                  output,
                  publication,
                  suppress_caption,
-                 environment):
+                 environment,
+                 profiler=None):
         self.diagram_element = diagram_element
         self.filename = filename
         self.diagram_number = diagram_number
@@ -37,24 +42,22 @@ class Diagram:
         self.output = output
         self.suppress_caption = suppress_caption
         self.environment = environment
+        self.profiler = profiler
         self.caption = ""
 
-        # the original source may be modified while parsing
-        # We will make a copy along with a dictionary linking
-        # the copied elements to the original elements.
-        # This will be used in the playground for annotating
-        # the source
-        self.diagram_element_copy = copy.deepcopy(self.diagram_element)
-        self.source_to_copy = {}
-        for source, cp in zip(self.diagram_element.iter(),
-                                self.diagram_element_copy.iter()):
-            self.source_to_copy[source] = cp
-        self.source_to_svg = {}
-
+        # One pass through the source finds the <templates> and
+        # <annotations> and warns about boolean attributes written as
+        # true/false outside of annotations
+        templates = []
+        author_annotations = []
         excluded = set()
-        for ann in self.diagram_element.iter('annotations'):
-            excluded.update(ann.iter())
         for el in self.diagram_element.iter():
+            if el.tag == 'annotations':
+                author_annotations.append(el)
+                excluded.update(el.iter())
+                continue
+            if el.tag == 'templates':
+                templates.append(el)
             if el in excluded:
                 continue
             for attr, val in el.attrib.items():
@@ -63,11 +66,23 @@ class Diagram:
                         f'<{el.tag}> attribute {attr}="{val}": '
                         f'PreFigure uses "yes"/"no" for boolean attributes'
                     )
+        self.author_annotations_present = len(author_annotations) > 0
 
+        # the original source may be modified while parsing.  In the
+        # playground, we annotate the source when the author hasn't
+        # so only then do we make a copy along with a dictionary
+        # linking the original elements to the copied elements.
+        self.diagram_element_copy = None
+        self.source_to_copy = {}
+        self.source_to_svg = {}
         self.add_default_annotations = True
         if (self.environment == 'pyodide' and
-            len(self.diagram_element.xpath('.//annotations')) == 0
+            not self.author_annotations_present
             ):
+            self.diagram_element_copy = copy.deepcopy(self.diagram_element)
+            for source, cp in zip(self.diagram_element.iter(),
+                                  self.diagram_element_copy.iter()):
+                self.source_to_copy[source] = cp
             self.add_default_annotations = False
 
         util.set_diagram(self)
@@ -122,8 +137,11 @@ class Diagram:
         # dictionary for holding previously computed data
         self.source_to_data = {}
 
-        # a dictionary for holding shapes
+        # a dictionary for holding shapes along with their shapely
+        # geometries and the results of operations on them
         self.shape_dict = {}
+        self.shape_geometries = {}
+        self.shape_operations = {}
 
         # dictionary for saving graphical data
         self.saved_data = {}
@@ -137,9 +155,20 @@ class Diagram:
         # track textures that have been added for fill
         self.textures = {}
 
+        # MathJax glyphs shared by all the math labels, keyed by path data
+        self.glyphs = {}
+
         # a dictionary to remember some network information
         self.network_coordinates = {}
 
+        # solutions of differential equations found in this build,
+        # by problem and by the name they were given
+        self.de_solutions = {}
+        self.named_de_solutions = {}
+
+        # whether a parallel build has forked its pool for this diagram
+        self.parallel_dispatched = False
+
         # stack for managing bounding boxes and clipping
         self.clippaths = []
 
@@ -177,7 +206,6 @@ class Diagram:
                 if data_directory is not None:
                     self.external = data_directory
 
-        templates = self.diagram_element.xpath('.//templates')
         if len(templates) > 0:
             templates_element = templates[0]
             for template in templates:
@@ -186,8 +214,6 @@ class Diagram:
             for child in templates_element:
                 self.defaults[child.tag] = child
 
-        author_annotations = self.diagram_element.xpath('.//annotations')
-        self.author_annotations_present = len(author_annotations) > 0
         if self.author_annotations_present:
             self.check_annotation_ref(author_annotations[0])
 
@@ -272,6 +298,9 @@ class Diagram:
     def get_environment(self):
         return self.environment
 
+    def get_profiler(self):
+        return self.profiler
+
     def register_source_data(self, element, key, value):
         element_dict = self.source_to_data.get(element, None)
         if element_dict is None:
@@ -305,6 +334,14 @@ class Diagram:
             log.error(f"Unable to apply coordinate transform to {p}")
             return np.array([0,0])
 
+    # transform an array of points into SVG coordinates
+    def transform_points(self, points):
+        ctm, b = self.ctm_stack[-1]
+        try:
+            return ctm.transform_points(points)
+        except:
+            return np.array([self.transform(p) for p in points])
+
     def inverse_transform(self, p):
         ctm, b = self.ctm_stack[-1]
         try:
@@ -497,52 +534,45 @@ class Diagram:
         input_dir = os.path.dirname(self.filename)
         basename = Path(self.filename).stem + suffix
 
-        # perform the SVG 1.1 conversion if requested
-        if self.output_format() == 'svg11':
+        # the SVG 1.1 version is written if requested
+        svg11 = self.output_format() == 'svg11'
+        if svg11:
             basename = basename + "-11"
-            self.root = self.svg11_conversion(self.root)
 
         output_dir = os.path.join(input_dir, 'output')
         out = os.path.join(output_dir, basename)
+
+        # Each output is a filename, the attributes of its root <svg>
+        # element, and whether it is SVG 1.1.  Inside PreTeXt, we also
+        # write an SVG 1.1 version and, if there are author annotations,
+        # a version for diagcess without the height and width.
+        outputs = [(out + '.svg', dict(self.root.attrib), svg11)]
+        if not svg11 and self.environment == "pretext":
+            outputs.append((out + '-11.svg', dict(self.root.attrib), True))
+            if self.author_annotations_present:
+                attrib = dict(self.root.attrib)
+                width = attrib.pop('width')
+                height = attrib.pop('height')
+                attrib['style'] = f'aspect-ratio: {width} / {height};'
+                outputs.append((out + '-diagcess.svg', attrib, True))
+
+        if compact.enabled:
+            compact.compact_svg(self.root)
         try:
             if not os.path.exists(output_dir):
                 os.mkdir(output_dir)
-            with ET.xmlfile(out + '.svg', encoding='utf-8') as xf:
-                xf.write(self.root, pretty_print=True)
+            self.write_svg(outputs)
         except:
-            log.error(f"Unable to write SVG at {out+'.svg'}")
+            filenames = ', '.join([output[0] for output in outputs])
+            log.error(f"Unable to write SVG at {filenames}")
             return
+        for output in outputs:
+            metrics.file_written(output[0])
 
         # don't write out annotations in svg11 format
-        if self.output_format() == 'svg11':
+        if svg11:
             return
 
-        # if we're inside pretext, we'll also add an SVG1.1 version
-        if self.environment == "pretext":
-            root11 = self.svg11_conversion(self.root)
-            try:
-                with ET.xmlfile(out + '-11.svg', encoding='utf-8') as xf:
-                    xf.write(root11, pretty_print=True)
-            except:
-                log.error(f"Unable to write SVG at {out + '-11.svg'}")
-                return
-
-        if self.author_annotations_present and self.environment == "pretext":
-            # we will write out a second version of the diagram
-            # without the height and width attributes for diagcess use
-            width = self.root.get('width')
-            height = self.root.get('height')
-            self.root.attrib.pop("height")
-            self.root.attrib.pop("width")
-            self.root.set('style', f'aspect-ratio: {width} / {height};')
-            try:
-                with ET.xmlfile(out + '-diagcess.svg', encoding='utf-8') as xf:
-                    xf.write(self.root, pretty_print=True)
-                self.root.attrib.pop('style')
-            except:
-                log.error(f"Unable to write SVG at {out+'-diagcess.svg'}")
-                return
-
         if self.annotations_root is not None:
             diagram = ET.Element('diagram')
             diagram.append(self.annotations_root)
@@ -553,6 +583,7 @@ class Diagram:
                 output_file = out + '.xml'
             try:
                 et.write(output_file, pretty_print=True)
+                metrics.file_written(output_file)
             except:
                 log.error(f"Unable to write annotations in {output_file}")
                 return
@@ -568,10 +599,73 @@ class Diagram:
                 pass
 
 
+    # Write the SVG tree into all of the output files in one pass.  Each
+    # file is opened with the attributes of its root <svg> element and
+    # the top-level elements are then written to every file in turn, so
+    # only one of them is converted to SVG 1.1 at a time, on a copy if
+    # there are also SVG 2 outputs.  The indentation is that of writing
+    # the whole tree with pretty_print while compact output is not
+    # indented.
+    def write_svg(self, outputs):
+        pretty = not compact.enabled
+        # libxml2 doesn't declare the xml prefix when writing the tree
+        nsmap = {prefix: uri for prefix, uri in self.root.nsmap.items()
+                 if prefix != 'xml'}
+        svg2 = any(not svg11 for _, _, svg11 in outputs)
+        svg11 = any(svg11 for _, _, svg11 in outputs)
+        with contextlib.ExitStack() as files:
+            streams = [files.enter_context(open(filename, 'wb'))
+                       for filename, _, _ in outputs]
+            with contextlib.ExitStack() as roots:
+                writers = []
+                for stream, (_, attrib, is_svg11) in zip(streams, outputs):
+                    xf = roots.enter_context(ET.xmlfile(stream, encoding='utf-8'))
+                    roots.enter_context(xf.element(self.root.tag, attrib,
+                                                   nsmap=nsmap))
+                    writers.append((xf, is_svg11))
+                # The SVG 1.1 copies are converted under one holder so
+                # that the xlink prefixes are numbered through the
+                # document as when the whole tree is converted.  Each
+                # element is detached while it's written so that it
+                # doesn't declare the root's namespace again.
+                holder = ET.Element('svg')
+                for index, child in enumerate(list(self.root)):
+                    versions = {False: child}
+                    if svg11:
+                        if svg2:
+                            child11 = copy.deepcopy(child)
+                            holder.append(child11)
+                        else:
+                            child11 = child
+                        self.svg11_conversion(child11)
+                        if svg2:
+                            holder.remove(child11)
+                        versions[True] = child11
+                    self.root.remove(child)
+                    if pretty:
+                        for version in versions.values():
+                            ET.indent(version, space='  ', level=1)
+                    try:
+                        for xf, is_svg11 in writers:
+                            if pretty:
+                                xf.write('\n  ')
+                            xf.write(versions[is_svg11])
+                    finally:
+                        self.root.insert(index, child)
+                if pretty:
+                    for xf, _ in writers:
+                        xf.write('\n')
+            # pretty printing ends the file with a newline
+            if pretty:
+                for stream in streams:
+                    stream.write(b'\n')
+
     # If we only want a string, we assemble the XML tree
     # consisting of the SVG and annotations and return as a string
     def end_figure_to_string(self):
         root = self.root
+        if compact.enabled:
+            compact.compact_svg(root)
         if self.output_format() == 'svg11':
             root = self.svg11_conversion(root)
         svg_string = ET.tostring(root).decode('utf-8')
@@ -580,6 +674,8 @@ class Diagram:
             diagram = ET.Element("diagram")
             diagram.append(self.annotations_root)
             annotation_string = ET.tostring(diagram).decode('utf-8')
+        metrics.string_written('svg', svg_string)
+        metrics.string_written('annotations', annotation_string)
         return svg_string, annotation_string
 
     # Here we parse the children of the given XML element
@@ -591,35 +687,22 @@ class Diagram:
             root = self.root
         # strip out the namespace prefix
         element.tag = ET.QName(element).localname
-        # We allow an element's attributes to be rewritten depending on
-        # the format.  For instance, tactile diagrams sometimes require
-        # modified attributes
-        prefix = self.format + '-'
+        # with parallel builds, the expensive work of some children
+        # may begin in other processes before the children are reached
+        batch = parallel.dispatch(self, element)
+        try:
+            self.parse_children(element, root, outline_group, batch)
+        finally:
+            if batch is not None:
+                batch.finish()
+
+    def parse_children(self, element, root, outline_group, batch):
         for child in element:
             if child.tag is ET.Comment:
                 continue
-            child.tag = ET.QName(child).localname
-            if child.get('at') is not None:
-                child.set('id', child.get('at'))
-
-            child_id = child.get('id', None)
-            if child_id is not None:
-                if not bool(epub_id_check.fullmatch(child_id)):
-                    log.error(f"The id {child_id} has characters disallowed by EPUB")
-                    log.error("  We will substitute disallowed characters to make the id EPUB compliant")
-                    log.error("  Search for EPUB in the PreFigure documentation at https://prefigure.org")
-                    child.set('id', repeat.epub_clean(child_id))
-
-            # see if the publication flie has any defaults
-            defaults = self.defaults.get(child.tag, None)
-            if defaults is not None:
-                for attr, value in defaults.attrib.items():
-                    if child.get(attr, None) is None:
-                        child.set(attr, value)
-            # replace any format-specific attributes
-            for attr, value in child.items():
-                if attr.startswith(prefix):
-                    child.set(attr[len(prefix):], value)
+            self.prepare_element(child)
+            if batch is not None:
+                batch.install(child, self)
             try:
                 tags.parse_element(child, self, root, outline_group)
             except Exception as e:
@@ -644,6 +727,34 @@ class Diagram:
                                        label.evaluate_text(annotation.get('speech')))
                     self.add_annotation_to_branch(annotation)
 
+    # Prepare an element's attributes just before it is processed
+    def prepare_element(self, child):
+        child.tag = ET.QName(child).localname
+        if child.get('at') is not None:
+            child.set('id', child.get('at'))
+
+        child_id = child.get('id', None)
+        if child_id is not None:
+            if not bool(epub_id_check.fullmatch(child_id)):
+                log.error(f"The id {child_id} has characters disallowed by EPUB")
+                log.error("  We will substitute disallowed characters to make the id EPUB compliant")
+                log.error("  Search for EPUB in the PreFigure documentation at https://prefigure.org")
+                child.set('id', repeat.epub_clean(child_id))
+
+        # see if the publication flie has any defaults
+        defaults = self.defaults.get(child.tag, None)
+        if defaults is not None:
+            for attr, value in defaults.attrib.items():
+                if child.get(attr, None) is None:
+                    child.set(attr, value)
+        # We allow an element's attributes to be rewritten depending on
+        # the format.  For instance, tactile diagrams sometimes require
+        # modified attributes
+        prefix = self.format + '-'
+        for attr, value in child.items():
+            if attr.startswith(prefix):
+                child.set(attr[len(prefix):], value)
+
     def ctm(self):
         return self.ctm_stack[-1][0]
 
@@ -668,6 +779,23 @@ class Diagram:
         self.defs.append(element)
         self.reusables[element.get('id')] = element
 
+    # MathJax gives every label its own <defs> of glyph paths.  We keep
+    # a single copy of each distinct glyph in the diagram's <defs> and
+    # return the id that the label's <use> elements should refer to.
+    def add_glyph(self, glyph):
+        key = (glyph.tag, tuple(sorted((name, value)
+                                       for name, value in glyph.attrib.items()
+                                       if name != 'id')))
+        id = self.glyphs.get(key, None)
+        metrics.cache_lookup('glyphs', id is not None)
+        if id is not None:
+            return id
+        id = self.prepend_id_prefix(glyph.get('id'))
+        glyph.set('id', id)
+        self.defs.append(glyph)
+        self.glyphs[key] = id
+        return id
+
     def has_reusable(self, reusable):
         return self.reusables.get(reusable, None) is not None
     
@@ -1,11 +1,15 @@
 import numpy as np
 import lxml.etree as ET
+import multiprocessing
 import sys
 import logging
 import scipy.integrate
 from . import user_namespace as un
 from . import utilities as util
 from . import arrow
+from . import impulses
+from . import metrics
+from . import parallel
 
 log = logging.getLogger('prefigure')
 
@@ -22,14 +26,22 @@ def de_solve(element, diagram, parent, outline_group):
     except:
         log.error(f"Error in ODE solver:  cannot retrieve t0={element.get('t0')}")
         return
-    try:
-        y0 = un.valid_eval(element.get('y0'))
-    except:
-        log.error(f"Error in ODE solver:  cannot retrieve y0={element.get('y0')}")
-        return
 
-    if not isinstance(y0, np.ndarray):
-        y0 = np.array([y0])
+    # a list of initial conditions gives a bundle of solutions
+    initial_conditions = element.get('initial-conditions', None)
+    y0 = None
+    if initial_conditions is not None:
+        try:
+            initial_conditions = un.valid_eval(initial_conditions)
+        except:
+            log.error(f"Error in ODE solver:  cannot retrieve initial-conditions={element.get('initial-conditions')}")
+            return
+    else:
+        try:
+            y0 = un.valid_eval(element.get('y0'))
+        except:
+            log.error(f"Error in ODE solver:  cannot retrieve y0={element.get('y0')}")
+            return
 
     t1 = diagram.bbox()[2]
     t1 = un.valid_eval(element.get('t1', str(t1)))
@@ -40,104 +52,247 @@ def de_solve(element, diagram, parent, outline_group):
     if element.get('max-step', None) is not None:
         max_step = un.valid_eval(element.get('max-step'))
 
+    if initial_conditions is None:
+        if not isinstance(y0, np.ndarray):
+            y0 = np.array([y0])
+        # the same problem is only solved once in a build
+        key = (f, t0, t1, tuple(np.ravel(y0)), method, max_step)
+        dense = diagram.de_solutions.get(key)
+        metrics.cache_lookup('de-solutions', dense is not None)
+        if dense is None:
+            dense = diagram.get_source_data(element, 'prefetched')
+            if dense is None:
+                dense = solve(f, t0, y0, t1, method, max_step)
+            diagram.de_solutions[key] = dense
+        solution = dense.sample(N)
+    else:
+        dense = None
+        solution = solve_sweep(f, t0, initial_conditions, t1, N,
+                               method, max_step)
+        if solution is None:
+            return
+
+    name = element.get('name', None)
+    if name is None:
+        log.error(f"Error in ODE solver setting name={element.get('name')}")
+        return
+    un.enter_namespace(name, solution)
+    if dense is not None:
+        diagram.named_de_solutions[name] = (solution, dense)
+
+# Solving the equation is the expensive part of <de-solve> and
+# <plot-de-solution> and may be done in another process in a parallel
+# build.  A bundle of solutions uses its own pool of processes.
+def find_solution(element, diagram):
+    if element.get('function') is None:
+        return None
+    if element.get('initial-conditions') is not None:
+        return None
+    known = set(diagram.de_solutions.keys())
+    de_solve(element, diagram, ET.Element('group'), None)
+    for key, dense in diagram.de_solutions.items():
+        if key not in known:
+            return dense
+    return None
+
+# A solution is kept as the continuous solution returned by solve_ivp on
+# each interval between the discontinuities introduced by delta
+# functions.  We sample it at N points on each interval to give an
+# array whose first row holds the values of t and whose remaining rows
+# hold the components of y, but a plot can choose its own points.
+class DenseSolution:
+    def __init__(self):
+        self.segments = []
+
+    def add_segment(self, t0, t1, sol):
+        self.segments.append((t0, t1, sol))
+
+    def sample(self, N):
+        return self.evaluate([np.linspace(t0, t1, N)
+                              for t0, t1, sol in self.segments])
+
+    # evaluate at the values of t given for each segment
+    def evaluate(self, t_values):
+        t = np.hstack(t_values)
+        y = np.hstack([sol(values) for values, (t0, t1, sol)
+                       in zip(t_values, self.segments)])
+        return np.vstack((t, y))
+
+# Solve the initial value problem y' = f(t, y), y(t0) = y0
+def solve(f, t0, y0, t1, method, max_step, vectorized=False):
+    options = {'method': method, 'vectorized': vectorized}
+    if max_step is not None:
+        options['max_step'] = max_step
+
     # in case f contains delta functions, we will determine where those occur
-    breaks = un.find_breaks(f, t0, y0)
-    if len(breaks) > 0:
-        _breaks = []
-        for b in breaks:
-            if b >= t0 and b < t1:
-                _breaks.append(b)
-        breaks = _breaks
-    breaks.sort()
-    breaks.append(t1)
-
-    solution_t = None
-    solution_y = None
-
-    if len(breaks) > 0:
-        if np.isclose(t0, breaks[0]):
-            y0 = y0 + un.measure_de_jump(f, t0, y0)
-            breaks.pop(0)
+    schedule = impulses.ImpulseSchedule(f, t0, y0, t1)
+    breaks = schedule.times + [t1]
+
+    dense = DenseSolution()
+
+    if np.isclose(t0, breaks[0]) and len(breaks) > 1:
+        y0 = y0 + schedule.jump(t0, y0)
+        breaks.pop(0)
 
+    # each interval begins with the last step size of the one before
+    first_step = None
     while len(breaks) > 0:
         next_t = breaks.pop(0)
-        t = np.linspace(t0, next_t, N)
-
-        if max_step is not None:
-            solution = scipy.integrate.solve_ivp(f,
-                                                 (t0, next_t),
-                                                 y0,
-                                                 t_eval=t,
-                                                 max_step=max_step,
-                                                 method=method)
-        else:
-            solution = scipy.integrate.solve_ivp(f,
-                                                 (t0, next_t),
-                                                 y0,
-                                                 t_eval=t,
-                                                 method=method)
+        if first_step is not None:
+            options['first_step'] = min(first_step, abs(next_t - t0))
+        solution = scipy.integrate.solve_ivp(f,
+                                             (t0, next_t),
+                                             y0,
+                                             dense_output=True,
+                                             **options)
+        dense.add_segment(t0, next_t, solution.sol)
+        if len(solution.t) > 1:
+            first_step = abs(solution.t[-1] - solution.t[-2])
         t0 = next_t
         y0 = solution.y.T[-1]
-        y0 = y0 + un.measure_de_jump(f, t0, y0)
-        if solution_t is None:
-            solution_t = solution.t
-            solution_y = solution.y
-        else:
-            solution_t = np.hstack((solution_t, solution.t))
-            solution_y = np.hstack((solution_y, solution.y))
-        
-    solution = np.stack((solution_t, *solution_y))
+        if len(breaks) > 0:
+            y0 = y0 + schedule.jump(t0, y0)
 
-    name = element.get('name', None)
-    if name is None:
-        log.error(f"Error in ODE solver setting name={element.get('name')}")
-        return
-    un.enter_namespace(name, solution)
+    return dense
+
+# A phase portrait solves the same equation for many initial
+# conditions.  If f can be evaluated on every initial condition at once,
+# we integrate the trajectories together as one stacked system, which
+# replaces a call to solve_ivp for each trajectory with a single call.
+# Otherwise, the trajectories are integrated separately, in a pool of
+# processes in a parallel build with enough of them.  Either way, the result is a
+# bundle of solutions so that bundle[k] looks like the solution
+# from the k-th initial condition.
+
+# the smallest number of trajectories worth starting a process pool for
+pool_threshold = 8
+
+def solve_sweep(f, t0, initial_conditions, t1, N, method, max_step):
+    y0s = np.array(initial_conditions, dtype=float)
+    if y0s.ndim == 1:
+        y0s = y0s.reshape(-1, 1)
+    if y0s.ndim != 2 or len(y0s) == 0:
+        log.error("Error in ODE solver:  @initial-conditions should be a list of initial conditions")
+        return None
+    K, n = y0s.shape
+
+    if vectorizes(f, t0, y0s):
+        F = stacked_function(f, n, K)
+        solution = solve(F, t0, y0s.T.reshape(-1), t1, method, max_step,
+                         vectorized=True).sample(N)
+        t = solution[0]
+        y = solution[1:].reshape(n, K, -1).transpose(1, 0, 2)
+        return np.concatenate((np.broadcast_to(t, (K, 1, len(t))), y), axis=1)
+
+    solutions = solve_each(f, t0, y0s, t1, N, method, max_step)
+    if len(set(solution.shape for solution in solutions)) > 1:
+        log.error("Error in ODE solver:  the solutions from @initial-conditions have different lengths")
+        return None
+    return np.stack(solutions)
+
+# Each component of y is a row holding that component for every
+# trajectory so that an expression like y[1] evaluates on all the
+# trajectories at once.  solve_ivp may add one more axis when it
+# evaluates f on several states.
+def stacked_function(f, n, K):
+    def F(t, Y):
+        columns = Y.shape[1:]
+        values = f(t, Y.reshape((n, K) + columns))
+        if n == 1 and np.shape(values) == (K,) + columns:
+            values = [values]
+        if len(values) != n:
+            raise ValueError('The function does not have the dimension of the initial conditions')
+        result = np.empty((n, K) + columns)
+        for component, value in enumerate(values):
+            result[component] = value
+        return result.reshape(Y.shape)
+    return F
+
+# f vectorizes if the stacked function agrees with f on each of the
+# initial conditions
+def vectorizes(f, t0, y0s):
+    K, n = y0s.shape
+    try:
+        with np.errstate(all='ignore'):
+            values = stacked_function(f, n, K)(t0, y0s.T.reshape(-1))
+            values = values.reshape(n, K)
+            for k, y0 in enumerate(y0s):
+                if not np.allclose(values[:, k], f(t0, y0), equal_nan=True):
+                    return False
+    except Exception:
+        return False
+    return True
+
+# With prefig build --parallel, a sweep with enough trajectories is
+# integrated in a pool of processes.  Author-defined functions can't be
+# pickled so the worker processes are forked and find the problem
+# here.  Otherwise, including inside a worker of a parallel build or
+# where processes can't be forked, the trajectories are integrated one
+# after another.
+sweep = None
+
+def solve_each(f, t0, y0s, t1, N, method, max_step):
+    global sweep
+    sweep = (f, t0, y0s, t1, N, method, max_step)
+    try:
+        processes = min(parallel.workers or 1, len(y0s))
+        if (
+                len(y0s) >= pool_threshold and processes > 1 and
+                not multiprocessing.current_process().daemon and
+                'fork' in multiprocessing.get_all_start_methods()
+        ):
+            try:
+                context = multiprocessing.get_context('fork')
+                with context.Pool(processes) as pool:
+                    return pool.map(solve_trajectory, range(len(y0s)))
+            except OSError as e:
+                log.debug(f"Unable to start a process pool for the ODE solver: {e}")
+        return [solve_trajectory(k) for k in range(len(y0s))]
+    finally:
+        sweep = None
+
+def solve_trajectory(k):
+    f, t0, y0s, t1, N, method, max_step = sweep
+    return solve(f, t0, y0s[k], t1, method, max_step).sample(N)
 
 def plot_de_solution(element, diagram, parent, outline_group):
     if element.get('function') is not None:
         element.set('name', '__de_solution')
         de_solve(element, diagram, parent, None)
+        solution_name = '__de_solution'
         solution = un.valid_eval('__de_solution')
     else:
+        solution_name = element.get('solution', '').strip()
         try:
             solution = un.valid_eval(element.get('solution'))
         except:
             log.error(f"Error in <plot-de-solution> finding solution={element.get('solution')}")
             return
 
-    # The author can specify which quantities to plot through the axes attribute
-    # We'll just treat this as a string and break out the quantities on
-    # the x and y axes.  By default, the axes are t and y, which would be apppropriate
-    # for a single ODE.  For a system, phase portraits can be constructed using
-    # axes='(y0, y1)', for instance, as the axes
-
-    try:
-        axes = element.get('axes', '(t,y)'). strip()[1: -1].split(',')
-        x_axis, y_axis = [a.strip() for a in axes]
-    except:
-        log.error(f"Error in <plot-de-solution> setting axes={element.get('axes')}")
+    axes = solution_axes(element)
+    if axes is None:
         return
 
-    if x_axis.startswith('y'):
-        axis0 = solution[int(x_axis[1:])+1]
-    else:
-        axis0 = solution[0]
-
-    if y_axis == 'y':
-        axis1 = solution[1]
-    else:
-        axis1 = solution[int(y_axis[1:])+1]
-
-    curve = zip(axis0, axis1)
-    p = diagram.transform(next(curve))
-    cmds = ['M ' + util.pt2str(p)]
-    while True:
+    # with resample="yes", a solution found by <de-solve> is resampled
+    # for the plot
+    named = diagram.named_de_solutions.get(solution_name)
+    if (
+            element.get('resample', 'no') == 'yes' and
+            named is not None and named[0] is solution
+    ):
         try:
-            p = diagram.transform(next(curve))
-            cmds.append('L ' + util.pt2str(p))
-        except StopIteration:
-            break
+            tolerance = float(un.valid_eval(
+                element.get('tolerance', str(default_tolerance))
+            ))
+        except:
+            log.error(f"Error in <plot-de-solution> defining tolerance={element.get('tolerance')}")
+            return
+        if tolerance <= 0:
+            log.error(f"@tolerance in <plot-de-solution> should be positive")
+            return
+        solution = resample(diagram, named[1], axes, tolerance)
+    axis0, axis1 = axis_data(solution, *axes)
+    cmds = curve_commands(diagram, axis0, axis1)
 
     if diagram.output_format() == 'tactile':
         element.set('stroke', 'black')
@@ -198,6 +353,132 @@ def plot_de_solution(element, diagram, parent, outline_group):
     else:
         parent.append(path)
 
+# The author can specify which quantities to plot through the axes attribute
+# We'll just treat this as a string and break out the quantities on
+# the x and y axes.  By default, the axes are t and y, which would be apppropriate
+# for a single ODE.  For a system, phase portraits can be constructed using
+# axes='(y0, y1)', for instance, as the axes
+def solution_axes(element):
+    try:
+        axes = element.get('axes', '(t,y)'). strip()[1: -1].split(',')
+        x_axis, y_axis = [a.strip() for a in axes]
+    except:
+        log.error(f"Error in <{element.tag}> setting axes={element.get('axes')}")
+        return None
+    return x_axis, y_axis
+
+def axis_data(solution, x_axis, y_axis):
+    if x_axis.startswith('y'):
+        axis0 = solution[int(x_axis[1:])+1]
+    else:
+        axis0 = solution[0]
+
+    if y_axis == 'y':
+        axis1 = solution[1]
+    else:
+        axis1 = solution[int(y_axis[1:])+1]
+    return axis0, axis1
+
+def curve_commands(diagram, axis0, axis1):
+    points = diagram.transform_points(np.column_stack((axis0, axis1)))
+    cmds = ['M ' + util.pt2str(points[0])]
+    cmds += ['L ' + util.pt2str(p) for p in points[1:]]
+    return cmds
+
+# With resample="yes", rather than plotting the N points of the
+# solution, we begin with the steps taken by the solver on each segment
+# and bisect any interval whose midpoint, in SVG coordinates, lies
+# farther than @tolerance, in pixels, from the midpoint of the chord
+# joining its ends.  Fast-varying parts of a solution then receive more
+# points and smooth parts fewer.
+default_tolerance = 0.25
+max_refinements = 12
+
+def resample(diagram, dense, axes, tolerance=default_tolerance):
+    t_values = []
+    y_values = []
+    for t0, t1, sol in dense.segments:
+        t = np.unique(np.clip(np.append(sol.ts, [t0, t1]),
+                              min(t0, t1), max(t0, t1)))
+        if t1 < t0:
+            t = t[::-1]
+        y = sol(t)
+        points = plot_points(diagram, t, y, axes)
+
+        # only the intervals created by the last bisection are checked again
+        check = np.arange(len(t) - 1)
+        for _ in range(max_refinements):
+            midpoints = (t[check] + t[check+1]) / 2
+            mid_y = sol(midpoints)
+            mid_points = plot_points(diagram, midpoints, mid_y, axes)
+            chords = (points[check] + points[check+1]) / 2
+            refine = np.linalg.norm(mid_points - chords, axis=1) > tolerance
+            if not refine.any():
+                break
+            refined = check[refine]
+            t = np.insert(t, refined + 1, midpoints[refine])
+            y = np.insert(y, refined + 1, mid_y[:, refine], axis=1)
+            points = np.insert(points, refined + 1, mid_points[refine], axis=0)
+            starts = refined + np.arange(len(refined))
+            check = np.column_stack((starts, starts + 1)).ravel()
+        t_values.append(t)
+        y_values.append(y)
+    return np.vstack((np.hstack(t_values), np.hstack(y_values)))
+
+def plot_points(diagram, t, y, axes):
+    axis0, axis1 = axis_data(np.vstack((t, y)), *axes)
+    return diagram.transform_points(np.column_stack((axis0, axis1)))
+
+# Plot every trajectory in a bundle of solutions, such as one created
+# by <de-solve> with @initial-conditions, as a single path
+def plot_de_solutions(element, diagram, parent, outline_group):
+    if element.get('function') is not None:
+        element.set('name', '__de_solutions')
+        de_solve(element, diagram, parent, None)
+        try:
+            solutions = un.valid_eval('__de_solutions')
+        except:
+            return
+    else:
+        try:
+            solutions = un.valid_eval(element.get('solutions'))
+        except:
+            log.error(f"Error in <plot-de-solutions> finding solutions={element.get('solutions')}")
+            return
+
+    axes = solution_axes(element)
+    if axes is None:
+        return
+    cmds = []
+    for solution in solutions:
+        cmds += curve_commands(diagram, *axis_data(solution, *axes))
+
+    if diagram.output_format() == 'tactile':
+        element.set('stroke', 'black')
+    else:
+        util.set_attr(element, 'stroke', 'blue')
+        util.set_attr(element, 'fill', 'none')
+    util.set_attr(element, 'thickness', '2')
+
+    path = ET.Element('path')
+    diagram.add_id(path, element.get('id'))
+    diagram.register_svg_element(element, path)
+    util.add_attr(path, util.get_2d_attr(element))
+    path.set('d', ' '.join(cmds))
+
+    element.set('cliptobbox', element.get('cliptobbox', 'yes'))
+    util.cliptobbox(path, element, diagram)
+
+    if outline_group is not None:
+        diagram.add_outline(element, path, outline_group)
+        finish_outline(element, diagram, parent)
+    elif (element.get('outline', 'no') == 'yes'
+            or diagram.output_format() == 'tactile'):
+        diagram.add_outline(element, path, parent)
+        finish_outline(element, diagram, parent)
+    else:
+        parent.append(path)
+
 def finish_outline(element, diagram, parent):
     diagram.finish_outline(element,
                            element.get('stroke'),
@@ -0,0 +1,130 @@
+# Font metrics used to measure plain text labels when pycairo is not
+# available.  The advance widths are those of the standard PostScript
+# fonts (Times for serif, Helvetica for sans-serif and Courier for
+# monospace) for the printable ASCII characters, in units of 1/1000 em.
+# Oblique and italic faces share the widths of their upright faces except
+# for Times Italic, which has its own.
+#
+# Rather than a full bounding box for every glyph, each character is
+# assigned a top and a bottom from a few vertical classes (x-height,
+# cap height, ascender, descender, ...) which is enough to position a
+# label's rows.
+
+printable = ''.join(chr(c) for c in range(32, 127))
+
+def width_table(widths):
+    widths = [int(w) for w in widths.split()]
+    return dict(zip(printable, widths))
+
+widths = {
+    ('sans-serif', False): width_table("""
+        278 278 355 556 556 889 667 191 333 333 389 584 278 333 278 278
+        556 556 556 556 556 556 556 556 556 556 278 278 584 584 584 556
+        1015 667 667 722 722 667 611 778 722 278 500 667 556 833 722 778
+        667 778 722 667 611 722 667 944 667 667 611 278 278 278 469 556
+        333 556 556 500 556 556 278 556 556 222 222 500 222 833 556 556
+        556 556 333 500 278 556 500 722 500 500 500 334 260 334 584"""),
+    ('sans-serif', True): width_table("""
+        278 333 474 556 556 889 722 238 333 333 389 584 278 333 278 278
+        556 556 556 556 556 556 556 556 556 556 333 333 584 584 584 611
+        975 722 722 722 722 667 611 778 722 278 556 722 611 833 722 778
+        667 778 722 667 611 722 667 944 667 667 611 333 278 333 584 556
+        333 556 611 556 611 556 333 611 611 278 278 556 278 889 611 611
+        611 611 389 556 333 611 556 778 556 556 500 389 280 389 584"""),
+    ('serif', False): width_table("""
+        250 333 408 500 500 833 778 180 333 333 500 564 250 333 250 278
+        500 500 500 500 500 500 500 500 500 500 278 278 564 564 564 444
+        921 722 667 667 722 611 556 722 722 333 389 722 611 889 722 722
+        556 722 667 556 611 722 722 944 722 722 611 333 278 333 469 500
+        333 444 500 444 500 444 333 500 500 278 278 500 278 778 500 500
+        500 500 333 389 278 500 500 722 500 500 444 480 200 480 541"""),
+    ('serif', True): width_table("""
+        250 333 555 500 500 1000 833 278 333 333 500 570 250 333 250 278
+        500 500 500 500 500 500 500 500 500 500 333 333 570 570 570 500
+        930 722 667 722 722 667 611 778 778 389 500 778 667 944 722 778
+        611 778 722 556 667 722 722 1000 722 722 667 333 278 333 581 500
+        333 500 556 444 556 444 333 500 556 278 333 556 278 833 556 500
+        556 556 444 389 333 556 500 722 500 500 444 394 220 394 520"""),
+    ('monospace', False): dict.fromkeys(printable, 600),
+    ('monospace', True): dict.fromkeys(printable, 600),
+}
+
+italic_widths = {
+    ('serif', False): width_table("""
+        250 333 420 500 500 833 778 214 333 333 500 675 250 333 250 278
+        500 500 500 500 500 500 500 500 500 500 333 333 675 675 675 500
+        920 611 611 667 722 611 611 722 722 333 444 667 556 833 667 722
+        611 722 611 500 556 722 611 833 611 556 556 389 278 389 422 500
+        333 500 500 444 500 444 278 500 500 278 278 444 278 722 500 500
+        500 500 389 389 278 500 444 667 444 444 389 400 275 400 541"""),
+    ('serif', True): width_table("""
+        250 389 555 500 500 833 778 278 333 333 500 570 250 333 250 278
+        500 500 500 500 500 500 500 500 500 500 333 333 570 570 570 500
+        832 667 667 667 722 667 667 722 778 389 500 667 611 889 722 722
+        611 722 667 556 611 722 667 889 667 611 611 333 278 333 570 500
+        333 500 500 444 500 444 333 500 556 278 278 500 278 778 556 500
+        500 500 389 389 278 556 444 667 500 444 389 348 220 348 570"""),
+}
+
+# height of the x-height, capitals, ascenders and the depth of descenders
+vertical_metrics = {
+    'sans-serif': {'x-height': 523, 'cap-height': 718,
+                   'ascender': 718, 'descender': 207},
+    'serif': {'x-height': 450, 'cap-height': 662,
+              'ascender': 683, 'descender': 217},
+    'monospace': {'x-height': 426, 'cap-height': 562,
+                  'ascender': 629, 'descender': 157},
+}
+
+# characters whose top is not the cap height and whose bottom is
+# not the baseline
+x_height_chars = set('acemnorsuvwxz')
+ascender_chars = set('bdfhiklt!?/\\|()[]{}$%&@#\'"`')
+descender_chars = set('gjpqy()[]{}|$@;_/\\Q')
+small_chars = {'.': 0.25, ',': 0.25, ';': 1, ':': 1, '-': 0.5,
+               '_': 0, '~': 0.55, '=': 0.6, '+': 1.05, '*': 1.05,
+               '^': 1.05, '<': 1.05, '>': 1.05, ' ': 0}
+
+def glyph_width(char, family, italics, bold):
+    table = widths[(family, bold)]
+    if italics:
+        table = italic_widths.get((family, bold), table)
+    width = table.get(char, None)
+    if width is None:
+        # characters beyond ASCII get the width of a digit
+        width = table['0']
+    return width
+
+def glyph_extent(char, family):
+    metrics = vertical_metrics[family]
+    if char in small_chars:
+        top = small_chars[char] * metrics['x-height']
+    elif char in x_height_chars:
+        top = metrics['x-height']
+    elif char in ascender_chars:
+        top = metrics['ascender']
+    else:
+        top = metrics['cap-height']
+    if char in descender_chars:
+        bottom = metrics['descender']
+    elif char == ',':
+        bottom = 0.3 * metrics['descender']
+    else:
+        bottom = 0
+    return top, bottom
+
+# returns [advance, height above baseline, depth below baseline] in the
+# same form as the cairo measurements
+def measure(text, family, font_size, italics, bold):
+    if family not in vertical_metrics:
+        family = 'sans-serif'
+    scale = font_size / 1000
+    advance = 0
+    above = 0
+    below = 0
+    for char in text:
+        advance += glyph_width(char, family, italics, bold)
+        top, bottom = glyph_extent(char, family)
+        above = max(above, top)
+        below = max(below, bottom)
+    return [advance * scale, above * scale, below * scale]
@@ -2,14 +2,62 @@ import lxml.etree as ET
 import logging
 import numpy as np
 import base64
+import copy
+import os
 import lxml.etree as ET
 from . import user_namespace as un
 from . import group
 from . import utilities as util
 from . import CTM
+from . import metrics
 
 log = logging.getLogger('prefigure')
 
+# Images used in many diagrams, such as a logo, are only read once per
+# process.  We keep the base64 encoded data of raster images and the
+# parsed trees of SVG images keyed by the path, modification time and
+# size of the file so that a changed file is read again.
+encoded_images = {}
+svg_images = {}
+
+def file_key(source):
+    stat = os.stat(source)
+    return (os.path.abspath(source), stat.st_mtime_ns, stat.st_size)
+
+def encoded_image(source):
+    key = file_key(source)
+    encoded_string = encoded_images.get(key)
+    metrics.cache_lookup('images', encoded_string is not None)
+    if encoded_string is None:
+        with open(source, "rb") as image_file:
+            encoded_string = base64.b64encode(image_file.read())
+            encoded_string = encoded_string.decode('utf-8')
+        encoded_images[key] = encoded_string
+    return encoded_string
+
+# returns a copy of the root of an SVG image since it will be modified
+# and placed in the diagram
+def svg_image(source):
+    key = file_key(source)
+    svg_root = svg_images.get(key)
+    metrics.cache_lookup('images', svg_root is not None)
+    if svg_root is None:
+        svg_root = ET.parse(source).getroot()
+        svg_images[key] = svg_root
+    return copy.deepcopy(svg_root)
+
+# With embed="no", the image is referenced by its path relative to the
+# output directory, where the SVG is written, rather than included in
+# the diagram.  Inside PreTeXt, the source has already been given as
+# data/..., where PreTeXt places the external files relative to the
+# pages that include the diagram, so it is used as it is.
+def linked_source(source, diagram):
+    if diagram.get_environment() == 'pretext':
+        return source
+    output_dir = os.path.join(os.path.dirname(os.path.abspath(diagram.filename)),
+                              'output')
+    return os.path.relpath(os.path.abspath(source), output_dir).replace(os.sep, '/')
+
 type_dict = {'jpg':'jpeg',
              'jpeg':'jpeg',
              'png':'png',
@@ -74,9 +122,13 @@ def image(element, diagram, parent, outline_group):
     opacity = element.get('opacity', None)
     if opacity is not None:
         opacity = un.valid_eval(opacity)
-    if file_type == 'svg':
-        svg_tree = ET.parse(source)
-        svg_root = svg_tree.getroot()
+    embed = element.get('embed', 'yes') == 'yes'
+    if file_type == 'svg' and embed:
+        try:
+            svg_root = svg_image(source)
+        except (OSError, ET.XMLSyntaxError):
+            log.error(f"Unable to read the image in {source}")
+            return
         svg_width = svg_root.get('width', None)
         svg_height = svg_root.get('height', None)
 
@@ -96,6 +148,16 @@ def image(element, diagram, parent, outline_group):
             object.set('opacity', util.float2str(opacity))
         return
 
+    if embed:
+        try:
+            encoded_string = encoded_image(source)
+        except OSError:
+            log.error(f"Unable to read the image in {source}")
+            return
+        ref = f"data:image/{file_type};base64,{encoded_string}"
+    else:
+        ref = linked_source(source, diagram)
+
     image_el = ET.SubElement(parent, 'image')
     diagram.register_svg_element(element, image_el)
     image_el.set('x', util.float2str(-width/2))
@@ -105,11 +167,6 @@ def image(element, diagram, parent, outline_group):
     if opacity is not None:
         image_el.set('opacity', util.float2str(opacity))
     diagram.add_id(image_el, element.get('id'))
-
-    with open(source, "rb") as image_file:
-        encoded_string = base64.b64encode(image_file.read())
-        encoded_string = encoded_string.decode('utf-8')
-    ref = f"data:image/{file_type};base64,{encoded_string}"
     image_el.set('href', ref)
 
     transform_pieces = [CTM.translatestr(*center_svg)]
@@ -10,7 +10,51 @@ log = logging.getLogger('prefigure')
 
 # add an implicit curve to a diagram
 def implicit_curve(element, diagram, parent, outline_group):
-    ImplicitCurve(element, diagram, parent, outline_group)
+    if diagram.output_format() == 'tactile':
+        element.set('stroke', 'black')
+    else:
+        util.set_attr(element, 'stroke', 'black')
+    util.set_attr(element, 'thickness', '2')
+
+    curve = ImplicitCurve(element, diagram)
+    if not curve.valid:
+        return
+
+    segments = diagram.get_source_data(element, 'prefetched')
+    if segments is None:
+        segments = curve.getpoints()
+    cmds = []
+    for s in segments:
+        s0 = diagram.transform(s[0][:2])
+        s1 = diagram.transform(s[1][:2])
+        cmds.append('M ' + util.pt2str(s0))
+        cmds.append('L ' + util.pt2str(s1))
+    d = ' '.join(cmds)
+
+    path = ET.Element('path')
+    diagram.add_id(path, element.get('id'))
+    diagram.register_svg_element(element, path)
+    path.set('d', d)
+
+    util.add_attr(path, util.get_1d_attr(element))
+
+    if outline_group is not None:
+        diagram.add_outline(element, path, outline_group)
+        finish_outline(element, diagram, parent)
+    elif (element.get('outline', 'no') == 'yes'
+            or diagram.output_format() == 'tactile'):
+        diagram.add_outline(element, path, parent)
+        finish_outline(element, diagram, parent)
+    else:
+        parent.append(path)
+
+# finding the segments is the expensive part of an implicit curve and
+# may be done in another process in a parallel build
+def find_segments(element, diagram):
+    curve = ImplicitCurve(element, diagram)
+    if not curve.valid:
+        return None
+    return curve.getpoints()
 
 class QuadTree():
     def __init__(self, b, d):
@@ -94,13 +138,8 @@ class LevelSet():
         return self.f(p[0], p[1]) - self.k
 
 class ImplicitCurve():
-    def __init__(self, element, diagram, parent, outline_group):
-        if diagram.output_format() == 'tactile':
-            element.set('stroke', 'black')
-        else:
-            util.set_attr(element, 'stroke', 'black')
-        util.set_attr(element, 'thickness', '2')
-
+    def __init__(self, element, diagram):
+        self.valid = False
         self.bbox = diagram.bbox()
         try:
             f = un.valid_eval(element.get('function'))
@@ -120,32 +159,7 @@ class ImplicitCurve():
             return
         self.levelset = LevelSet(f, k)
         self.k = k
-
-        segments = self.getpoints()
-        cmds = []
-        for s in segments:
-            s0 = diagram.transform(s[0][:2])
-            s1 = diagram.transform(s[1][:2])
-            cmds.append('M ' + util.pt2str(s0))
-            cmds.append('L ' + util.pt2str(s1))
-        d = ' '.join(cmds)
-
-        path = ET.Element('path')
-        diagram.add_id(path, element.get('id'))
-        diagram.register_svg_element(element, path)
-        path.set('d', d)
-
-        util.add_attr(path, util.get_1d_attr(element))
-
-        if outline_group is not None:
-            diagram.add_outline(element, path, outline_group)
-            finish_outline(element, diagram, parent)
-        elif (element.get('outline', 'no') == 'yes'
-                or diagram.output_format() == 'tactile'):
-            diagram.add_outline(element, path, parent)
-            finish_outline(element, diagram, parent)
-        else:
-            parent.append(path)
+        self.valid = True
 
     def getpoints(self):
         root = QuadTree([ [self.bbox[0], self.bbox[1]],
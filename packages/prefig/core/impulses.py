@@ -0,0 +1,68 @@
+import contextlib
+import contextvars
+import numpy as np
+
+# Authors include impulses in a differential equation using delta(t, a)
+# in the right-hand side.  Before an ODE is solved, we evaluate the
+# right-hand side once to find when the impulses occur and then solve
+# on each interval between them, applying the jump produced by the
+# impulses at the end of each interval.
+#
+# The state that delta consults belongs to the solve that is using it
+# and is found through a context variable so that solves running
+# concurrently, in different threads for instance, don't see one
+# another's impulses.
+
+current = contextvars.ContextVar('impulses', default=None)
+
+class ImpulseState:
+    def __init__(self):
+        # when this is a list, delta records the times of the impulses
+        self.times = None
+        # the value of an impulse while a jump is being measured
+        self.weight = 0
+
+    def delta(self, t, a):
+        if self.times is not None:
+            self.times.append(a)
+            return 0
+        if self.weight != 0 and np.isclose(t, a):
+            return self.weight
+        return 0
+
+class ImpulseSchedule:
+    def __init__(self, f, t0, y0, t1):
+        self.f = f
+        self.state = ImpulseState()
+        self.state.times = []
+        with self.active():
+            f(t0, y0)
+        times = self.state.times
+        self.state.times = None
+        self.times = sorted({a for a in times if a >= t0 and a < t1})
+
+    @contextlib.contextmanager
+    def active(self):
+        token = current.set(self.state)
+        try:
+            yield
+        finally:
+            current.reset(token)
+
+    # The jump in y at time t is the difference between the values of
+    # the right-hand side with the impulses at t on and off.  Nothing is
+    # assumed about how the right-hand side depends on its impulses so
+    # delta(t, a)**2 or abs(delta(t, a)) give the jumps they describe.
+    # These are the only evaluations made for an impulse, two at each
+    # impulse time, since nothing less finds the jump of an arbitrary
+    # right-hand side.
+    def jump(self, t, y):
+        with self.active():
+            try:
+                self.state.weight = 1
+                on = np.asarray(self.f(t, y), dtype=float)
+                self.state.weight = 0
+                off = np.asarray(self.f(t, y), dtype=float)
+                return on - off
+            finally:
+                self.state.weight = 0
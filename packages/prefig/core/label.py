@@ -11,6 +11,8 @@ from . import utilities as util
 from . import CTM
 from . import user_namespace as un
 from . import label_tools
+from . import label_placement
+from . import metrics
 import tempfile
 
 log = logging.getLogger('prefigure')
@@ -32,8 +34,11 @@ def init(format, environment):
         math_labels = label_tools.PyodideMathLabels(format)
     else:
         text_measurements = label_tools.CairoTextMeasurements()
+        if not text_measurements.cairo_loaded:
+            text_measurements = label_tools.FontMetricTextMeasurements()
         braille_translator = label_tools.LocalLouisBrailleTranslator()
         math_labels = label_tools.LocalMathLabels(format)
+    label_placement.init()
 
 # Is there a label associated with this element
 def has_label(element):
@@ -181,16 +186,36 @@ def label(element, diagram, parent, outline_group=None):
 
         # add the label's text to the HTML tree
         math_labels.register_math_label(math_id, math.text)
-
-    align = util.get_attr(element, 'alignment', 'c')
+        metrics.count('math-labels')
+
+    # labels asking for automatic placement start at the first
+    # candidate alignment and are moved after all labels are positioned
+    # The alignment is kept with the diagram rather than written back
+    # onto the author's element
+    auto = element.get('alignment', None) == 'auto'
+    if (element.get('alignment', None) is None and
+        diagram.diagram_element.get('label-placement', 'fixed') == 'auto'):
+        auto = True
+    if auto:
+        align = label_placement.candidates[0]
+    else:
+        align = util.get_attr(element, 'alignment', 'c')
     if align.startswith('2') or align == 'e':
         align = 'east'
 
-    element.set('alignment', align)
+    diagram.register_source_data(element, 'alignment', align)
+    diagram.register_source_data(element, 'auto-placement', auto)
     if element.get('anchor', None) is not None:
         element.set('p', element.get('anchor'))
     element.set('p', util.get_attr(element, 'p', '[0,0]'))
 
+# The alignment chosen for a label when it was processed
+def label_alignment(element, diagram):
+    alignment = diagram.get_source_data(element, 'alignment')
+    if alignment is None:
+        alignment = util.get_attr(element, 'alignment', 'center')
+    return alignment
+
 # Allow substitutions from the user namespace
 def evaluate_text(text):
     tokens = re.split(r"(\${[^}]*})", text)
@@ -204,8 +229,10 @@ def place_labels(diagram, filename, root, label_group_dict, label_html_tree):
     # if there are no labels, there's nothing to do
     if len(label_group_dict) == 0:
         return
+    metrics.count('labels', len(label_group_dict))
 
-    math_labels.process_math_labels()
+    with metrics.timer('mathjax'):
+        math_labels.process_math_labels()
 
     # for braille output, we'll create a group to hold all the labels
     # and their clear backgrounds and add it at the end of the diagram
@@ -227,9 +254,73 @@ def place_labels(diagram, filename, root, label_group_dict, label_html_tree):
         else:
             position_svg_label(label, diagram, ctm, group)
 
+    if diagram.output_format() != 'tactile':
+        label_placement.arrange(diagram, root, alignment_displacement)
+
 # use this to retrieve elements from the mathjax output
 #        div = label_tree.xpath("//html/body/div[@id = '{}']".format(id))[0]
 
+braille_typeforms = {'plain':0, 'it':1, 'b':4}
+
+# Break the text of a label into rows, each consisting of
+# [text, typeform] pairs and <m> elements
+def braille_rows(element):
+    # let's assemble the different pieces
+    row = [[element.text, 'plain']]
+    text_elements = [row]
+    
+    for el in element:
+        if el.tag == 'newline':
+            row = []
+            text_elements.append(row)
+        if el.tag == 'm':
+            row.append(el)
+        if el.tag == 'it':
+            row.append([el.text, 'it'])
+            for child in el:
+                if child.tag != 'b':
+                    log.error(f"<{child.tag}> is not allowed inside a <it>")
+                    continue
+                row.append([child.text, 'it'])
+                row.append([child.tail, 'it'])
+        
+        if el.tag == 'b':
+            row.append([el.text, 'b'])
+            for child in el:
+                if child.tag != 'it':
+                    log.error(f"<{child.tag}> is not allowed inside a <b>")
+                    continue
+                row.append([child.text, 'b'])
+                row.append([child.tail, 'b'])
+        if el.tag == 'plain':
+            row.append([el.text, 'plain'])
+        row.append([el.tail, 'plain'])
+
+    # Let's make another pass through the elements removing
+    # empty text and adding whitespace
+    for num, row in enumerate(text_elements):
+        # remove empty text
+        new_row = []
+        for el in row:
+            if isinstance(el, list): # is this a text
+                text = el[0]
+                if text is not None:
+                    text = text.strip()
+                    if len(text) > 0:
+                        if (
+                                len(new_row) > 0 and
+                                len(new_row[-1]) > 1 and
+                                new_row[-1][1] == el[1]
+                        ):
+                            new_row[-1][0] += ' ' + text
+                        else:
+                            new_row.append([text, el[1]])
+            else: # otherwise it's an <m>
+                new_row.append(el)
+        text_elements[num] = new_row
+
+    return text_elements
+
 def position_braille_label(element, diagram, ctm, 
                            background_group, braille_group):
     group = ET.SubElement(braille_group, 'g')
@@ -244,7 +335,7 @@ def position_braille_label(element, diagram, ctm,
     except:
         log.error(f"Error in label parsing anchor={element.get('p')}")
         return
-    alignment = util.get_attr(element, 'alignment', 'center')
+    alignment = label_alignment(element, diagram)
     try:
         displacement = braille_displacement[alignment]
     except:
@@ -296,61 +387,7 @@ def position_braille_label(element, diagram, ctm,
     p[0] += offset[0]
     p[1] -= offset[1]
 
-    # let's assemble the different pieces
-    row = [[element.text, 'plain']]
-    text_elements = [row]
-    
-    for el in element:
-        if el.tag == 'newline':
-            row = []
-            text_elements.append(row)
-        if el.tag == 'm':
-            row.append(el)
-        if el.tag == 'it':
-            row.append([el.text, 'it'])
-            for child in el:
-                if child.tag != 'b':
-                    log.error(f"<{child.tag}> is not allowed inside a <it>")
-                    continue
-                row.append([child.text, 'it'])
-                row.append([child.tail, 'it'])
-        
-        if el.tag == 'b':
-            row.append([el.text, 'b'])
-            for child in el:
-                if child.tag != 'it':
-                    log.error(f"<{child.tag}> is not allowed inside a <b>")
-                    continue
-                row.append([child.text, 'b'])
-                row.append([child.tail, 'b'])
-        if el.tag == 'plain':
-            row.append([el.text, 'plain'])
-        row.append([el.tail, 'plain'])
-
-    # Let's make another pass through the elements removing
-    # empty text and adding whitespace
-    for num, row in enumerate(text_elements):
-        # remove empty text
-        new_row = []
-        for el in row:
-            if isinstance(el, list): # is this a text
-                text = el[0]
-                if text is not None:
-                    text = text.strip()
-                    if len(text) > 0:
-                        if (
-                                len(new_row) > 0 and
-                                len(new_row[-1]) > 1 and
-                                new_row[-1][1] == el[1]
-                        ):
-                            new_row[-1][0] += ' ' + text
-                        else:
-                            new_row.append([text, el[1]])
-            else: # otherwise it's an <m>
-                new_row.append(el)
-        text_elements[num] = new_row
-
-    typeform_dict = {'plain':0, 'it':1, 'b':4}
+    text_elements = braille_rows(element)
     space = ' '
     # translate braille strings not in an <m>
     for num, row in enumerate(text_elements):
@@ -362,7 +399,7 @@ def position_braille_label(element, diagram, ctm,
                 text = el[0]
                 if len(row_text) > 0:
                     text += ' '
-                typeform = [typeform_dict[el[1]]] * len(text)
+                typeform = [braille_typeforms[el[1]]] * len(text)
                 braille_text = braille_translator.translate(
                     text,
                     typeform
@@ -466,31 +503,32 @@ def position_svg_label(element, diagram, ctm, group):
     except:
         log.error(f"Error in label parsing anchor={element.get('p')}")
         return
-    alignment = util.get_attr(element, 'alignment', 'center')
+    alignment = label_alignment(element, diagram)
     try:
         displacement = alignment_displacement[alignment]
     except:
         log.error(f"Unknown alignment in label: {alignment}")
         return
 
-    offset = util.get_attr(element, 'abs-offset', 'none')
-    if offset == 'none':
-        offset = [8*(displacement[0] + 0.5), 8*(displacement[1]-0.5)]
+    abs_offset = util.get_attr(element, 'abs-offset', 'none')
+    if abs_offset == 'none':
+        abs_offset = None
     else:
         try:
-            offset = un.valid_eval(offset)
+            abs_offset = un.valid_eval(abs_offset)
         except:
             log.error(f"Error in label parsing abs-offset={element.get('abs-offset')}")
             return
 
+    relative_offset = None
     if element.get('offset', None) is not None:
         try:
             relative_offset = un.valid_eval(element.get('offset'))
         except:
             log.error(f"Error in label parsing offset={element.get('offset')}")
             return
-        offset = [offset[0] + relative_offset[0],
-                  offset[1] + relative_offset[1]]
+    offset = label_placement.label_offset(displacement, abs_offset,
+                                          relative_offset)
 
     # A label can have rows consisting of different components
     # comprised of text, with italics and bold, and <m> tags.
@@ -660,19 +698,14 @@ def position_svg_label(element, diagram, ctm, group):
 
 
     # Now we find the coordinate transform for the label_group
-    tform = CTM.translatestr(p[0] + offset[0], p[1] - offset[1])
-
     sc = float(label.get('scale', '1'))
-    if sc != 1:
-        tform = tform + ' ' + CTM.scalestr(sc, sc)
-
     rot = label.get('rotate', None)
-    if rot is not None:
-        tform = tform + ' ' + CTM.rotatestr(float(rot))
-    tform = tform + ' ' + CTM.translatestr(width*displacement[0], 
-                                           -height*displacement[1])
-
+    tform = label_placement.label_transform(p, offset, displacement,
+                                            width, height, sc, rot)
     group.set('transform', tform)
+    label_placement.add_label(group, p, abs_offset, relative_offset,
+                              displacement, width, height, sc, rot,
+                              auto=bool(diagram.get_source_data(label, 'auto-placement')))
 
     # add a white rectangle behind the label, if requested
     if label.get('clear-background', 'no') == 'yes':
@@ -724,17 +757,18 @@ def mk_m_element(m_tag, diagram, label_group):
     if insert is None:
         return None
 
-    # We are going to modify the ids on the glyphs by prepending
+    # The glyphs are moved into the diagram's <defs>, where they are
+    # shared with other labels, and their ids are modified by prepending
     # the filename in a pretext environment.
     # Note that the xlink namespace is deprecated so this will
     # need to change with MathJax4
     defs = insert.find('svg:defs', namespaces=ns)
     defs_dict = {}
-    for glyph in defs:
-        id = glyph.get('id')
-        new_id = diagram.prepend_id_prefix(id)
-        glyph.set('id', new_id)
-        defs_dict[id] = new_id
+    if defs is not None:
+        for glyph in list(defs):
+            id = glyph.get('id')
+            defs_dict[id] = diagram.add_glyph(glyph)
+        insert.remove(defs)
 
     use_els = insert.findall('.//svg:use', namespaces=ns)
     for use in use_els:
@@ -0,0 +1,259 @@
+import re
+import logging
+import numpy as np
+import shapely
+from . import CTM
+from . import metrics
+
+log = logging.getLogger('prefigure')
+
+# Automatic placement of labels.  A label asks for automatic placement
+# with alignment="auto", or every label without an alignment does when
+# the diagram has label-placement="auto".  Once all the labels have been
+# positioned, each of these labels is moved to the candidate alignment
+# that least overlaps the diagram's edges, the other labels, and the
+# paths and lines drawn in the diagram.  All of the candidate boxes, the
+# boxes of the other labels, and the drawn geometry are indexed in a
+# shapely STRtree so each label only looks at what is nearby.
+
+# candidate alignments in order of preference
+candidates = ['northeast', 'northwest', 'southeast', 'southwest',
+              'north', 'south', 'east', 'west']
+
+# weights given to the different kinds of overlap
+outside_weight = 10
+label_weight = 10
+path_weight = 1
+preference_weight = 0.001
+
+# These two functions are shared with label.position_svg_label so that
+# candidate positions are computed exactly as a label is positioned
+def label_offset(displacement, abs_offset, relative_offset):
+    if abs_offset is None:
+        offset = [8*(displacement[0] + 0.5), 8*(displacement[1]-0.5)]
+    else:
+        offset = abs_offset
+    if relative_offset is not None:
+        offset = [offset[0] + relative_offset[0],
+                  offset[1] + relative_offset[1]]
+    return offset
+
+def label_transform(p, offset, displacement, width, height, sc=1, rot=None):
+    tform = CTM.translatestr(p[0] + offset[0], p[1] - offset[1])
+    if sc != 1:
+        tform = tform + ' ' + CTM.scalestr(sc, sc)
+    if rot is not None:
+        tform = tform + ' ' + CTM.rotatestr(float(rot))
+    tform = tform + ' ' + CTM.translatestr(width*displacement[0],
+                                           -height*displacement[1])
+    return tform
+
+# the box, in SVG coordinates, occupied by an unrotated label
+def label_box(p, offset, displacement, width, height, sc=1):
+    x = p[0] + offset[0] + sc*width*displacement[0]
+    y = p[1] - offset[1] - sc*height*displacement[1]
+    return shapely.box(x, y, x + sc*width, y + sc*height)
+
+# Record the labels placed by label.position_svg_label.  Those asking for
+# automatic placement carry what's needed to try other alignments.
+def init():
+    global placed_labels
+    placed_labels = []
+
+def add_label(group, p, abs_offset, relative_offset, displacement,
+              width, height, sc=1, rot=None, auto=False):
+    offset = label_offset(displacement, abs_offset, relative_offset)
+    if rot is not None:
+        auto = False
+    placed_labels.append({
+        'group': group,
+        'p': p,
+        'abs-offset': abs_offset,
+        'relative-offset': relative_offset,
+        'width': width,
+        'height': height,
+        'scale': sc,
+        'auto': auto,
+        'box': None if rot is not None else label_box(p, offset, displacement,
+                                                      width, height, sc)
+    })
+
+def arrange(diagram, root, alignment_displacement):
+    auto_labels = [label for label in placed_labels if label['auto']]
+    if len(auto_labels) == 0:
+        return
+
+    fixed_boxes = [label['box'] for label in placed_labels
+                   if not label['auto'] and label['box'] is not None]
+    label_groups = {label['group'] for label in placed_labels}
+    paths = drawn_geometry(root, label_groups)
+
+    # the geometries in the index are the fixed label boxes, the drawn
+    # paths, and then the candidate boxes of the automatic labels
+    boxes = []
+    for num, label in enumerate(auto_labels):
+        label['candidates'] = []
+        for alignment in candidates:
+            displacement = alignment_displacement[alignment]
+            offset = label_offset(displacement, label['abs-offset'],
+                                  label['relative-offset'])
+            box = label_box(label['p'], offset, displacement,
+                            label['width'], label['height'], label['scale'])
+            label['candidates'].append([alignment, displacement,
+                                        offset, len(boxes)])
+            boxes.append(box)
+
+    geometries = fixed_boxes + paths + boxes
+    num_fixed = len(fixed_boxes)
+    num_static = num_fixed + len(paths)
+    tree = shapely.STRtree(geometries)
+    geometries = np.array(geometries, dtype=object)
+
+    try:
+        x, y, w, h = [float(v) for v in root.get('viewBox').split()]
+        bounds = shapely.box(x, y, x + w, y + h)
+    except (AttributeError, ValueError):
+        bounds = None
+
+    chosen = {}   # index of a chosen candidate box -> owning label
+    for num, label in enumerate(auto_labels):
+        candidate_boxes = [boxes[c[3]] for c in label['candidates']]
+        area = max(label['width'] * label['height'] * label['scale']**2, 1)
+        size = max((label['width'] + label['height']) * label['scale'], 1)
+        costs = []
+        query = tree.query(candidate_boxes)
+        for k, candidate in enumerate(label['candidates']):
+            box = candidate_boxes[k]
+            hits = query[1][query[0] == k]
+            cost = preference_weight * k
+            if bounds is not None:
+                cost += outside_weight * shapely.area(
+                    shapely.difference(box, bounds)) / area
+
+            fixed_hits = hits[hits < num_fixed]
+            path_hits = hits[(hits >= num_fixed) & (hits < num_static)]
+            box_hits = [i for i in hits[hits >= num_static]
+                        if chosen.get(i - num_static, num) != num]
+            overlap = list(fixed_hits) + box_hits
+            if len(overlap) > 0:
+                cost += label_weight * np.sum(shapely.area(
+                    shapely.intersection(geometries[overlap], box))) / area
+            if len(path_hits) > 0:
+                cost += path_weight * np.sum(shapely.length(
+                    shapely.intersection(geometries[path_hits], box))) / size
+            costs.append(cost)
+
+        best = int(np.argmin(costs))
+        alignment, displacement, offset, index = label['candidates'][best]
+        chosen[index] = num
+        label['box'] = boxes[index]
+        label['group'].set('transform',
+                           label_transform(label['p'], offset, displacement,
+                                           label['width'], label['height'],
+                                           label['scale']))
+        metrics.count('auto-placed-labels')
+        log.debug(f"Placing label {label['group'].get('id')} with alignment={alignment}")
+
+# Gather the lines and paths drawn in the diagram as shapely geometries.
+# We skip anything inside <defs>, the labels themselves, and anything
+# inside a transformed group since its coordinates aren't those of the
+# diagram.
+def drawn_geometry(root, label_groups):
+    geometries = []
+    def visit(element):
+        for child in element:
+            if not isinstance(child.tag, str):
+                continue
+            tag = child.tag.split('}')[-1]
+            if tag in ['defs', 'clipPath', 'marker', 'svg']:
+                continue
+            if child in label_groups or child.get('transform') is not None:
+                continue
+            if tag == 'g':
+                visit(child)
+            elif tag == 'path':
+                geometries.extend(path_geometry(child.get('d', '')))
+            elif tag == 'line':
+                try:
+                    points = [[float(child.get('x1')), float(child.get('y1'))],
+                              [float(child.get('x2')), float(child.get('y2'))]]
+                except (TypeError, ValueError):
+                    continue
+                geometries.append(shapely.LineString(points))
+            elif tag == 'circle':
+                try:
+                    center = shapely.Point(float(child.get('cx')),
+                                           float(child.get('cy')))
+                    r = float(child.get('r'))
+                except (TypeError, ValueError):
+                    continue
+                geometries.append(center.buffer(r, quad_segs=2).exterior)
+    visit(root)
+    return geometries
+
+# A polyline approximation of SVG path data.  Bezier curves are
+# replaced by their control polygons, which contain them, and arcs by
+# a segment to their endpoint.
+path_token = re.compile(r'[A-Za-z]|[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?')
+
+# the number of arguments each command takes, which may be repeated
+path_arguments = {'M': 2, 'L': 2, 'T': 2, 'H': 1, 'V': 1,
+                  'C': 6, 'S': 4, 'Q': 4, 'A': 7, 'Z': 0}
+
+def path_geometry(d):
+    geometries = []
+    points = []
+    # the current point and the start of the current subpath
+    state = {'current': [0, 0], 'start': [0, 0]}
+    tokens = path_token.findall(d)
+    command = None
+    numbers = []
+    for token in tokens + ['M']:
+        if not token.isalpha():
+            numbers.append(float(token))
+            continue
+        if command is not None:
+            points = path_command(command, numbers, points, geometries, state)
+        command = token
+        numbers = []
+    if len(points) > 1:
+        geometries.append(shapely.LineString(points))
+    return geometries
+
+def path_command(command, numbers, points, geometries, state):
+    name = command.upper()
+    relative = command.islower()
+    if name == 'Z':
+        if len(points) > 0:
+            points.append(list(state['start']))
+        state['current'] = list(state['start'])
+        return points
+    size = path_arguments.get(name, None)
+    if size is None:
+        return points
+    for i in range(0, len(numbers) - size + 1, size):
+        args = numbers[i:i+size]
+        x0, y0 = state['current']
+        if name == 'H':
+            pairs = [[args[0], 0] if relative else [args[0], y0]]
+        elif name == 'V':
+            pairs = [[0, args[0]] if relative else [x0, args[0]]]
+        elif name == 'A':
+            pairs = [args[5:7]]
+        else:
+            pairs = [args[j:j+2] for j in range(0, size, 2)]
+        # every pair of a relative command is relative to the current
+        # point at the start of its own segment
+        if relative:
+            pairs = [[x0 + x, y0 + y] for x, y in pairs]
+
+        if name == 'M' and i == 0:
+            if len(points) > 1:
+                geometries.append(shapely.LineString(points))
+            points = []
+            state['start'] = list(pairs[0])
+        elif len(points) == 0:
+            points.append([x0, y0])
+        points.extend([list(pair) for pair in pairs])
+        state['current'] = list(pairs[-1])
+    return points
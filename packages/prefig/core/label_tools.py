@@ -3,7 +3,11 @@ import lxml.etree as ET
 import tempfile
 import logging
 import inspect
+import functools
+import json
 import os
+from . import font_metrics
+from . import metrics
 from pathlib import Path
 from pathlib import Path
 
@@ -51,6 +55,7 @@ class LocalMathLabels(AbstractMathLabels):
         self.html_tree = html
         self.html_body = body
         self.labels_present = False
+        self.label_divs = {}
 
     def add_macros(self, macros):
         macros_div = ET.SubElement(self.html_body, 'div')
@@ -77,6 +82,36 @@ class LocalMathLabels(AbstractMathLabels):
         with ET.xmlfile(mj_input, encoding='utf-8') as xf:
             xf.write(self.html_tree, pretty_print=True)
 
+        # have MathJax process the HTML file and index the resulting
+        # labels by id
+        if not self.run_mathjax(mj_input, mj_output):
+            return
+        self.index_labels(mj_output)
+        working_dir.cleanup()
+
+    # Stream through the MathJax output and keep each label's <div>
+    # in a dictionary keyed by its id so that every lookup takes constant
+    # time.  Each <div> is detached from the document once it's parsed so
+    # the rest of the HTML tree is not kept in memory.
+    def index_labels(self, mj_output):
+        self.label_divs = {}
+        try:
+            for _, element in ET.iterparse(mj_output, events=('end',)):
+                parent = element.getparent()
+                if parent is None:
+                    continue
+                if element.tag == 'div' and parent.tag == 'body':
+                    self.label_divs[element.get('id')] = element
+                    parent.remove(element)
+                elif parent.tag == 'html' and element.tag != 'body':
+                    element.clear()
+        except ET.XMLSyntaxError:
+            log.error("Unable to read the mathematical labels produced by MathJax")
+
+    # MathJax reads the HTML file mj_input and writes the processed labels
+    # into mj_output.  This is separated out so that the cost of starting
+    # node can be left out when benchmarking the rest of a build.
+    def run_mathjax(self, mj_input, mj_output):
         options = ''
         if self.format == 'tactile':
             format = 'braille'
@@ -84,8 +119,6 @@ class LocalMathLabels(AbstractMathLabels):
             options = '--svgenhanced --depth deep'
             format = 'svg'
 
-        # have MathJax process the HTML file and load the resulting
-        # SVG labels into label_tree 
         path = Path(os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe()))))
         mj_dir = path.absolute() / 'mj_sre'
         mj_dir_str = str(mj_dir)
@@ -96,7 +129,7 @@ class LocalMathLabels(AbstractMathLabels):
             success = scripts.install_mj.main()
             if not success:
                 log.error("Cannot create labels without MathJax")
-                return
+                return False
 
         mj_command = 'node {}/mj-sre-page.js --{} {} {} > {}'.format(mj_dir_str, format, options, mj_input, mj_output)
         log.debug("Using MathJax to produce mathematical labels")
@@ -104,21 +137,18 @@ class LocalMathLabels(AbstractMathLabels):
             os.system(mj_command)
         except:
             log.error("Production of mathematical labels with MathJax was unsuccessful")
-            return
-        self.label_tree = ET.parse(mj_output)
-        working_dir.cleanup()
+            return False
+        return True
 
     def get_math_label(self, id):
+        div = self.label_divs.get(id, None)
+        if div is None:
+            log.error("Error retrieving a mathematical label")
+            log.error("  Perhaps it was not created due to an earlier error")
+            return None
+
         # first we'll retrieve braille math labels
         if self.format == "tactile":
-            try:
-                path = "//html/body/div[@id = '{}']".format(id)
-                div = self.label_tree.xpath(path)[0]
-            except:
-                log.error("Error retrieving a mathematical label")
-                log.error("  Perhaps it was not created due to an earlier error")
-                return None
-
             try:
                 container = div.xpath('mjx-data/mjx-braille')[0]
                 return container.text
@@ -127,8 +157,6 @@ class LocalMathLabels(AbstractMathLabels):
                 return None
 
         # now we get sighted math labels
-        path = "//html/body/div[@id = '{}']".format(id)
-        div = self.label_tree.xpath(path)[0]
         try:
             insert = div.xpath('mjx-data/mjx-container/svg:svg',
                                namespaces=ns)[0]
@@ -140,9 +168,6 @@ class LocalMathLabels(AbstractMathLabels):
 
 class PyodideMathLabels(AbstractMathLabels):
     def __init__(self, format):
-        global prefigBrowserApi
-        import prefigBrowserApi
-
         self.format = format
         self.text_label_dict = {}
         self.math_label_dict = {}
@@ -154,6 +179,7 @@ class PyodideMathLabels(AbstractMathLabels):
         self.text_label_dict[id] = text
 
     def process_math_labels(self):
+        import prefigBrowserApi
         for id, text in self.text_label_dict.items():
             if self.format == "tactile":
                 insert = prefigBrowserApi.processBraille(text)
@@ -168,6 +194,23 @@ class PyodideMathLabels(AbstractMathLabels):
         return self.math_label_dict[id]
 
 
+# The same strings, tick labels for instance, are measured over and over
+# so cairo's measurements are memoized, across builds as well
+text_cache_size = 4096
+cairo_context = None
+
+@functools.lru_cache(maxsize=text_cache_size)
+def cairo_text_extents(text, font, font_size, italics, bold):
+    cairo_context.select_font_face(font,
+                                   italics_dict[italics],
+                                   bold_dict[bold])
+    cairo_context.set_font_size(font_size)
+    extents = cairo_context.text_extents(text)
+    y_bearing = extents[1]
+    t_height  = extents[3]
+    xadvance  = extents[4]
+    return (xadvance, -y_bearing, t_height+y_bearing)
+
 class CairoTextMeasurements(AbstractTextMeasurements):
     def __init__(self):
         self.cairo_loaded = False
@@ -175,19 +218,21 @@ class CairoTextMeasurements(AbstractTextMeasurements):
         try:
             import cairo
         except:
-            log.info('Error importing Python package cairo, which is required for non-mathemaical labels.')
+            log.info('Error importing Python package cairo, which is used to measure non-mathematical labels.')
             log.info('See the PreFigure installation instructions at https://prefigure.org')
-            log.info('The rest of the diagram will still be built')
+            log.info('Labels will be measured with approximate font metrics')
             return
 
         log.info("cairo imported")
         self.cairo_loaded = True
-        surface = cairo.SVGSurface(None, 200, 200)
-        self.context = cairo.Context(surface)
-        self.italics_dict = {True: cairo.FontSlant.ITALIC,
-                             False: cairo.FontSlant.NORMAL}
-        self.bold_dict = {True: cairo.FontWeight.BOLD,
-                          False: cairo.FontWeight.NORMAL}
+        global cairo_context, italics_dict, bold_dict
+        if cairo_context is None:
+            surface = cairo.SVGSurface(None, 200, 200)
+            cairo_context = cairo.Context(surface)
+            italics_dict = {True: cairo.FontSlant.ITALIC,
+                            False: cairo.FontSlant.NORMAL}
+            bold_dict = {True: cairo.FontWeight.BOLD,
+                         False: cairo.FontWeight.NORMAL}
 
     def measure_text(self, text, font_data):
         font, font_size, italics, bold = font_data[:4]
@@ -195,15 +240,56 @@ class CairoTextMeasurements(AbstractTextMeasurements):
         if not self.cairo_loaded:
             return None
 
-        self.context.select_font_face(font,
-                                      self.italics_dict[italics],
-                                      self.bold_dict[bold])
-        self.context.set_font_size(font_size)
-        extents = self.context.text_extents(text)
-        y_bearing = extents[1]
-        t_height  = extents[3]
-        xadvance  = extents[4]
-        return [xadvance, -y_bearing, t_height+y_bearing]
+        hits = cairo_text_extents.cache_info().hits
+        extents = cairo_text_extents(text, font, font_size, italics, bold)
+        metrics.cache_lookup('text-measurements',
+                             cairo_text_extents.cache_info().hits > hits)
+        return list(extents)
+
+# Measures text using the metrics of the standard PostScript fonts bundled
+# in font_metrics.  This is used when pycairo is not available and gives
+# fast, deterministic measurements, though they only approximate those of
+# the fonts a browser will actually use.
+class FontMetricTextMeasurements(AbstractTextMeasurements):
+    def measure_text(self, text, font_data):
+        font, font_size, italics, bold = font_data[:4]
+        return font_metrics.measure(text, font, font_size, italics, bold)
+
+# Braille translations are cached by (text, typeform, table) for the life
+# of the process, since tactile diagrams translate the same axis labels
+# and captions many times, and, if a cache file has been loaded, across
+# runs as well.
+braille_table = "en-ueb-g2.ctb"
+braille_cache = {}
+braille_cache_file = None
+braille_cache_changed = False
+
+def load_braille_cache(filename):
+    global braille_cache_file
+    braille_cache_file = filename
+    if not os.path.exists(filename):
+        return
+    try:
+        with open(filename) as f:
+            entries = json.load(f)
+        for text, typeform, table, braille in entries:
+            braille_cache[(text, tuple(typeform), table)] = braille
+    except (OSError, ValueError, TypeError):
+        log.warning(f"Unable to read the braille translation cache {filename}")
+
+def save_braille_cache():
+    global braille_cache_changed
+    if braille_cache_file is None or not braille_cache_changed:
+        return
+    entries = [[text, list(typeform), table, braille]
+               for (text, typeform, table), braille in braille_cache.items()]
+    try:
+        with open(braille_cache_file, 'w') as f:
+            json.dump(entries, f)
+    except OSError:
+        log.error(f"Unable to write the braille translation cache {braille_cache_file}")
+        return
+    braille_cache_changed = False
 
 class LocalLouisBrailleTranslator(AbstractBrailleTranslator):
     def __init__(self):
@@ -225,28 +311,33 @@ class LocalLouisBrailleTranslator(AbstractBrailleTranslator):
         return self.louis_loaded
 
     def translate(self, text, typeform):
+        global braille_cache_changed
         if not self.louis_loaded:
             return None
         if len(text) == 0:
             return ""
-        return louis.translateString(
-            ["en-ueb-g2.ctb"],
-            text,
-            typeform=typeform
-        ).rstrip()
+        key = (text, tuple(typeform), braille_table)
+        braille = braille_cache.get(key, None)
+        metrics.cache_lookup('braille', braille is not None)
+        if braille is None:
+            braille = louis.translateString(
+                [braille_table],
+                text,
+                typeform=list(typeform)
+            ).rstrip()
+            braille_cache[key] = braille
+            braille_cache_changed = True
+        return braille
 
 
 class PyodideBrailleTranslator(AbstractBrailleTranslator):
-    def __init__(self):
-        global prefigBrowserApi
-        import prefigBrowserApi
-
     def initialized(self):
         return True
 
     def translate(self, text, typeform):
         log.info('Called translate text')
         try:
+            import prefigBrowserApi
             # `prefigBrowserApi` will return a JsProxy. We want a native python object,
             # so we convert it to a list.
             braille_string = prefigBrowserApi.translate_text(text, typeform)
@@ -2,6 +2,7 @@ import numpy as np
 import math
 from . import user_namespace as un
 from . import calculus
+from . import impulses
 
 import logging
 logger = logging.getLogger('prefigure')
@@ -143,15 +144,10 @@ def eulers_method(f, t0, y0, t1, N):
 
 # dirac delta function to be used in solving ODEs
 def delta(t, a):
-    breaks = un.retrieve('__breaks')
-    if breaks is not None:
-        breaks.append(a)
+    state = impulses.current.get()
+    if state is None:
         return 0
-    delta_on = un.retrieve('__delta_on')
-    if np.isclose(t, a) and delta_on:
-        return 1
-
-    return 0
+    return state.delta(t, a)
 
 def line_intersection(lines):
     p1, p2 = [np.array(c) for c in lines[0]]
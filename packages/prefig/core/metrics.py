@@ -0,0 +1,164 @@
+import os
+import json
+import time
+import logging
+import tracemalloc
+import contextlib
+from datetime import datetime, timezone
+
+log = logging.getLogger('prefigure')
+
+# Metrics collected while building a single diagram.  parse.mk_diagram
+# activates a BuildMetrics record at the start of a build and the rest of
+# the code reports into whichever record is active through the module-level
+# functions below, which do nothing when no record is active.  This
+# mirrors how utilities and math_utilities find the current diagram.
+
+phases = ['initialize', 'begin_figure', 'parse', 'place_labels',
+          'annotate_source', 'end_figure']
+
+class BuildMetrics:
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.started_tracing = False
+        self.start = None
+        self.info = {}
+        self.phases = {}
+        self.timers = {}
+        self.counters = {}
+        self.caches = {}
+        self.files = {}
+        self.status = 'not built'
+        self.total = None
+        self.peak_memory = None
+
+    # everything is recorded afresh for each build
+    def begin(self, **info):
+        self.info = dict(info)
+        self.phases = {}
+        self.timers = {}
+        self.counters = {}
+        self.caches = {}
+        self.files = {}
+        self.total = None
+        self.peak_memory = None
+        self.status = 'ok'
+        if self.trace_memory:
+            if tracemalloc.is_tracing():
+                tracemalloc.reset_peak()
+            else:
+                tracemalloc.start()
+                self.started_tracing = True
+        self.start = time.perf_counter()
+
+    def finish(self):
+        self.total = time.perf_counter() - self.start
+        if self.trace_memory:
+            self.peak_memory = tracemalloc.get_traced_memory()[1]
+            if self.started_tracing:
+                tracemalloc.stop()
+                self.started_tracing = False
+
+    def record(self):
+        caches = {}
+        for name, (hits, misses) in self.caches.items():
+            lookups = hits + misses
+            caches[name] = {
+                'hits': hits,
+                'misses': misses,
+                'hit-rate': hits / lookups if lookups > 0 else None
+            }
+        record = {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'status': self.status,
+            'total': self.total,
+            'phases': {name: self.phases[name]
+                       for name in phases if name in self.phases},
+            'labels': self.counters.get('labels', 0),
+            'math-labels': self.counters.get('math-labels', 0),
+            'mathjax-time': self.timers.get('mathjax', 0),
+            'bytes-written': sum(self.files.values()),
+            'files': dict(self.files),
+            'peak-memory': self.peak_memory,
+            'caches': caches,
+            'timers': dict(self.timers),
+            'counters': dict(self.counters)
+        }
+        record.update(self.info)
+        return record
+
+current = None
+
+def activate(build_metrics):
+    global current
+    current = build_metrics
+
+def deactivate():
+    global current
+    current = None
+
+@contextlib.contextmanager
+def phase(name):
+    if current is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        current.phases[name] = (current.phases.get(name, 0) +
+                                time.perf_counter() - start)
+
+@contextlib.contextmanager
+def timer(name):
+    if current is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        current.timers[name] = (current.timers.get(name, 0) +
+                                time.perf_counter() - start)
+
+def count(name, n=1):
+    if current is None:
+        return
+    current.counters[name] = current.counters.get(name, 0) + n
+
+def cache_lookup(cache, hit):
+    if current is None:
+        return
+    hits, misses = current.caches.get(cache, (0, 0))
+    if hit:
+        hits += 1
+    else:
+        misses += 1
+    current.caches[cache] = (hits, misses)
+
+def failed(phase_name):
+    if current is None:
+        return
+    current.status = f'failed in {phase_name}'
+
+def file_written(filename):
+    if current is None:
+        return
+    try:
+        current.files[str(filename)] = os.path.getsize(filename)
+    except OSError:
+        pass
+
+def string_written(name, string):
+    if current is None or string is None:
+        return
+    current.files[name] = len(string.encode('utf-8'))
+
+# append one record as a line of JSON so that batch runs can be
+# collected into a single file
+def write_record(record, metrics_file):
+    try:
+        with open(metrics_file, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+    except OSError:
+        log.error(f"Unable to write build metrics to {metrics_file}")
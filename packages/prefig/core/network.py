@@ -5,10 +5,14 @@ except:
     from .compat import ErrorOnAccess
     nx = ErrorOnAccess("networkx")
 import numpy as np
+import hashlib
+import json
 import math
+import os
 import copy
 import logging
 from . import user_namespace as un
+from . import metrics
 from . import math_utilities as math_util
 from . import utilities as util
 from . import coordinates
@@ -181,36 +185,12 @@ def network(element, diagram, parent, outline_group):
             for _ in range(len(edges)):
                 G.add_edge(edge[0], edge[1])
 
-        layout = element.get('layout', None)
-
-        seed = int(element.get('seed', '1'))
-        if layout is None or layout == 'spring':
-            positions = nx.spring_layout(G, seed=seed)
-        elif layout == 'bfs':
-            start = element.get('start', None)
-            if start is None:
-                log.error('bfs network layout needs a starting node')
-                return
-            positions = nx.bfs_layout(G, start=start)
-        elif layout == 'spectral':
-            positions = nx.spectral_layout(G)
-        elif layout == 'circular':
-            positions = nx.circular_layout(G)
-        elif layout == 'random':
-            positions = nx.random_layout(G, seed=seed)
-        elif layout == 'planar':
-            positions = nx.planar_layout(G)
-        elif layout == 'bipartite':
-            alignment = element.get('alignment', 'horizontal')
-            bipartite_set = element.get('bipartite-set', None)
-            if bipartite_set is None:
-                log.error('A bipartite network needs a @bipartite-set attribute')
-                return
-            bipartite_set = un.valid_eval(bipartite_set)
-            bipartite_set = [str(n) for n in bipartite_set]
-            positions = nx.bipartite_layout(G,
-                                            bipartite_set,
-                                            align=alignment)
+        positions = layout_positions(
+            G, element,
+            diagram.get_source_data(element, 'prefetched')
+        )
+        if positions is None:
+            return
 
         # Now that we have the positions of the nodes, we will form the
         # graphical components.  First find the bounding box
@@ -292,6 +272,17 @@ def network(element, diagram, parent, outline_group):
         arrow_buffer = 12
         spread = 20
 
+    # In bulk mode, the undecorated edges and nodes are drawn together
+    # rather than as individual elements.  Nodes and edges that have
+    # labels, decorations, or annotations are still drawn individually.
+    bulk = (element.get('bulk', 'no') == 'yes' and
+            diagram.output_format() != 'tactile')
+    annotated = set()
+    if bulk:
+        for annotation in diagram.diagram_element.iter('annotation'):
+            annotated.add(annotation.get('ref'))
+    bulk_edges = []
+
     element.clear()
     if auto_layout:
         element.tag = 'coordinates'
@@ -320,6 +311,20 @@ def network(element, diagram, parent, outline_group):
         edge = tuple(endpoints)
         y = (all_edges[edge] - 1)/2 * spread
         for num, edge in enumerate(edges):
+            handle = 'edge-' + handle_0 + '-' + handle_1
+            if len(edges) > 1:
+                handle += '-' + str(num)
+            if (
+                    bulk and edge is None and not directed and
+                    handle not in annotated and
+                    handle_0 not in loops and handle_1 not in loops
+            ):
+                bulk_edges.append((positions[handle_0],
+                                   positions[handle_1],
+                                   y))
+                y -= spread
+                continue
+
             ctm = CTM.CTM()
             user_p0 = positions[handle_0]
             user_p1 = positions[handle_1]
@@ -346,9 +351,6 @@ def network(element, diagram, parent, outline_group):
             directions.append(c2)
             edge_directions[handle_1] = directions
 
-            handle = 'edge-' + handle_0 + '-' + handle_1
-            if len(edges) > 1:
-                handle += '-' + str(num)
             path = ET.SubElement(edge_group, 'path')
             path.set('at', handle)
             if directed:
@@ -396,14 +398,14 @@ def network(element, diagram, parent, outline_group):
                     edge_group.append(label_element)
                     if label_element.get('alignment', None) is None:
                         label_element.set('alignment', alignment)
-                    label_element.set('anchor', '('+util.pt2long_str(anchor, spacer=",")+')')
+                    util.set_long_value(label_element, 'anchor', anchor)
 
             if abs(y) < 1e-10:
                 # it's a straight line
                 if directed:
                     path.tag = 'line'
                     if mid_arrows:
-                        path.set('endpoints', ','.join(['('+util.pt2long_str(p, spacer=",")+')' for p in [user_p0, user_p1]]))
+                        util.set_long_value(path, 'endpoints', (user_p0, user_p1))
                         path.set('arrows', '0')
                         path.set('additional-arrows', '(0.5)')
                         y -= spread
@@ -421,18 +423,18 @@ def network(element, diagram, parent, outline_group):
                             segment = [q0, c]
                         else:
                             segment = [c, q1]
-                    path.set('endpoints', ','.join(['('+util.pt2long_str(p, spacer=",")+')' for p in [user_p0, segment[0]]]))
+                    util.set_long_value(path, 'endpoints', (user_p0, segment[0]))
                     y -= spread
                     continue
 
-            path.set('start', util.pt2long_str(user_p0, spacer=","))
+            util.set_long_value(path, 'start', user_p0)
             curveto = ET.SubElement(path, 'quadratic-bezier')
-            curveto.set('controls', ','.join(['('+util.pt2long_str(p, spacer=",")+')' for p in [c1, center]]))
+            util.set_long_value(curveto, 'controls', np.array([c1, center]))
 
             # if we need to draw an arrow, we need to find where the edge intersects the node
             if not directed or mid_arrows:
                 curveto = ET.SubElement(path, 'quadratic-bezier')
-                curveto.set('controls', ','.join(['('+util.pt2long_str(p, spacer=",")+')' for p in [c2, user_p1]]))
+                util.set_long_value(curveto, 'controls', np.array([c2, user_p1]))
             else:
                 current_curve = [center, c2, user_p1]
                 N = 6  # number of subdivisions
@@ -451,7 +453,7 @@ def network(element, diagram, parent, outline_group):
                     else:
                         current_curve = [center, c1, p2]
                         curveto = ET.SubElement(path, 'quadratic-bezier')
-                        curveto.set('controls', ','.join(['('+util.pt2long_str(p, spacer=",")+')' for p in [c0, center]]))
+                        util.set_long_value(curveto, 'controls', np.array([c0, center]))
             y -= spread
 
     # now we will add the loops
@@ -519,7 +521,7 @@ def network(element, diagram, parent, outline_group):
             if len(loop_record) > 1:
                 handle += '-' + str(j)
             path.set('at', handle)
-            path.set('start', '('+util.pt2long_str(node_position, spacer=",")+')')
+            util.set_long_value(path, 'start', node_position)
             if directed:
                 if mid_arrows:
                     path.set('mid-arrow', 'yes')
@@ -536,11 +538,11 @@ def network(element, diagram, parent, outline_group):
                 path.set('dash', loop.get('dash', edge_dash))
 
             curveto = ET.SubElement(path, 'cubic-bezier')
-            curveto.set('controls', '('+','.join(['('+util.pt2long_str(p, spacer=",")+')' for p in [P1, P2, P3]])+')')
+            util.set_long_value(curveto, 'controls', np.array([P1, P2, P3]))
 
             if not directed or mid_arrows:
                 curveto = ET.SubElement(path, 'cubic-bezier')
-                curveto.set('controls', '('+','.join(['('+util.pt2long_str(p, spacer=",")+')' for p in [P4, P5, node_position]])+')')
+                util.set_long_value(curveto, 'controls', np.array([P4, P5, node_position]))
             else:
                 current_curve = loop_curves[1]
                 N = 6  # number of subdivisions
@@ -561,7 +563,7 @@ def network(element, diagram, parent, outline_group):
                     else:
                         current_curve = [center, q2, p23, p3]
                         curveto = ET.SubElement(path, 'cubic-bezier')
-                        curveto.set('controls', ','.join(['('+util.pt2long_str(p, spacer=",")+')' for p in [p01, q1, center]]))
+                        util.set_long_value(curveto, 'controls', np.array([p01, q1, center]))
 
             if loop is None:
                 path.set('stroke', edge_stroke)
@@ -606,15 +608,34 @@ def network(element, diagram, parent, outline_group):
                 edge_group.append(label_element)
                 if label_element.get('alignment', None) is None:
                     label_element.set('alignment', alignment)
-                    label_element.set('anchor', '('+util.pt2long_str(anchor, spacer=",")+')')
+                    util.set_long_value(label_element, 'anchor', anchor)
+
+    if len(bulk_edges) > 0:
+        edges_element = ET.Element('network-edges')
+        edge_group.insert(0, edges_element)
+        edges_element.set('stroke', edge_stroke)
+        edges_element.set('thickness', edge_thickness)
+        edges_element.set('dash', edge_dash)
+        p0, p1, offsets = zip(*bulk_edges)
+        diagram.register_source_data(edges_element, 'edges',
+                                     (np.array(p0),
+                                      np.array(p1),
+                                      np.array(offsets)))
 
     node_group = ET.SubElement(element, 'group')
     node_group.set('outline', 'tactile')
 
+    bulk_nodes = []
     for handle, position in positions.items():
         node = nodes.get(handle, None)
+        if (
+                bulk and node is None and not labels and
+                'node-' + handle not in annotated
+        ):
+            bulk_nodes.append(position)
+            continue
         p = ET.SubElement(node_group, 'point')
-        p.set('p', '(' + util.pt2long_str(position, spacer=',') + ')')
+        util.set_long_value(p, 'p', position)
         p.set('size', node_size)
         p.set('at', 'node-' + handle)
         
@@ -645,16 +666,274 @@ def network(element, diagram, parent, outline_group):
                 math_element = ET.SubElement(label_element, 'm')
                 label_text = label_dictionary.get(handle, handle)
                 math_element.text = label_text
-            label_element.set('p', '(' + util.pt2long_str(position, spacer=',') + ')')
+            util.set_long_value(label_element, 'p', position)
             label_element.set('alignment', 'center')
             label_element.set('offset', '(0,0)')
             label_element.set('clear-background', 'no')
 
+    if len(bulk_nodes) > 0:
+        nodes_element = ET.Element('network-nodes')
+        node_group.insert(0, nodes_element)
+        nodes_element.set('size', node_size)
+        nodes_element.set('fill', node_fill)
+        nodes_element.set('stroke', node_stroke)
+        nodes_element.set('thickness', node_thickness)
+        nodes_element.set('style', node_style)
+        diagram.register_source_data(nodes_element, 'positions',
+                                     np.array(bulk_nodes))
+
     if auto_layout:
         coordinates.coordinates(element, diagram, parent, outline_group)
     else:
         group.group(element,diagram, parent, outline_group)
 
+# The undecorated edges of a network in bulk mode are drawn as a single
+# path.  An edge between p0 and p1 that is offset, in a multigraph, is
+# a pair of quadratic Bezier curves through the point offset from the
+# midpoint, just as when the edges are drawn individually.
+def network_edges(element, diagram, parent, outline_group):
+    user_p0, user_p1, offsets = diagram.get_source_data(element, 'edges')
+    p0 = diagram.transform_points(user_p0)
+    p1 = diagram.transform_points(user_p1)
+    u = p1 - p0
+    length = np.linalg.norm(u, axis=1)
+    length[length == 0] = 1
+    normal = np.column_stack((-u[:, 1], u[:, 0])) / length[:, None]
+    shift = offsets[:, None] * normal
+    c1 = p0 + u/4 + shift
+    center = p0 + u/2 + shift
+    c2 = p0 + 3*u/4 + shift
+
+    cmds = []
+    for i, offset in enumerate(offsets):
+        cmds.append('M ' + util.pt2str(p0[i]))
+        if abs(offset) < 1e-10:
+            cmds.append('L ' + util.pt2str(p1[i]))
+        else:
+            cmds.append('Q ' + util.pt2str(c1[i]) + ' ' +
+                        util.pt2str(center[i]))
+            cmds.append('Q ' + util.pt2str(c2[i]) + ' ' +
+                        util.pt2str(p1[i]))
+
+    path = ET.Element('path')
+    diagram.add_id(path, element.get('id'))
+    diagram.register_svg_element(element, path)
+    path.set('d', ' '.join(cmds))
+    util.add_attr(path, util.get_1d_attr(element))
+    element.set('cliptobbox', element.get('cliptobbox', 'yes'))
+    util.cliptobbox(path, element, diagram)
+
+    if outline_group is not None:
+        diagram.add_outline(element, path, outline_group)
+        diagram.finish_outline(element,
+                               element.get('stroke'),
+                               element.get('thickness'),
+                               'none',
+                               parent)
+    else:
+        parent.append(path)
+
+# The nodes of a network in bulk mode share a single marker in <defs>
+# which is placed at each node with <use>
+def network_nodes(element, diagram, parent, outline_group):
+    positions = diagram.transform_points(
+        diagram.get_source_data(element, 'positions')
+    )
+
+    # create the marker by drawing a point at the origin of SVG coordinates
+    template = ET.Element('point', attrib=dict(element.attrib))
+    template.set('p', '(0,0)')
+    markers = ET.Element('g')
+    diagram.push_ctm([CTM.CTM(), diagram.bbox()])
+    try:
+        point.point(template, diagram, markers, None)
+    finally:
+        diagram.pop_ctm()
+    if len(markers) == 0:
+        return
+    marker = markers[0]
+    diagram.add_reusable(marker)
+
+    g = ET.SubElement(parent, 'g')
+    diagram.add_id(g)
+    href = '#' + marker.get('id')
+    for position in positions:
+        ET.SubElement(g, 'use', attrib={
+            'href': href,
+            'x': util.float2str(position[0]),
+            'y': util.float2str(position[1])
+        })
+
+# Layouts from networkx are kept for the life of the process and, if a
+# cache file has been loaded, across runs.  A layout is found from a hash
+# of the nodes, edges, layout algorithm, seed, and any parameters of the
+# algorithm.  With @warm-start="yes", a spring layout that isn't in the
+# cache begins from a cached layout of a graph that differs by a few
+# nodes or edges, which keeps the nodes that are unaffected in place.
+layout_cache = {}
+layout_cache_file = None
+layout_cache_changed = False
+
+def load_layout_cache(filename):
+    global layout_cache_file
+    layout_cache_file = filename
+    if not os.path.exists(filename):
+        return
+    try:
+        with open(filename) as f:
+            layout_cache.update(json.load(f))
+    except (OSError, ValueError, TypeError):
+        log.warning(f"Unable to read the network layout cache {filename}")
+
+def save_layout_cache():
+    global layout_cache_changed
+    if layout_cache_file is None or not layout_cache_changed:
+        return
+    try:
+        with open(layout_cache_file, 'w') as f:
+            json.dump(layout_cache, f)
+    except OSError:
+        log.error(f"Unable to write the network layout cache {layout_cache_file}")
+        return
+    layout_cache_changed = False
+
+# Finding the layout is the expensive part of a network and may be
+# done in another process in a parallel build.  We return the layouts
+# that were added to the cache.
+def find_layout(element, diagram):
+    known = set(layout_cache.keys())
+    network(element, diagram, ET.Element('group'), None)
+    return {key: entry for key, entry in layout_cache.items()
+            if key not in known}
+
+# A layout found in another process, in a parallel build, is in prefetched
+def layout_positions(G, element, prefetched=None):
+    global layout_cache_changed
+    layout = element.get('layout', 'spring')
+    seed = int(element.get('seed', '1'))
+    parameters = {}
+    if layout == 'bfs':
+        parameters['start'] = element.get('start', None)
+    elif layout == 'bipartite':
+        parameters['alignment'] = element.get('alignment', 'horizontal')
+        # the set may be given by a name whose value changes
+        bipartite_set = bipartite_nodes(element)
+        if bipartite_set is not None:
+            bipartite_set = sorted(bipartite_set)
+        parameters['bipartite-set'] = bipartite_set
+
+    # nodes are identified by their handles as strings.  The layouts
+    # from networkx depend on the order in which the nodes and edges
+    # were added and on the direction of the edges so these are kept.
+    handles = {str(node): node for node in G.nodes()}
+    nodes = list(handles.keys())
+    edges = [[str(p), str(q)] for p, q in G.edges()]
+    family = hash_json([layout, seed, parameters, G.is_directed()])
+    key = hash_json([family, nodes, edges])
+
+    entry = layout_cache.get(key)
+    metrics.cache_lookup('network-layouts', entry is not None)
+    if entry is None and prefetched is not None:
+        entry = prefetched.get(key)
+        if entry is not None:
+            layout_cache[key] = entry
+            layout_cache_changed = True
+    if entry is None:
+        positions = None
+        if layout == 'spring' and element.get('warm-start', 'no') == 'yes':
+            positions = warm_start(G, handles, family, nodes, edges, seed)
+        if positions is None:
+            positions = compute_layout(G, element, layout, seed)
+        if positions is None:
+            return None
+        entry = {
+            'family': family,
+            'nodes': nodes,
+            'edges': edges,
+            'positions': {str(node): [float(c) for c in p]
+                          for node, p in positions.items()}
+        }
+        layout_cache[key] = entry
+        layout_cache_changed = True
+
+    # the positions are modified later so each network gets its own
+    return {handles[node]: np.array(p)
+            for node, p in entry['positions'].items()}
+
+def hash_json(data):
+    text = json.dumps(data, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(text.encode()).hexdigest()
+
+def warm_start(G, handles, family, nodes, edges, seed):
+    # the layouts in a family have edges with or without direction
+    def edge_set(edges):
+        if G.is_directed():
+            return {tuple(edge) for edge in edges}
+        return {tuple(sorted(edge)) for edge in edges}
+
+    nodes = set(nodes)
+    edges = edge_set(edges)
+    allowed = max(2, 0.1 * (len(nodes) + len(edges)))
+
+    # find the cached layout in this family that is closest to this graph
+    closest = None
+    fewest = None
+    for entry in layout_cache.values():
+        if entry['family'] != family:
+            continue
+        changed_nodes = nodes.symmetric_difference(entry['nodes'])
+        changed_edges = edges.symmetric_difference(edge_set(entry['edges']))
+        changes = len(changed_nodes) + len(changed_edges)
+        if changes <= allowed and (fewest is None or changes < fewest):
+            closest = entry
+            fewest = changes
+            moving = changed_nodes.union(*changed_edges)
+    if closest is None:
+        return None
+
+    pos = {handles[node]: np.array(p)
+           for node, p in closest['positions'].items() if node in nodes}
+    fixed = [node for node in pos.keys() if str(node) not in moving]
+    log.debug(f"Warm starting a network layout with {len(fixed)} of {len(nodes)} nodes fixed")
+    if len(fixed) == 0:
+        fixed = None
+    return nx.spring_layout(G, pos=pos, fixed=fixed, seed=seed)
+
+def compute_layout(G, element, layout, seed):
+    if layout == 'spring':
+        return nx.spring_layout(G, seed=seed)
+    if layout == 'bfs':
+        start = element.get('start', None)
+        if start is None:
+            log.error('bfs network layout needs a starting node')
+            return None
+        return nx.bfs_layout(G, start=start)
+    if layout == 'spectral':
+        return nx.spectral_layout(G)
+    if layout == 'circular':
+        return nx.circular_layout(G)
+    if layout == 'random':
+        return nx.random_layout(G, seed=seed)
+    if layout == 'planar':
+        return nx.planar_layout(G)
+    if layout == 'bipartite':
+        alignment = element.get('alignment', 'horizontal')
+        bipartite_set = bipartite_nodes(element)
+        if bipartite_set is None:
+            log.error('A bipartite network needs a @bipartite-set attribute')
+            return None
+        return nx.bipartite_layout(G,
+                                   bipartite_set,
+                                   align=alignment)
+    log.error(f"Unknown network layout: {layout}")
+    return None
+
+def bipartite_nodes(element):
+    bipartite_set = element.get('bipartite-set', None)
+    if bipartite_set is None:
+        return None
+    return [str(n) for n in un.valid_eval(bipartite_set)]
+
 def poset(element, diagram, parent, outline_group):
     try:
         structure = element.get('covers')
@@ -807,7 +1086,7 @@ def poset(element, diagram, parent, outline_group):
             if element.get('edge-dash', None) is not None:
                 line_el.set('dash', element.get('edge-dash'))
             endpoints = (lower_endpoint, nodes[upper].coordinates)
-            diagram.register_source_data(line_el, 'endpoints', endpoints)
+            util.set_value(line_el, 'endpoints', endpoints)
 
     for name, node in nodes.items():
         if element.get('centered-labels', 'no') == 'yes':
@@ -887,6 +1166,6 @@ def poset(element, diagram, parent, outline_group):
                     else:
                         math_el = ET.SubElement(point_el, 'm')
                         math_el.text = node.label
-                diagram.register_source_data(point_el, 'p', node.coordinates)
+                util.set_value(point_el, 'p', node.coordinates)
 
     coordinates.coordinates(coords_el, diagram, parent, outline_group)
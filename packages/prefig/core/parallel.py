@@ -0,0 +1,151 @@
+import logging
+import multiprocessing
+import lxml.etree as ET
+from . import user_namespace as un
+
+log = logging.getLogger('prefigure')
+
+# Parallel builds.  With prefig build --parallel N, the expensive work
+# of elements such as <implicit-curve> and <slope-field> may be done in
+# a pool of N processes.  When Diagram.parse begins processing the
+# children of an element, it sends that work for the children that
+# have it to processes forked at that moment, so they see the
+# namespace and coordinate system that the children will see.  This
+# happens only once for each diagram, for the first element with such
+# children, so that repeats and nested groups don't fork again.  The
+# children are then processed in document order as usual.  When a
+# child is reached, the result from the pool is used only if nothing
+# the child reads from the namespace has been written since the pool
+# was forked and otherwise the work is done again.  All of the SVG is
+# produced in the main process so the output is identical to that of
+# a serial build.
+
+workers = None
+
+def init(processes=None):
+    global workers
+    workers = processes
+
+# the jobs of the most recent batch, which the forked processes
+# find in their copy of this module
+jobs = []
+
+# Look ahead at the children of an element and start the expensive
+# work of those that have it.  Returns a Batch or None.
+def dispatch(diagram, element):
+    if workers is None or workers < 1:
+        return None
+    if diagram.parallel_dispatched:
+        return None
+    if diagram.get_profiler() is not None:
+        return None
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        return None
+
+    from . import tags
+    candidates = []
+    written = set()
+    for child in element:
+        if child.tag is ET.Comment:
+            continue
+        task = tags.task_dict.get(ET.QName(child).localname, None)
+        if task is not None and written.isdisjoint(closure(reads(child))):
+            candidates.append((child, task))
+        written.update(writes(child))
+    if len(candidates) == 0:
+        return None
+
+    global jobs
+    jobs = [(diagram, child, task) for child, task in candidates]
+    diagram.parallel_dispatched = True
+    context = multiprocessing.get_context('fork')
+    pool = context.Pool(min(workers, len(jobs)), initializer=quiet)
+    pending = {}
+    for num, (child, task) in enumerate(candidates):
+        pending[child] = pool.apply_async(run_job, (num,))
+    pool.close()
+    log.debug(f"Started the work of {len(pending)} elements in parallel")
+    un.write_log = []
+    return Batch(diagram, pool, pending)
+
+class Batch:
+    def __init__(self, diagram, pool, pending):
+        self.pool = pool
+        self.pending = pending
+        self.ctm_bbox = diagram.ctm_bbox()
+        self.position = len(un.write_log)
+
+    # Just before a child is processed, make its result available if
+    # it's still valid
+    def install(self, child, diagram):
+        job = self.pending.pop(child, None)
+        if job is None:
+            return
+        if diagram.ctm_bbox() is not self.ctm_bbox:
+            return
+        written = set(un.write_log[self.position:])
+        if not written.isdisjoint(closure(reads(child))):
+            log.debug(f"Repeating the work of <{child.tag}> since the namespace has changed")
+            return
+        try:
+            result = job.get()
+        except Exception:
+            return
+        if result is not None:
+            diagram.register_source_data(child, 'prefetched', result)
+
+    def finish(self):
+        self.pool.terminate()
+        self.pool.join()
+        un.write_log = None
+
+def quiet():
+    log.disabled = True
+
+# Runs in a forked process.  Any problem is left for the main process
+# to find and report when it does the work itself.
+def run_job(num):
+    diagram, child, task = jobs[num]
+    try:
+        diagram.prepare_element(child)
+        return task(child, diagram)
+    except Exception:
+        return None
+
+# The names an element and its descendants may read from the namespace
+def reads(element):
+    names = set()
+    for descendant in element.iter():
+        if not isinstance(descendant.tag, str):
+            continue
+        for value in descendant.attrib.values():
+            names.update(un.names_in(value.replace('^', '**')))
+    return names
+
+# The names an element and its descendants visibly write to the
+# namespace.  Any others are found through the namespace's write log.
+def writes(element):
+    names = set()
+    for descendant in element.iter():
+        if not isinstance(descendant.tag, str):
+            continue
+        if ET.QName(descendant).localname == 'definition':
+            text = descendant.text or ''
+            left = text.split('=')[0]
+            names.add(left.split('(')[0].strip())
+        for attr in ['name', 'parameter']:
+            if descendant.get(attr, None) is not None:
+                names.add(descendant.get(attr).split('=')[0].strip())
+    return names
+
+# Add the names read by the author-defined functions among some names
+def closure(names):
+    names = set(names)
+    unchecked = list(names)
+    while len(unchecked) > 0:
+        name = unchecked.pop()
+        for dependency in un.dependencies.get(name, set()):
+            if dependency not in names:
+                names.add(dependency)
+                unchecked.append(dependency)
+    return names
@@ -4,6 +4,7 @@ import importlib
 import logging
 import lxml.etree as ET
 from . import diagram
+from . import metrics
 from . import user_namespace
 
 log = logging.getLogger('prefigure')
@@ -26,7 +27,9 @@ _USER_NAMESPACE_BASELINE = frozenset(vars(user_namespace).keys())
 
 # This function does the main work of constructing a diagram.
 # This can be called from outside the project to allow, say,
-# for generating assets in a pretext document
+# for generating assets in a pretext document.  If build_metrics,
+# a metrics.BuildMetrics, is given, it will be filled in with the
+# time spent in each phase and other counters describing the build.
 def mk_diagram(element,
                format,
                publication,
@@ -34,54 +37,95 @@ def mk_diagram(element,
                suppress_caption,
                diagram_number,
                environment,
-               return_string=False):
+               return_string=False,
+               profiler=None,
+               build_metrics=None):
 
+    metrics.activate(build_metrics)
+    if build_metrics is not None:
+        build_metrics.begin(filename=str(filename),
+                            diagram_number=diagram_number,
+                            format=format,
+                            environment=environment)
+    try:
+        return build_phases(element, format, publication, filename,
+                            suppress_caption, diagram_number, environment,
+                            return_string, profiler)
+    finally:
+        if build_metrics is not None:
+            build_metrics.finish()
+        metrics.deactivate()
+
+def build_phases(element,
+                 format,
+                 publication,
+                 filename,
+                 suppress_caption,
+                 diagram_number,
+                 environment,
+                 return_string,
+                 profiler):
     for name in list(vars(user_namespace).keys()):
         if name not in _USER_NAMESPACE_BASELINE:
             delattr(user_namespace, name)
     importlib.reload(user_namespace)
+    if profiler is not None:
+        profiler.attach()
     output = None # add at a later date
-    diag = diagram.Diagram(element, filename, diagram_number, 
-                           format, output, publication, suppress_caption,
-                           environment)
+    with metrics.phase('initialize'):
+        diag = diagram.Diagram(element, filename, diagram_number, 
+                               format, output, publication, suppress_caption,
+                               environment, profiler=profiler)
     log.debug("Initializing PreFigure diagram")
     try:
-        diag.begin_figure()
+        with metrics.phase('begin_figure'):
+            diag.begin_figure()
     except:
         log.error("There was a problem initializing the PreFigure diagram")
         log.error("Debugging information is available with 'prefig -vv build filename'")
+        metrics.failed('begin_figure')
         return
     log.debug("Processing PreFigure elements")
     try:
-        diag.parse()
+        with metrics.phase('parse'):
+            diag.parse()
     except:
         log.error("There was a problem parsing a PreFigure element")
         log.error("Debugging information is available with 'prefig -vv build filename'")
+        metrics.failed('parse')
         return
     log.debug("Positioning labels")
     try:
-        diag.place_labels()
+        with metrics.phase('place_labels'):
+            diag.place_labels()
     except:
         log.error("There was a problem placing the labels in the diagram")
         log.error("Debugging information is available with 'prefig -vv build filename'")
+        metrics.failed('place_labels')
         return
     log.debug("Writing the diagram and any annotations")
     try:
-        diag.annotate_source()
+        with metrics.phase('annotate_source'):
+            diag.annotate_source()
     except:
         log.error("There was a problem generating annotations for this diagram")
         log.error("Debugging information is available with 'prefig -vv build filename'")
     try:
-        if return_string:
-            return diag.end_figure_to_string()
-        else:
-            diag.end_figure()
+        with metrics.phase('end_figure'):
+            if return_string:
+                return diag.end_figure_to_string()
+            else:
+                diag.end_figure()
     except:
         log.error("There was a problem finishing the diagram")
         log.error("Debugging information is available with 'prefig -vv build filename'")
+        metrics.failed('end_figure')
         return
 
-def parse(filename, format, pub_file, suppress_caption, environment):
+# If metrics_records is a list, a record of build metrics for each
+# diagram is appended to it
+def parse(filename, format, pub_file, suppress_caption, environment,
+          profiler=None, metrics_records=None, trace_memory=False):
     # Load the publication file, if there is one
     ns = {'pf': 'https://prefigure.org'}
     if pub_file is not None:
@@ -133,9 +177,15 @@ def parse(filename, format, pub_file, suppress_caption, environment):
                 if elem.get('at', None) is not None:
                     elem.set('id', elem.get('at'))
 
+            build_metrics = None
+            if metrics_records is not None:
+                build_metrics = metrics.BuildMetrics(trace_memory=trace_memory)
             mk_diagram(element, format, publication,
                        filename, suppress_caption, diagram_number,
-                       environment)
+                       environment, profiler=profiler,
+                       build_metrics=build_metrics)
+            if build_metrics is not None:
+                metrics_records.append(build_metrics.record())
 
 def check_duplicate_handles(element, handles):
     for child in element:
@@ -13,6 +13,7 @@ from . import point
 from . import label
 from . import circle
 from . import group
+from . import decimate
 
 log = logging.getLogger('prefigure')
 
@@ -59,6 +60,7 @@ def polygon(element, diagram, parent,
         if points is None:
             return
 
+    points = decimate.decimate(element, diagram, points)
     points = [diagram.transform(point) for point in points]
     
     radius = int(element.get('corner-radius', '0'))
@@ -0,0 +1,169 @@
+import json
+import time
+import logging
+from pathlib import Path
+from . import user_namespace as un
+
+log = logging.getLogger('prefigure')
+
+# A profiler for `prefig build --profile`.  Every element passes through
+# tags.parse_element so the profiler wraps that dispatch and records, for
+# each element, the wall time, the number of expressions and author-defined
+# function calls evaluated in user_namespace, and the number of SVG nodes
+# emitted.  Elements nest (a <group> parses its children through the same
+# dispatch) so we keep a stack of open frames and record both inclusive
+# and self (exclusive) measurements.
+
+measures = ['time', 'expressions', 'function-calls', 'svg-nodes']
+
+class BuildProfiler:
+    def __init__(self):
+        self.records = []
+        self.stack = []
+        self.evaluations = {'expressions': 0, 'function-calls': 0}
+
+    # user_namespace is reloaded at the start of every build so the
+    # evaluation counter needs to be attached after that happens
+    def attach(self):
+        un.evaluation_counter = self.evaluations
+
+    def run(self, function, element, diagram, root, outline_group):
+        frame = {
+            'tag': element.tag,
+            'at': element.get('at', element.get('id', None)),
+            'line': element.sourceline,
+            'stack': [f['name'] for f in self.stack],
+            'children': dict.fromkeys(measures, 0)
+        }
+        frame['name'] = frame_name(frame)
+        defs = getattr(diagram, 'defs', None)
+        root_count = len(root)
+        defs_count = len(defs) if defs is not None else 0
+        expressions = self.evaluations['expressions']
+        function_calls = self.evaluations['function-calls']
+
+        self.stack.append(frame)
+        start = time.perf_counter()
+        try:
+            function(element, diagram, root, outline_group)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.stack.pop(-1)
+
+            # we only count the nodes that were appended by this element
+            # so that the cost of counting is linear in the size of the output
+            svg_nodes = count_nodes(root[root_count:])
+            if defs is not None and defs is not root:
+                svg_nodes += count_nodes(defs[defs_count:])
+
+            inclusive = {
+                'time': elapsed,
+                'expressions': self.evaluations['expressions'] - expressions,
+                'function-calls': (self.evaluations['function-calls'] -
+                                   function_calls),
+                'svg-nodes': svg_nodes
+            }
+            children = frame.pop('children')
+            frame['inclusive'] = inclusive
+            frame['self'] = {
+                key: max(inclusive[key] - children[key], 0)
+                for key in measures
+            }
+            if len(self.stack) > 0:
+                parent_children = self.stack[-1]['children']
+                for key in measures:
+                    parent_children[key] += inclusive[key]
+            self.records.append(frame)
+
+    # combine the records for elements sharing a tag, handle, and source line,
+    # as happens, for instance, inside a <repeat>
+    def summarize(self):
+        summary = {}
+        for record in self.records:
+            key = (record['tag'], record['at'], record['line'])
+            entry = summary.get(key, None)
+            if entry is None:
+                entry = {
+                    'tag': record['tag'],
+                    'at': record['at'],
+                    'line': record['line'],
+                    'calls': 0,
+                    'inclusive': dict.fromkeys(measures, 0),
+                    'self': dict.fromkeys(measures, 0)
+                }
+                summary[key] = entry
+            entry['calls'] += 1
+            for kind in ['inclusive', 'self']:
+                for measure in measures:
+                    entry[kind][measure] += record[kind][measure]
+        return sorted(summary.values(),
+                      key=lambda entry: entry['self']['time'],
+                      reverse=True)
+
+    # collapsed stacks, one line per unique stack with its self time
+    # in microseconds.  speedscope and flamegraph.pl both read this format
+    def collapsed_stacks(self):
+        stacks = {}
+        for record in self.records:
+            stack = ';'.join(['diagram'] + record['stack'] + [record['name']])
+            micros = round(record['self']['time'] * 1e6)
+            stacks[stack] = stacks.get(stack, 0) + micros
+        return [f"{stack} {micros}" for stack, micros in stacks.items()]
+
+    def write(self, out):
+        json_file = out + '-profile.json'
+        folded_file = out + '-profile.folded'
+        profile = {
+            'elements': self.summarize(),
+            'records': [
+                {key: value for key, value in record.items()
+                 if key not in ['name']}
+                for record in self.records
+            ]
+        }
+        try:
+            Path(json_file).parent.mkdir(parents=True, exist_ok=True)
+            with open(json_file, 'w') as f:
+                json.dump(profile, f, indent=2)
+            with open(folded_file, 'w') as f:
+                f.write('\n'.join(self.collapsed_stacks()) + '\n')
+        except OSError:
+            log.error(f"Unable to write the build profile at {json_file}")
+            return
+        log.info(f"Wrote build profile to {json_file} and {folded_file}")
+
+    # a short table of the most expensive elements for the console
+    def report(self, top=10):
+        summary = self.summarize()[:top]
+        total = sum([record['self']['time'] for record in self.records])
+        lines = [
+            f"Elements with the largest self time "
+            f"(total {1000*total:.1f} ms in {len(self.records)} elements)",
+            f"  {'element':<32}{'line':>6}{'calls':>7}"
+            f"{'self ms':>10}{'incl ms':>10}{'evals':>8}{'nodes':>8}"
+        ]
+        for entry in summary:
+            name = entry['tag']
+            if entry['at'] is not None:
+                name += f" at={entry['at']}"
+            line = '-' if entry['line'] is None else str(entry['line'])
+            evals = (entry['inclusive']['expressions'] +
+                     entry['inclusive']['function-calls'])
+            lines.append(
+                f"  {name[:31]:<32}{line:>6}{entry['calls']:>7}"
+                f"{1000*entry['self']['time']:>10.2f}"
+                f"{1000*entry['inclusive']['time']:>10.2f}"
+                f"{evals:>8}{entry['inclusive']['svg-nodes']:>8}"
+            )
+        return '\n'.join(lines)
+
+def frame_name(frame):
+    name = frame['tag']
+    if frame['at'] is not None:
+        name += f"[{frame['at']}]"
+    if frame['line'] is not None:
+        name += f":{frame['line']}"
+    return name
+
+def count_nodes(elements):
+    return sum([sum(1 for _ in element.iter()) for element in elements])
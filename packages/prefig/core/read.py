@@ -1,7 +1,11 @@
 import csv
+import os
+import warnings
+import zipfile
 import numpy as np
 from pathlib import Path
 from . import user_namespace as un
+from . import metrics
 
 import logging
 log = logging.getLogger('prefigure')
@@ -28,39 +32,188 @@ def read(element, diagram, parent, outline_group):
 
     if filetype == 'csv':
         load_csv(element, diagram, filename, name)
+    elif filetype == 'npy' or filetype == 'npz':
+        load_numpy(element, diagram, filename, name, filetype)
+    else:
+        log.error(f"A <read> element cannot read files of type {filetype}")
 
-def load_csv(element, diagram, filename, name):
-    csv_data = {}
+# Parsed CSV files are kept for the whole process so that a dataset
+# read by many diagrams, in a book or a long running session, is only
+# parsed once.  The key includes the modification time and size of the
+# file along with the options that affect parsing.
+csv_cache = {}
 
+def load_csv(element, diagram, filename, name):
     delimiter = element.get('delimiter',',')
     quotechar = element.get('quotechar',"'")
     str_cols  = element.get('string-columns','[]')
     str_cols = un.valid_eval(str_cols)
     str_cols  = set(str_cols)
 
+    stat = os.stat(filename)
+    key = (os.path.abspath(filename), stat.st_mtime_ns, stat.st_size,
+           delimiter, quotechar, tuple(sorted(str_cols)))
+    csv_data = csv_cache.get(key)
+    metrics.cache_lookup('csv', csv_data is not None)
+    if csv_data is None:
+        csv_data = parse_csv(filename, delimiter, quotechar, str_cols)
+        if csv_data is None:
+            return
+        csv_cache[key] = csv_data
+
+    # each diagram gets its own copy of the columns
+    un.enter_namespace(name, {header: column.copy()
+                              for header, column in csv_data.items()})
+
+# NumPy's loadtxt converts whole columns at once, with the numerical
+# columns read as floats and the string columns as strings.  If that
+# fails, say because a numerical column has an entry that isn't a number,
+# we read the rows with the csv module instead.  A column that doesn't
+# consist entirely of numbers then keeps the numbers it does have as
+# strings alongside the other entries.
+def parse_csv(filename, delimiter, quotechar, str_cols):
+    with open(filename, newline='') as csvfile:
+        reader = csv.reader(csvfile,
+                            delimiter=delimiter,
+                            quotechar=quotechar)
+        headers = next(reader)
+
+    try:
+        return load_columns(filename, headers, delimiter, quotechar, str_cols)
+    except (ValueError, UserWarning):
+        return convert_rows(filename, delimiter, quotechar, str_cols)
+
+def convert_rows(filename, delimiter, quotechar, str_cols):
     with open(filename, newline='') as csvfile:
         reader = csv.reader(csvfile,
                             delimiter=delimiter,
                             quotechar=quotechar)
         headers = next(reader)
+        num_columns = len(headers)
+        rows = []
         for row in reader:
-            for i, header in enumerate(headers):
-                header_list = csv_data.get(header, [])
-                if header not in str_cols:
-                    try:
-                        header_list.append(float(row[i]))
-                    except:
-                        header_list.append(row[i])
-                else:
-                    header_list.append(row[i])
-                csv_data[header] = header_list
-
-    for header in headers:
-        csv_data[header] = np.array(csv_data[header])
-
-    un.enter_namespace(name, csv_data)
-    
-
-    
-
-    
+            if len(row) == 0:
+                continue
+            if len(row) < num_columns:
+                log.error(f"Line {reader.line_num} of {filename} has fewer entries than there are headers")
+                return None
+            rows.append(row)
+
+    if len(rows) == 0:
+        columns = [[] for header in headers]
+    else:
+        columns = list(zip(*rows))[:num_columns]
+
+    csv_data = {}
+    for header, column in zip(headers, columns):
+        if header in str_cols:
+            csv_data[header] = np.array(column)
+            continue
+        try:
+            csv_data[header] = np.array(column, dtype=float)
+        except ValueError:
+            csv_data[header] = np.array([to_float(entry) for entry in column])
+    return csv_data
+
+def load_columns(filename, headers, delimiter, quotechar, str_cols):
+    columns = {}
+    for dtype, indices in [
+            (float, [i for i, h in enumerate(headers) if h not in str_cols]),
+            (str, [i for i, h in enumerate(headers) if h in str_cols])
+    ]:
+        if len(indices) == 0:
+            continue
+        with warnings.catch_warnings():
+            # an empty file is handled by the csv module
+            warnings.simplefilter('error')
+            data = np.loadtxt(filename, dtype=dtype, delimiter=delimiter,
+                              quotechar=quotechar, comments=None,
+                              skiprows=1, usecols=indices, ndmin=2,
+                              encoding=None)
+        for column, index in enumerate(indices):
+            columns[index] = data[:, column]
+    return {header: columns[i] for i, header in enumerate(headers)}
+
+def to_float(entry):
+    try:
+        return float(entry)
+    except ValueError:
+        return entry
+
+# NumPy's binary files are memory-mapped rather than read so that only
+# the parts of a large dataset that a diagram uses are loaded.  The
+# fields of a structured array in a .npy file, or the columns of a
+# two-dimensional array named by @columns, appear in a dictionary just
+# like the columns of a CSV file, as do the arrays in a .npz file.
+# Other .npy arrays are entered as they are.  Since the arrays are
+# read-only, the same arrays are shared by every diagram.
+numpy_cache = {}
+
+def load_numpy(element, diagram, filename, name, filetype):
+    stat = os.stat(filename)
+    key = (os.path.abspath(filename), stat.st_mtime_ns, stat.st_size)
+    data = numpy_cache.get(key)
+    metrics.cache_lookup('numpy', data is not None)
+    if data is None:
+        try:
+            if filetype == 'npy':
+                data = np.load(filename, mmap_mode='r')
+            else:
+                data = load_npz(filename)
+        except (OSError, ValueError, zipfile.BadZipFile) as e:
+            log.error(f"Unable to read {filename}: {e}")
+            return
+        numpy_cache[key] = data
+
+    if filetype == 'npy':
+        columns = element.get('columns', None)
+        if data.dtype.names is not None:
+            data = {field: data[field] for field in data.dtype.names}
+        elif columns is not None:
+            columns = un.valid_eval(columns)
+            if data.ndim != 2 or data.shape[1] != len(columns):
+                log.error(f"@columns in <read> should name each column of the array in {filename}")
+                return
+            data = {column: data[:, i] for i, column in enumerate(columns)}
+    un.enter_namespace(name, data)
+
+# np.load doesn't memory-map the arrays in a .npz file, but an array
+# that's stored in the archive without compression is a .npy file at a
+# known offset, which can be.  Compressed arrays are read in full.
+def load_npz(filename):
+    arrays = {}
+    with zipfile.ZipFile(filename) as archive, open(filename, 'rb') as file:
+        for info in archive.infolist():
+            array_name = info.filename
+            if array_name.endswith('.npy'):
+                array_name = array_name[:-4]
+            array = None
+            if info.compress_type == zipfile.ZIP_STORED:
+                array = npz_memmap(filename, file, info)
+            if array is None:
+                with archive.open(info) as member:
+                    array = np.lib.format.read_array(member)
+                array.flags.writeable = False
+            arrays[array_name] = array
+    return arrays
+
+def npz_memmap(filename, file, info):
+    # the local file header is 30 bytes followed by the name and extra field
+    file.seek(info.header_offset)
+    header = file.read(30)
+    name_length = int.from_bytes(header[26:28], 'little')
+    extra_length = int.from_bytes(header[28:30], 'little')
+    file.seek(info.header_offset + 30 + name_length + extra_length)
+
+    version = np.lib.format.read_magic(file)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(file)
+    elif version == (2, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(file)
+    else:
+        return None
+    if dtype.hasobject:
+        return None
+    return np.memmap(filename, dtype=dtype, mode='r', shape=shape,
+                     order='F' if fortran_order else 'C',
+                     offset=file.tell())
@@ -1,12 +1,12 @@
 import lxml.etree as ET
 import logging
 from . import user_namespace as un
+from . import utilities
 import copy
 import re
 import numpy as np
 from . import group
 from . import label
-from . import utilities
 
 log = logging.getLogger('prefigure')
 
@@ -66,8 +66,7 @@ def repeat(element, diagram, parent, outline_group):
 
     for num, k in enumerate(iterator):
         if isinstance(k, np.ndarray):
-            k_str = utilities.pt2long_str(k, spacer=",")
-            k_str = "("+k_str+",)"
+            k_str = un.value_token(utilities.long_value(k))
         else:
             k_str = str(k)
 
@@ -6,6 +6,7 @@ import numpy as np
 import re
 import logging
 from . import user_namespace as un
+from . import metrics
 from . import utilities as util
 from . import math_utilities as math_util
 from . import tags
@@ -28,6 +29,16 @@ allowed_shapes = {
     'spline'
 }
 
+# Curves in a shape's path are replaced by line segments before shapely
+# works with them.  Each quadratic or cubic Bezier segment is divided
+# into enough pieces that no piece is further than the tolerance, in
+# SVG units, from the curve.  By Wang's formula, a Bezier of degree d
+# with control points P_i is within the tolerance of a chord
+# subdivision into n pieces when
+#     n >= sqrt(d(d-1)/8 * max |P_i - 2P_{i+1} + P_{i+2}| / tolerance)
+# so small curves are divided into few pieces and large ones into many.
+default_tolerance = 0.1
+
 def define(element, diagram, parent, outline_group):
     for child in element:
         if child.tag not in allowed_shapes:
@@ -54,7 +65,32 @@ def define(element, diagram, parent, outline_group):
         shape.attrib.pop('fill', None)
         shape.attrib.pop('stroke-width', None)
         diagram.add_shape(shape)
-    
+
+        # a shape defined by an operation keeps the geometry the
+        # operation produced so that later operations don't need to
+        # rebuild it from its path
+        geometry = diagram.get_source_data(child, 'geometry')
+        if geometry is not None:
+            diagram.shape_geometries[shape.get('id')] = (geometry, True)
+
+# The shapely geometry of a defined shape is built from its path the
+# first time an operation needs it and is then kept in the diagram's
+# shape registry, along with whether it is valid, for the rest of the build.
+def shape_geometry(diagram, ref, style=None, tolerance=default_tolerance):
+    # a shape defined by an operation has a single geometry
+    key = ref
+    if key not in diagram.shape_geometries:
+        key = (ref, style, tolerance)
+    entry = diagram.shape_geometries.get(key, None)
+    metrics.cache_lookup('shape-geometries', entry is not None)
+    if entry is None:
+        geometry = build_shapely_geom(diagram.recall_shape(ref).get('d'),
+                                      tolerance=tolerance,
+                                      style=style)
+        entry = (geometry, geometry.is_valid)
+        diagram.shape_geometries[key] = entry
+    return entry
+
 
 # Process a shape tag
 def shape(element, diagram, parent, outline_group):
@@ -72,11 +108,14 @@ def shape(element, diagram, parent, outline_group):
         shape_edit.append(shape_ref)
     shape_refs = shape_edit
     shapes = []
+    found_refs = []
     for ref in shape_refs:
         shapes.append(diagram.recall_shape(ref))
         if shapes[-1] is None:
             log.error(f"{ref} is not a reference to a shape")
             shapes.pop(-1)
+        else:
+            found_refs.append(ref)
 
     operation = element.get('operation', None)
     if operation is None: 
@@ -88,62 +127,32 @@ def shape(element, diagram, parent, outline_group):
             path.set('href', r'#' + reference)
 
     if operation is not None:
-        paths = [shape.get('d') for shape in shapes]
-        style = None
-        if operation == 'convex-hull':
-            style = 'linestring'
+        # shapes in <define-shapes> don't otherwise see the defaults
+        diagram.apply_defaults('shape', element)
+        try:
+            tolerance = float(un.valid_eval(
+                element.get('tolerance', str(default_tolerance))
+            ))
+        except:
+            log.error(f"Error in <shape> defining tolerance={element.get('tolerance')}")
+            return
+        if tolerance <= 0:
+            log.error(f"@tolerance in <shape> should be positive")
+            return
 
-        log.info(f"Applying shape operation {operation}")
-        geometries = [build_shapely_geom(path,style=style) for path in paths]
-        for geom, ref in zip(geometries, shape_refs):
-            if not geom.is_valid:
-                log.error(f"The shape {ref} is not a valid shapely geometry")
-                log.error(f"  Perhaps it is not defined by a simple curve")
-                log.error(f"  See the shapely documentation for the operation: {operation}")
+        # the same operation on the same shapes gives the same path
+        key = (operation, tuple(found_refs), tolerance)
+        cached = diagram.shape_operations.get(key, None)
+        metrics.cache_lookup('shape-operations', cached is not None)
+        if cached is None:
+            cached = apply_operation(operation, shapes, found_refs,
+                                     tolerance, diagram, reference)
+            if cached is None:
                 return
-        if operation == 'intersection':
-            if len(paths) < 2:
-                log.error('Intersections require more than one shape')
-                return
-            result = shapely.intersection_all(geometries)
-        if operation == 'union':
-            if len(paths) < 2:
-                log.error('Unions require more than one shape')
-                return
-            result = shapely.union_all(geometries)
-        if operation == 'difference':
-            if len(paths) != 2:
-                log.error('Differences require exactly two shapes')
-                return
-            result = shapely.difference(geometries[0],
-                                        geometries[1])
-        if (operation == 'symmetric-difference' or
-            operation == 'sym-diff'):
-            if len(paths) < 2:
-                log.error('Symmetric differences require more than one shape')
-                return
-            result = shapely.symmetric_difference_all(geometries)
-            operation = 'symmetric difference'
-        if operation == 'convex-hull':
-            if len(paths) > 1:
-                geometries = shapely.union_all(geometries)
-            result = shapely.convex_hull(geometries)
-            operation = 'convex hull'
-            
-        if shapely.is_empty(result):
-            log.warning(f"The {operation} defined by {reference} is empty")
-            return
+            diagram.shape_operations[key] = cached
+        result, d = cached
+        diagram.register_source_data(element, 'geometry', result)
 
-        if isinstance(result, shapely.MultiPolygon):
-            d = ''
-            for polygon in list(result.geoms):
-                if len(d) > 0: d+= ' '
-                d += cleanup_str(ET.fromstring(polygon.svg()).get('d'))
-        else:
-            if isinstance(result, np.ndarray):
-                result=result[0]
-            d = cleanup_str(ET.fromstring(result.svg()).get('d'))
-    
         path = ET.SubElement(parent, 'path')
         path.set('d', d)
 
@@ -172,6 +181,69 @@ def shape(element, diagram, parent, outline_group):
     else:
         parent.append(path)
         
+# Apply a shape operation and return the resulting geometry along with
+# the path that describes it or None if there is no result
+def apply_operation(operation, shapes, shape_refs, tolerance,
+                    diagram, reference):
+    style = None
+    if operation == 'convex-hull':
+        style = 'linestring'
+
+    log.info(f"Applying shape operation {operation}")
+    entries = [shape_geometry(diagram, ref, style=style,
+                              tolerance=tolerance)
+               for ref in shape_refs]
+    for (geom, valid), ref in zip(entries, shape_refs):
+        if not valid:
+            log.error(f"The shape {ref} is not a valid shapely geometry")
+            log.error(f"  Perhaps it is not defined by a simple curve")
+            log.error(f"  See the shapely documentation for the operation: {operation}")
+            return None
+    geometries = np.array([geom for geom, valid in entries])
+    if operation == 'intersection':
+        if len(shapes) < 2:
+            log.error('Intersections require more than one shape')
+            return None
+        result = shapely.intersection_all(geometries)
+    if operation == 'union':
+        if len(shapes) < 2:
+            log.error('Unions require more than one shape')
+            return None
+        result = shapely.union_all(geometries)
+    if operation == 'difference':
+        if len(shapes) != 2:
+            log.error('Differences require exactly two shapes')
+            return None
+        result = shapely.difference(geometries[0],
+                                    geometries[1])
+    if (operation == 'symmetric-difference' or
+        operation == 'sym-diff'):
+        if len(shapes) < 2:
+            log.error('Symmetric differences require more than one shape')
+            return None
+        result = shapely.symmetric_difference_all(geometries)
+        operation = 'symmetric difference'
+    if operation == 'convex-hull':
+        if len(shapes) > 1:
+            geometries = shapely.union_all(geometries)
+        result = shapely.convex_hull(geometries)
+        operation = 'convex hull'
+
+    if isinstance(result, np.ndarray):
+        result = result[0]
+    if shapely.is_empty(result):
+        log.warning(f"The {operation} defined by {reference} is empty")
+        return None
+
+    if isinstance(result, shapely.MultiPolygon):
+        d = ''
+        for polygon in list(result.geoms):
+            if len(d) > 0: d+= ' '
+            d += cleanup_str(ET.fromstring(polygon.svg()).get('d'))
+    else:
+        d = cleanup_str(ET.fromstring(result.svg()).get('d'))
+    return result, d
+
 def finish_outline(element, diagram, parent):
     diagram.finish_outline(element,
                            element.get('stroke'),
@@ -180,37 +252,56 @@ def finish_outline(element, diagram, parent):
                            parent)
 
     
-def build_shapely_geom(path, N=30, style=None):
-    polygons = []
-    points = []
-    tokens = path.split()
+# the commands and numbers in a path
+number_re = re.compile(r'[A-Za-z]|[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?')
+
+def build_shapely_geom(path, tolerance=default_tolerance, style=None):
+    # first gather the pieces of each subpath along with the control
+    # points of every Bezier segment so that they may all be flattened
+    # together
+    tokens = number_re.findall(path)
+    subpaths = []
+    pieces = []
+    curves = {2: [], 3: []}
+    def next_point():
+        return [float(tokens.pop()), float(tokens.pop())]
+    tokens.reverse()
+    current = None
     while len(tokens) > 0:
-        token = tokens.pop(0)
+        token = tokens.pop()
         if token.upper() == 'M' or token.upper() == 'L':
-            points.append(build_point(tokens.pop(0), tokens.pop(0)))
-            continue
-        if token.upper() == 'Q':
-            p0 = points[-1]
-            p1 = build_point(tokens.pop(0), tokens.pop(0))
-            p2 = build_point(tokens.pop(0), tokens.pop(0))
-            points += quad_bezier(p0, p1, p2, N)
+            current = next_point()
+            pieces.append(('point', current))
             continue
-        if token.upper() == 'C':
-            p0 = points[-1]
-            p1 = build_point(tokens.pop(0), tokens.pop(0))
-            p2 = build_point(tokens.pop(0), tokens.pop(0))
-            p3 = build_point(tokens.pop(0), tokens.pop(0))
-            points += cubic_bezier(p0, p1, p2, p3, N)
+        if token.upper() == 'Q' or token.upper() == 'C':
+            degree = 2 if token.upper() == 'Q' else 3
+            controls = [current] + [next_point() for _ in range(degree)]
+            pieces.append((degree, len(curves[degree])))
+            curves[degree].append(controls)
+            current = controls[-1]
             continue
         if token.upper() == 'Z':
-            if style is None:
-                polygons.append(shapely.Polygon(points))
-            else:
-                polygons.append(shapely.LineString(points))
-            points = []
+            subpaths.append(pieces)
+            pieces = []
             continue
         log.warning(f"Unrecognized token {token} when building shapely geometry")
-    if len(points) > 0:
+    if len(pieces) > 0:
+        subpaths.append(pieces)
+
+    flattened = {degree: flatten(controls, tolerance)
+                 for degree, controls in curves.items()
+                 if len(controls) > 0}
+
+    polygons = []
+    for pieces in subpaths:
+        points = []
+        for kind, value in pieces:
+            if kind == 'point':
+                points.append([value])
+            else:
+                curve_points, offsets = flattened[kind]
+                points.append(curve_points[offsets[value]:offsets[value+1]])
+        points = np.concatenate(points)
         if style is None:
             polygons.append(shapely.Polygon(points))
         else:
@@ -219,28 +310,30 @@ def build_shapely_geom(path, N=30, style=None):
         return shapely.MultiPolygon(polygons)
     return shapely.MultiLineString(polygons)
 
-def build_point(s0, s1):
-    return [float(s) for s in [s0,s1]]
-
-def quad_bezier(p0, p1, p2, N):
-    p0, p1, p2 = [np.array(p) for p in [p0,p1,p2]]
-    points = []
-    t = 0
-    dt = 1/N
-    for _ in range(N+1):
-        points.append((1-t)**2*p0 + 2*t*(1-t)*p1 + t**2*p2)
-        t += dt
-    return points
+# Flatten an array of Bezier segments, all of the same degree, given by
+# their control points.  We return the points on all the segments,
+# leaving out the first point of each, and the offsets into those
+# points where each segment begins.
+def flatten(controls, tolerance):
+    controls = np.array(controls, dtype=float)
+    degree = controls.shape[1] - 1
+    second = controls[:, 2:] - 2*controls[:, 1:-1] + controls[:, :-2]
+    size = np.max(np.linalg.norm(second, axis=2), axis=1)
+    counts = np.ceil(np.sqrt(degree*(degree-1)/8 * size / tolerance))
+    counts = np.maximum(counts, 1).astype(int)
 
-def cubic_bezier(p0, p1, p2, p3, N):
-    p0, p1, p2, p3 = [np.array(p) for p in [p0,p1,p2,p3]]
-    points = []
-    t = 0
-    dt = 1/N
-    for _ in range(N+1):
-        points.append((1-t)**3*p0 + 3*t*(1-t)**2*p1 + 3*t**2*(1-t)*p2+t**3*p3)
-        t += dt
-    return points
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+    segment = np.repeat(np.arange(len(controls)), counts)
+    t = (np.arange(offsets[-1]) - offsets[segment] + 1) / counts[segment]
+    t = t[:, None]
+    s = 1 - t
+    c = controls[segment]
+    if degree == 2:
+        points = s**2*c[:, 0] + 2*s*t*c[:, 1] + t**2*c[:, 2]
+    else:
+        points = (s**3*c[:, 0] + 3*s**2*t*c[:, 1] +
+                  3*s*t**2*c[:, 2] + t**3*c[:, 3])
+    return points, offsets
 
 def cleanup_str(string):
     tokens = []
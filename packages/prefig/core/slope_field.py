@@ -61,15 +61,41 @@ def slope_field(element, diagram, parent, outline_group):
         rx = grid_axes.find_gridspacing((bbox[0], bbox[2]))
         ry = grid_axes.find_gridspacing((bbox[1], bbox[3]))
 
+    lines = diagram.get_source_data(element, 'prefetched')
+    if lines is None:
+        lines = field_lines(f, rx, ry, system)
+    for p1, p2 in lines:
+        line = copy.deepcopy(line_template)
+        utilities.set_long_value(line, 'p1', p1)
+        utilities.set_long_value(line, 'p2', p2)
+        element.append(line)
+
+    group.group(element, diagram, parent, outline_group)
+
+# Find the endpoints of the lines in a slope field.  This is the
+# expensive part of a slope field and may be done in another process
+# in a parallel build.
+def find_lines(element, diagram):
+    f = un.valid_eval(element.get('function'))
+    system = element.get('system', None) == 'yes'
+    spacings = element.get('spacings', None)
+    if spacings is not None:
+        rx, ry = un.valid_eval(spacings)
+    else:
+        bbox = diagram.bbox()
+        rx = grid_axes.find_gridspacing((bbox[0], bbox[2]))
+        ry = grid_axes.find_gridspacing((bbox[1], bbox[3]))
+    return field_lines(f, rx, ry, system)
+
+def field_lines(f, rx, ry, system):
+    lines = []
     x = rx[0]
     while x <= rx[2]:
         y = ry[0]
         while y <= ry[2]:
-            line = copy.deepcopy(line_template)
             if system:
                 change = f(0, [x,y])
-                if math_util.length(change) > 1e-05:
-                    element.append(line)
+                include = math_util.length(change) > 1e-05
                 if abs(change[0]) < 1e-08:
                     dx = 0
                     dy = ry[1]/4
@@ -86,6 +112,7 @@ def slope_field(element, diagram, parent, outline_group):
                         dx *= -1
                         dy *= -1
             else:
+                include = True
                 dx = None
                 try:
                     slope = f(x,y)
@@ -101,17 +128,11 @@ def slope_field(element, diagram, parent, outline_group):
                     if dx < 0:
                         dx *= -1
                         dy *= -1
-                element.append(line)
-            x0 = x - dx
-            x1 = x + dx
-            y0 = y - dy
-            y1 = y + dy
-            line.set('p1', utilities.pt2long_str((x0,y0), spacer=','))
-            line.set('p2', utilities.pt2long_str((x1,y1), spacer=','))
+            if include:
+                lines.append(((x - dx, y - dy), (x + dx, y + dy)))
             y += ry[1]
         x += rx[1]
-
-    group.group(element, diagram, parent, outline_group)
+    return lines
 
 # Add a graphical element for slope fields
 def vector_field(element, diagram, parent, outline_group):
@@ -242,8 +263,8 @@ def vector_field(element, diagram, parent, outline_group):
             continue
 
         line_el = copy.deepcopy(line_template)
-        line_el.set('p1', utilities.pt2long_str(tail, spacer=','))
-        line_el.set('p2', utilities.pt2long_str(tip, spacer=','))
+        utilities.set_long_value(line_el, 'p1', tail)
+        utilities.set_long_value(line_el, 'p2', tip)
         element.append(line_el)
 
     group.group(element, diagram, parent, outline_group)
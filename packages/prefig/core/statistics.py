@@ -5,6 +5,7 @@ import scipy.ndimage
 from . import user_namespace as un
 from . import math_utilities as math_util
 from . import tags
+from . import decimate
 
 import logging
 log = logging.getLogger('prefigure')
@@ -41,6 +42,7 @@ def scatter(element, diagram, parent, outline_group):
             log.error("A <scatter> needs with a @data or @points attribute")
             return
         points = un.valid_eval(pts)
+    points = decimate.decimate(element, diagram, points)
     un.enter_namespace('__scatter_points', points)
 
     point_element = copy.deepcopy(element)
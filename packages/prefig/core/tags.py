@@ -86,6 +86,16 @@ tag_dict = {
     'vector-field': slope_field.vector_field
 }
 
+# this dictionary associates tags to a function performing the
+#   expensive work of an element, which may be done in another process
+#   with a parallel build.  See parallel.py
+
+task_dict = {
+    'contour': implicit.find_segments,
+    'implicit-curve': implicit.find_segments,
+    'slope-field': slope_field.find_lines
+}
+
 log = logging.getLogger('prefigure')
 
 try:
@@ -95,9 +105,16 @@ try:
     tag_dict['de-solve'] = diffeqs.de_solve
     tag_dict['define-shapes'] = shape.define
     tag_dict['network'] = network.network
+    # only created by a <network> in bulk mode
+    tag_dict['network-edges'] = network.network_edges
+    tag_dict['network-nodes'] = network.network_nodes
     tag_dict['poset'] = network.poset
     tag_dict['plot-de-solution'] = diffeqs.plot_de_solution
+    tag_dict['plot-de-solutions'] = diffeqs.plot_de_solutions
     tag_dict['shape'] = shape.shape
+    task_dict['de-solve'] = diffeqs.find_solution
+    task_dict['network'] = network.find_layout
+    task_dict['plot-de-solution'] = diffeqs.find_solution
 except:
     log.info("Unable to work with differential equations, networks, and shapes")
     log.info("Most likely we are working in a wasm environment")
@@ -139,4 +156,8 @@ def parse_element(element, diagram, root, outline_group = None):
 
         log.debug(msg)
 
+    profiler = diagram.get_profiler()
+    if profiler is not None:
+        profiler.run(function, element, diagram, root, outline_group)
+        return
     function(element, diagram, root, outline_group)
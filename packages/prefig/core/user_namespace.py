@@ -17,8 +17,49 @@ from .math_utilities import *
 logger = logging.getLogger('prefigure')
 
 inf = np.inf
-__breaks = None
-__delta_on = False
+
+# When a build is profiled, this is a dictionary counting the expressions
+# evaluated and the calls made to author-defined functions
+evaluation_counter = None
+
+# With parallel builds, we need to know which names in the namespace
+# are written and which names author-defined functions read.  When
+# write_log is a list, each name written is appended to it, and
+# dependencies records the names used in the body of each function.
+write_log = None
+dependencies = {}
+
+def record_write(name, depends_on=None):
+    if write_log is not None:
+        write_log.append(name)
+    if depends_on is None:
+        dependencies.pop(name, None)
+    else:
+        dependencies[name] = depends_on
+
+# Find the names used in an expression
+def names_in(expr):
+    try:
+        tree = ast.parse(expr, mode='eval')
+    except (SyntaxError, ValueError):
+        return set()
+    return {node.id for node in ast.walk(tree) if isinstance(node, ast.Name)}
+
+# Elements that generate other elements can give them values directly
+# rather than writing the values into attribute strings that would be
+# parsed and evaluated again.  value_token enters a value into the
+# namespace under a new name, which is placed in the attribute, and
+# valid_eval returns the value without parsing when it meets that name.
+# Since the value travels with the attribute, it survives copies made
+# by <repeat> and the name can also appear in a larger expression.
+typed_values = {}
+
+def value_token(value):
+    token = f'__value_{len(typed_values)}'
+    typed_values[token] = value
+    globals()[token] = value
+    variables.add(token)
+    return token
 
 # Record built-in python functions and constants as allowed
 functions = {x for x in dir(math) + dir(math_utilities) if not "__" in x}.difference({'e', 'pi'})
@@ -116,6 +157,14 @@ def valid_eval(s, name=None, substitution=True):
     if s is None:
         logger.error(f"Evaluating an empty object.")
         raise SyntaxError(f'Evaluating an empty object.  Perhaps there is a required attribute that is missing')
+    if s in typed_values:
+        value = typed_values[s]
+        # each element receives its own copy as it would from parsing
+        if isinstance(value, np.ndarray):
+            value = value.copy()
+        if name is not None:
+            enter_namespace(name, value)
+        return value
     if substitution:
         s = s.replace('^', '**')
     equal = s.find('=')
@@ -145,7 +194,9 @@ def valid_eval(s, name=None, substitution=True):
             cmd = 'lambda ' + args + ': ' + expr
             functions.add(name)
             variables.add(name)
-            globals()[name] = transform_eval(cmd)
+            globals()[name] = count_calls(transform_eval(cmd))
+            arguments = {arg.strip() for arg in args.split(',')}
+            record_write(name, names_in(expr).difference(arguments))
             return globals()[name]
         else:
             logger.error(f"Unsafe function definition: {expr}")
@@ -153,11 +204,14 @@ def valid_eval(s, name=None, substitution=True):
         return
     # otherwise, it's just an expression
     else:
+        if evaluation_counter is not None:
+            evaluation_counter['expressions'] += 1
         if validate(s):
             value = transform_eval(s)
             if name is not None:
                 variables.add(name)
                 globals()[name] = value
+                record_write(name)
             return value
         else:
             logger.error(f"Unsafe definition: {s}")
@@ -175,6 +229,17 @@ def define(expression, substitution=True):
     else:
         valid_eval(right, left, substitution=substitution)
 
+# wrap an author-defined function so that its calls are counted
+# when the build is being profiled
+def count_calls(f):
+    if evaluation_counter is None:
+        return f
+    counter = evaluation_counter
+    def counted(*args):
+        counter['function-calls'] += 1
+        return f(*args)
+    return counted
+
 # retrieves and evaluates an author-defined function
 def evaluate(function, a):
     return globals()[function](a)
@@ -184,37 +249,18 @@ def derivative(f, name):
     globals()[name] = lambda x: calculus.derivative(f, x)
     functions.add(name)
     variables.add(name)
+    record_write(name)
 
 def enter_function(name, f):
     globals()[name] = f
     functions.add(name)
     variables.add(name)
+    record_write(name)
 
 def enter_namespace(name, value):
     globals()[name] = value
     variables.add(name)
+    record_write(name)
 
 def retrieve(name):
     return globals()[name]
-
-def initialize_breaks():
-    global __breaks
-    __breaks = []
-
-def finish_breaks():
-    global __breaks
-    __breaks = None
-
-def measure_de_jump(f, t, y):
-    globals()['__delta_on'] = True
-    f1 = f(t, y)
-    globals()['__delta_on'] = False
-    f0 = f(t, y)
-    return f1 - f0
-
-def find_breaks(f, t, y):
-    initialize_breaks()
-    f(t, y)
-    breaks = __breaks
-    finish_breaks()
-    return breaks
@@ -103,14 +103,50 @@ def cliptobbox(g_element, element, diagram):
     id = diagram.get_clippath()
     g_element.set('clip-path', r'url(#{})'.format(id))
 
+# Coordinates are written into the SVG with one digit after the
+# decimal point unless set_precision asks for another number of digits.
+# Compact output also drops trailing zeros and a leading zero.
+precision = 1
+float_format = "%.1f"
+trim_numbers = False
+
+def set_precision(digits=None, trim=False):
+    global precision, float_format, trim_numbers
+    if digits is None:
+        digits = 1
+    precision = int(digits)
+    float_format = "%." + str(precision) + "f"
+    trim_numbers = trim
+
+def trim_number(text):
+    if '.' in text:
+        text = text.rstrip('0').rstrip('.')
+    if text.startswith('0.'):
+        return text[1:]
+    if text.startswith('-0.'):
+        return '-' + text[2:]
+    if text == '-0':
+        return '0'
+    return text
+
+# Give an element a value for an attribute without formatting it as a
+# string.  See user_namespace.value_token
+def set_value(element, attr, value):
+    element.set(attr, un.value_token(value))
+
 def float2str(x):
-    return "%.1f" % x
+    if trim_numbers:
+        return trim_number(float_format % x)
+    return float_format % x
 
 def float2longstr(x):
     return "%.4f" % x
 
 def pt2str(p, spacer = ' ', paren=False):
-    text = spacer.join(["%.1f" % c for c in p])
+    if trim_numbers:
+        text = spacer.join([trim_number(float_format % c) for c in p])
+    else:
+        text = spacer.join([float_format % c for c in p])
     if paren:
         return '('+text+')'
     return text
@@ -118,5 +154,14 @@ def pt2str(p, spacer = ' ', paren=False):
 def pt2long_str(p, spacer = ' '):
     return spacer.join(["%.4f" % c for c in p])
 
+# The coordinates that generated elements once received as strings
+# from pt2long_str keep its four decimal places as typed values
+def long_value(p):
+    p = np.asarray(p, dtype=float)
+    return np.array([float("%.4f" % c) for c in p.ravel()]).reshape(p.shape)
+
+def set_long_value(element, attr, p):
+    set_value(element, attr, long_value(p))
+
 def np2str(p):
-    return pt2str(p, spacer=',', paren=True)
+    return '(' + ','.join(["%.1f" % c for c in p]) + ')'
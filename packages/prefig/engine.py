@@ -29,14 +29,39 @@ if ptx_log_name in logging.Logger.manager.loggerDict:
 
 
 # we make the default environment pretext so we don't need to change
-# the call from within pretext
+# the call from within pretext.
+# With profile=True, the cost of each element is written to
+# output/<name>-profile.json and output/<name>-profile.folded and, if
+# profile_report is a list, a table of the most expensive elements is
+# appended to it.
+# With metrics=True, build returns the filename together with a list
+# holding a dictionary for each diagram built, which records the time
+# spent in each phase of the build, the number of labels, the time spent
+# in MathJax, the bytes written, and cache hit rates.  Otherwise, only
+# the filename is returned.  Peak memory is included when
+# trace_memory=True.  If metrics_file is given, each record is also
+# appended to that file as a line of JSON.
+# braille_cache names a file in which braille translations are kept
+# between builds of tactile diagrams and layout_cache a file in which
+# network layouts are kept between builds.  With parallel=N, the
+# expensive work of some elements is done in a pool of N processes.
 def build(
         format,
         filename,
         publication=None,
         ignore_publication=False,
         suppress_caption=False,
-        environment="pretext"
+        environment="pretext",
+        profile=False,
+        profile_report=None,
+        metrics=False,
+        trace_memory=False,
+        metrics_file=None,
+        braille_cache=None,
+        layout_cache=None,
+        compact=False,
+        precision=None,
+        parallel=None
 ):
     pub_requested = not ignore_publication and publication is not None
     path = Path(filename)
@@ -71,11 +96,53 @@ def build(
 
     log.info(f"Building from PreFigure source {filename}")
 
-    core.parse.parse(filename,
-                     format,
-                     publication,
-                     suppress_caption,
-                     environment)
+    # a profile records the cost of each element in the diagram
+    profiler = None
+    if profile:
+        profiler = core.profile.BuildProfiler()
+
+    records = None
+    if metrics or trace_memory or metrics_file is not None:
+        records = []
+
+    if braille_cache is not None:
+        core.label_tools.load_braille_cache(braille_cache)
+    if layout_cache is not None:
+        core.network.load_layout_cache(layout_cache)
+
+    # parallel and compact output apply only to this build, even if it fails
+    core.parallel.init(parallel)
+    core.compact.init(compact, precision)
+    try:
+        core.parse.parse(filename,
+                         format,
+                         publication,
+                         suppress_caption,
+                         environment,
+                         profiler=profiler,
+                         metrics_records=records,
+                         trace_memory=trace_memory)
+    finally:
+        core.parallel.init()
+        core.compact.init()
+
+    if braille_cache is not None:
+        core.label_tools.save_braille_cache()
+    if layout_cache is not None:
+        core.network.save_layout_cache()
+
+    if profiler is not None:
+        path = Path(filename)
+        out = path.parent / 'output' / path.stem
+        profiler.write(str(out))
+        if profile_report is not None:
+            profile_report.append(profiler.report())
+
+    if metrics_file is not None:
+        for record in records:
+            core.metrics.write_record(record, metrics_file)
+    if metrics:
+        return filename, records
     return filename
 
 
@@ -0,0 +1,55 @@
+"""Braille translation cache (``prefig build --braille-cache``) tests.
+
+Checks that the translation cache survives a round trip through a cache file
+and, when liblouis is installed, that a cached translation is the same as one
+made directly by liblouis and is counted as a single miss followed by hits.
+"""
+
+import pytest
+
+from helpers.build_helper import temp_workdir
+
+
+def test_cache_file_round_trip():
+    from prefig.core import label_tools
+
+    saved = dict(label_tools.braille_cache)
+    key = ("x-axis", (0,) * 6, label_tools.braille_table)
+    try:
+        label_tools.braille_cache.clear()
+        label_tools.braille_cache[key] = "⠭⠤⠁⠭⠊⠎"
+        label_tools.braille_cache_changed = True
+        with temp_workdir("test_braille_cache") as workdir:
+            cache_file = workdir / "braille.json"
+            cache_file.unlink(missing_ok=True)
+            label_tools.load_braille_cache(str(cache_file))
+            label_tools.save_braille_cache()
+            assert not label_tools.braille_cache_changed
+            label_tools.braille_cache.clear()
+            label_tools.load_braille_cache(str(cache_file))
+        assert label_tools.braille_cache == {key: "⠭⠤⠁⠭⠊⠎"}
+    finally:
+        label_tools.braille_cache_file = None
+        label_tools.braille_cache.clear()
+        label_tools.braille_cache.update(saved)
+
+
+def test_cached_translation_matches_liblouis():
+    louis = pytest.importorskip("louis")
+    from prefig.core import label_tools, metrics
+
+    translator = label_tools.LocalLouisBrailleTranslator()
+    build_metrics = metrics.BuildMetrics()
+    build_metrics.begin()
+    metrics.activate(build_metrics)
+    try:
+        label_tools.braille_cache.clear()
+        for text, typeform in [("Time in seconds", [0] * 15),
+                               ("Velocity", [1] * 8)]:
+            direct = louis.translateString([label_tools.braille_table], text,
+                                           typeform=typeform).rstrip()
+            for _ in range(3):
+                assert translator.translate(text, typeform) == direct
+    finally:
+        metrics.deactivate()
+    assert build_metrics.caches["braille"] == (4, 2)
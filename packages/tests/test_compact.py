@@ -0,0 +1,149 @@
+"""Compact output (``prefig build --compact``) tests.
+
+Builds a few label-free examples with and without compact output, expands the
+compact SVG again (CSS classes back into presentation attributes, relative path
+data back into absolute commands) and checks it matches the regular output
+within tolerance, keeps every id, and is smaller. Also checks the configurable
+coordinate precision, that styles are only hoisted into rules scoped by the
+diagram's id, and that a failed build doesn't leave compact output on.
+"""
+
+import re
+from pathlib import Path
+
+import lxml.etree as ET
+import pytest
+
+from helpers.build_helper import build_diagram, pushd, temp_workdir
+from helpers.compare import compare_svgs
+
+TESTS_DIR = Path(__file__).resolve().parent
+EXAMPLES = ["arrow_def", "arc", "fill-rule", "network-tree", "poset_1", "rcl-circuit"]
+
+PATH_ARGUMENTS = {"M": 2, "L": 2, "T": 2, "H": 1, "V": 1, "C": 6, "S": 4, "Q": 4, "A": 7, "Z": 0}
+TOKEN_RE = re.compile(r"[A-Za-z]|[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+RULE_RE = re.compile(r"\.(\w+)\{([^}]*)\}")
+
+
+def _build(name, compact, precision=None):
+    from prefig.core import compact as compact_output
+
+    source = TESTS_DIR / "examples" / "extracted_from_docs" / f"{name}.xml"
+    compact_output.init(compact, precision)
+    try:
+        with pushd(source.parent):
+            svg, _ = build_diagram(source.name)
+    finally:
+        compact_output.init()
+    return svg
+
+
+def _absolute(d):
+    """Absolute path data with an explicit command letter for every segment."""
+    tokens = TOKEN_RE.findall(d)
+    current, start, output, command, i = [0, 0], [0, 0], [], None, 0
+    while i < len(tokens):
+        if tokens[i].isalpha():
+            command = tokens[i]
+            i += 1
+            if command in "Zz":
+                output.append("Z")
+                current = start
+                continue
+        name = command.upper()
+        args = [float(t) for t in tokens[i:i + PATH_ARGUMENTS[name]]]
+        i += PATH_ARGUMENTS[name]
+        if command.islower() and len(output) > 0:
+            if name == "H":
+                args = [current[0] + args[0]]
+            elif name == "V":
+                args = [current[1] + args[0]]
+            elif name == "A":
+                args[5:7] = [current[0] + args[5], current[1] + args[6]]
+            else:
+                args = [a + current[k % 2] for k, a in enumerate(args)]
+        current = {"H": lambda: [args[0], current[1]],
+                   "V": lambda: [current[0], args[0]]}.get(name, lambda: args[-2:])()
+        if name == "M":
+            start = current
+        output.append(name + " " + " ".join(repr(a) for a in args))
+        if name == "M":
+            command = "L" if command == "M" else "l"
+    return " ".join(output)
+
+
+def _expand(svg):
+    root = ET.fromstring(svg.encode())
+    styles = {}
+    for style in root.iter("{http://www.w3.org/2000/svg}style"):
+        styles.update(RULE_RE.findall(style.text))
+        style.getparent().remove(style)
+    for element in root.iter():
+        if not isinstance(element.tag, str):
+            continue
+        for name in element.get("class", "").split():
+            if name in styles:
+                for declaration in styles[name].split(";"):
+                    attr, value = declaration.split(":", 1)
+                    element.set(attr, value)
+        if element.get("class") is not None and all(n in styles for n in element.get("class").split()):
+            element.attrib.pop("class")
+        if element.tag.endswith("}path") and element.get("d") is not None:
+            element.set("d", _absolute(element.get("d")))
+    return ET.tostring(root).decode()
+
+
+@pytest.mark.parametrize("name", EXAMPLES)
+def test_compact_output_is_equivalent(name):
+    regular = _build(name, False)
+    compact = _build(name, True)
+    assert regular is not None and compact is not None
+    assert len(compact) < len(regular)
+    assert compare_svgs(_expand(compact), regular, tol=1e-3) == []
+
+    def ids(svg):
+        return [e.get("id") for e in ET.fromstring(svg.encode()).iter() if e.get("id")]
+    assert ids(compact) == ids(regular)
+
+
+def test_precision():
+    line = "{http://www.w3.org/2000/svg}line"
+    regular = ET.fromstring(_build("grid", False).encode())
+    precise = ET.fromstring(_build("grid", False, precision=3).encode())
+    x1 = [e.get("x1") for e in regular.iter(line)]
+    precise_x1 = [e.get("x1") for e in precise.iter(line)]
+    assert len(x1) > 0 and len(x1) == len(precise_x1)
+    assert all(len(v.split(".")[1]) == 1 for v in x1)
+    assert all(len(v.split(".")[1]) == 3 for v in precise_x1)
+
+
+def test_styles_hoisted_only_with_an_id():
+    from prefig.core import compact
+
+    def svg(id):
+        root = ET.Element("svg")
+        if id is not None:
+            root.set("id", id)
+        for _ in range(2):
+            ET.SubElement(root, "circle", {"stroke": "red", "fill": "none"})
+        return root
+
+    scoped = svg("figure")
+    compact.hoist_styles(scoped)
+    assert scoped[0].tag == "style" and scoped[0].text.startswith("#figure .s0{")
+    unscoped = svg(None)
+    compact.hoist_styles(unscoped)
+    assert [e.tag for e in unscoped] == ["circle", "circle"]
+    assert unscoped[0].get("stroke") == "red" and unscoped[0].get("class") is None
+
+
+def test_failed_build_resets_compact_output():
+    from prefig import engine
+    from prefig.core import compact, utilities
+
+    with temp_workdir("test_compact") as workdir, pytest.raises(OSError):
+        engine.build("svg", str(workdir / "missing.xml"),
+                     ignore_publication=True, environment="pf_cli",
+                     compact=True, precision=3)
+    assert not compact.enabled
+    assert utilities.precision == 1 and not utilities.trim_numbers
@@ -0,0 +1,65 @@
+"""``decimate`` tests for data-driven ``<polygon>`` and ``<scatter>``.
+
+Builds a long noisy time series as a polygon and as a scatter and checks that
+each decimation method reduces it to about two points per pixel of width,
+that min-max keeps the extreme values, and that short series are left alone.
+"""
+
+import re
+
+import lxml.etree as ET
+import numpy as np
+
+from helpers.build_helper import temp_workdir
+
+SVG_NS = "{http://www.w3.org/2000/svg}"
+NUMBER_RE = re.compile(r"[-+]?(?:\d+\.?\d*|\.\d+)")
+
+
+def _build(body, size=20000):
+    from prefig.core import parse
+
+    rng = np.random.default_rng(3)
+    series = np.zeros(size, dtype=[("t", float), ("y", float)])
+    series["t"] = np.linspace(0, 10, size)
+    series["y"] = np.sin(series["t"]) + rng.normal(0, 0.3, size)
+    series["y"][size // 3] = 3.5
+    source = ('<diagram dimensions="(200,100)" margins="5">'
+              f'<read name="series" filename="series-{size}.npy" type="npy"/>'
+              '<coordinates bbox="(0,-4,10,4)">'
+              f'{body}</coordinates></diagram>')
+    with temp_workdir("test_decimate"):
+        np.save(f"series-{size}.npy", series)
+        svg, _ = parse.mk_diagram(ET.fromstring(source), "svg", None,
+                                  "decimate", False, None, "pf_cli",
+                                  return_string=True)
+    return ET.fromstring(svg.encode())
+
+
+def _polygon_vertices(decimate, size=20000):
+    attribute = "" if decimate is None else f' decimate="{decimate}"'
+    root = _build('<polygon points="zip_lists(series[\'t\'], series[\'y\'])"'
+                  f'{attribute}/>', size)
+    path = [p for p in root.iter(f"{SVG_NS}path") if p.get("d").startswith("M")][-1]
+    numbers = [float(n) for n in NUMBER_RE.findall(path.get("d"))]
+    return np.array(numbers).reshape(-1, 2)
+
+
+def test_polygon_decimation():
+    full = _polygon_vertices(None)
+    assert len(full) == 20000
+    for method in ["min-max", "lttb"]:
+        vertices = _polygon_vertices(method)
+        assert len(vertices) <= 2 * 200 + 4
+        assert vertices[0].tolist() == full[0].tolist()
+        assert vertices[-1].tolist() == full[-1].tolist()
+    vertices = _polygon_vertices("min-max")
+    assert vertices[:, 1].min() == full[:, 1].min()
+    assert vertices[:, 1].max() == full[:, 1].max()
+    assert len(_polygon_vertices("lttb", size=300)) == 300
+
+
+def test_scatter_decimation():
+    root = _build('<scatter data="series" x="t" y="y" decimate="min-max"/>')
+    points = list(root.iter(f"{SVG_NS}circle"))
+    assert 200 < len(points) <= 2 * 200 + 4
@@ -0,0 +1,63 @@
+"""Preparing the source in ``Diagram.__init__``.
+
+Checks that the source is copied in the playground only when the author gives
+no annotations and isn't copied outside of the playground, that
+``<templates>`` are found and removed, and that ``true``/``false`` attributes
+are reported except inside ``<annotations>``.
+"""
+
+import logging
+
+import lxml.etree as ET
+
+SOURCE = """<diagram dimensions="(100,100)">
+<templates><point fill="green"/></templates>
+<coordinates bbox="(0,0,1,1)"><point p="(0.5,0.5)" outline="true"/></coordinates>
+{}
+</diagram>"""
+ANNOTATIONS = ('<annotations><annotation ref="figure" text="A point" '
+               'circular="false"/></annotations>')
+
+
+def _diagram(environment, annotations=""):
+    from prefig.core import diagram
+
+    element = ET.fromstring(SOURCE.format(annotations))
+    return element, diagram.Diagram(element, "source", None, "svg", None,
+                                    None, False, environment)
+
+
+def test_source_not_copied_outside_playground():
+    # the copy is made in the playground, which can't run here
+    for annotations in ["", ANNOTATIONS]:
+        _, diagram = _diagram("pf_cli", annotations)
+        assert diagram.diagram_element_copy is None
+        assert diagram.source_to_copy == {}
+
+
+def test_source_copied_in_playground():
+    element, diagram = _diagram("pyodide")
+    copy = diagram.diagram_element_copy
+    assert copy is not None and copy is not element
+    assert diagram.source_to_copy[element] is copy
+    coordinates = element.find("coordinates")
+    assert diagram.source_to_copy[coordinates] is copy.find("coordinates")
+    for source, cp in diagram.source_to_copy.items():
+        assert cp.tag == source.tag and cp is not source
+
+    # authors who give their own annotations don't need the copy
+    _, diagram = _diagram("pyodide", ANNOTATIONS)
+    assert diagram.diagram_element_copy is None
+    assert diagram.source_to_copy == {}
+
+
+def test_templates_and_warnings(caplog):
+    element, diagram = _diagram("pf_cli", ANNOTATIONS)
+
+    assert element.find("templates") is None
+    assert diagram.defaults["point"].get("fill") == "green"
+    assert diagram.author_annotations_present
+    warnings = [r.getMessage() for r in caplog.records
+                if r.levelno == logging.WARNING]
+    assert warnings == ['<point> attribute outline="true": '
+                        'PreFigure uses "yes"/"no" for boolean attributes']
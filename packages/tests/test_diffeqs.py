@@ -0,0 +1,187 @@
+"""``<de-solve>`` sweeps over ``initial-conditions`` and ``<plot-de-solutions>``.
+
+Checks that a bundle of solutions from a vectorizable right-hand side agrees
+with solving each initial condition on its own, that a right-hand side which
+can't be vectorized gives the same bundle through separate solves, forked into
+a pool of processes only in a parallel build, and that
+``<plot-de-solutions>`` draws every trajectory in one path. Also checks that a
+problem is only solved once in a build, that plots with ``resample="yes"`` are
+resampled adaptively from the dense solution, and that impulses from ``delta``
+produce the right jumps with two evaluations each, including in solves running
+in several threads.
+"""
+
+import lxml.etree as ET
+import numpy as np
+
+SVG_NS = "{http://www.w3.org/2000/svg}"
+INITIAL = [(1, 0), (2, 0), (0, 1), (0.5, 0.5), (1, 1), (-1, 0), (0, -2), (3, 0)]
+
+
+def _build(body, bbox="(-4,-4,4,4)", definitions=""):
+    from prefig.core import parse
+
+    source = ('<diagram dimensions="(200,200)" margins="5">'
+              '<definition>f(t,y) = (y[1], -y[0] - 0.2*y[1])</definition>'
+              '<definition>g(t,y) = (y[1], -max(y[0], -1) - 0.2*y[1])</definition>'
+              f'{definitions}<coordinates bbox="{bbox}">'
+              f'{body}</coordinates></diagram>')
+    svg, _ = parse.mk_diagram(ET.fromstring(source), "svg", None,
+                              "diffeqs", False, None, "pf_cli",
+                              return_string=True)
+    return ET.fromstring(svg.encode())
+
+
+def _solve(function, initial):
+    from prefig.core import diffeqs, user_namespace
+
+    return diffeqs.solve(user_namespace.retrieve(function), 0,
+                         np.array(initial, dtype=float), 6, "RK45", None).sample(50)
+
+
+def test_vectorized_sweep():
+    from prefig.core import diffeqs, user_namespace
+
+    _build('<de-solve name="sols" function="f" t0="0" t1="6" N="50" '
+           f'initial-conditions="{INITIAL}"/>')
+    f = user_namespace.retrieve("f")
+    assert diffeqs.vectorizes(f, 0, np.array(INITIAL, dtype=float))
+    sols = user_namespace.retrieve("sols")
+    assert sols.shape == (len(INITIAL), 3, 50)
+    for k, initial in enumerate(INITIAL):
+        assert np.allclose(sols[k], _solve("f", initial), atol=1e-2)
+
+
+def test_unvectorized_sweep():
+    from prefig.core import diffeqs, user_namespace
+
+    _build('<de-solve name="sols" function="g" t0="0" t1="6" N="50" '
+           f'initial-conditions="{INITIAL}"/>')
+    g = user_namespace.retrieve("g")
+    assert not diffeqs.vectorizes(g, 0, np.array(INITIAL, dtype=float))
+    sols = user_namespace.retrieve("sols")
+    for k, initial in enumerate(INITIAL):
+        assert np.array_equal(sols[k], _solve("g", initial))
+
+
+def test_sweep_pool_is_opt_in(monkeypatch):
+    import multiprocessing
+
+    from prefig.core import diffeqs, parallel, user_namespace
+
+    _build("")
+    g = user_namespace.retrieve("g")
+    initial = np.array(INITIAL, dtype=float)
+    contexts = []
+    get_context = multiprocessing.get_context
+    monkeypatch.setattr(multiprocessing, "get_context",
+                        lambda method=None: contexts.append(method) or get_context(method))
+    serial = diffeqs.solve_sweep(g, 0, initial, 6, 50, "RK45", None)
+    assert contexts == []
+
+    parallel.init(4)
+    try:
+        pooled = diffeqs.solve_sweep(g, 0, initial, 6, 50, "RK45", None)
+    finally:
+        parallel.init()
+    assert contexts == ["fork"]
+    assert np.array_equal(pooled, serial)
+
+
+def test_plot_de_solutions():
+    root = _build('<plot-de-solutions function="f" t0="0" t1="6" N="50" '
+                  f'initial-conditions="{INITIAL}" axes="(y0,y1)"/>')
+    paths = [p for p in root.iter(f"{SVG_NS}path") if p.get("stroke") == "blue"]
+    assert len(paths) == 1
+    assert paths[0].get("d").count("M") == len(INITIAL)
+
+
+def test_solutions_are_memoized():
+    from prefig.core import metrics, parse
+
+    source = ('<diagram dimensions="(200,200)" margins="5">'
+              '<definition>f(t,y) = (y[1], -y[0])</definition>'
+              '<coordinates bbox="(-4,-4,4,4)">'
+              '<de-solve name="s" function="f" t0="0" y0="(1,0)" t1="6"/>'
+              '<plot-de-solution solution="s" axes="(y0,y1)"/>'
+              '<plot-de-solution function="f" t0="0" y0="(1,0)" t1="6" axes="(y0,y1)"/>'
+              '</coordinates></diagram>')
+    build_metrics = metrics.BuildMetrics()
+    parse.mk_diagram(ET.fromstring(source), "svg", None, "diffeqs", False,
+                     None, "pf_cli", return_string=True,
+                     build_metrics=build_metrics)
+    caches = build_metrics.record()["caches"]["de-solutions"]
+    assert (caches["hits"], caches["misses"]) == (1, 1)
+
+
+def _plotted_points(attributes=""):
+    root = _build(f'<plot-de-solution function="h" t0="0" y0="0" t1="10" {attributes}/>',
+                  bbox="(0,-4,10,4)",
+                  definitions='<definition>h(t,y) = 60*cos(20*t) + 0*y</definition>')
+    path = [p for p in root.iter(f"{SVG_NS}path") if p.get("stroke") == "blue"][0]
+    numbers = [float(n) for n in path.get("d").replace("M", " ").replace("L", " ").split()]
+    return np.array(numbers).reshape(-1, 2)
+
+
+def test_adaptive_resampling():
+    from prefig.core import user_namespace
+
+    # the N points of the solution are plotted unless resampling is asked for
+    assert len(_plotted_points()) == 100
+    points = _plotted_points('resample="yes"')
+    assert user_namespace.retrieve("__de_solution").shape == (2, 100)
+    assert len(points) > 300
+    # each of the 32 peaks at y = 3 is reached even though most fall
+    # between the 100 points of the stored solution
+    peak = 5 + 200 / 8
+    assert np.sum(np.abs(points[:, 1] - peak) < 0.5) >= 32
+    assert len(_plotted_points('resample="yes" tolerance="2"')) < len(points)
+
+
+def test_impulses():
+    from concurrent.futures import ThreadPoolExecutor
+
+    from prefig.core import diffeqs, user_namespace
+
+    _build("", definitions=(
+        '<definition>p(t,y) = -y + 3*delta(t, 2) + 2*delta(t, 4)</definition>'
+        '<definition>q(t,y) = -y + 3*max(delta(t, 2), 0)</definition>'
+        '<definition>r(t,y) = -y + 3*delta(t, 2)**2</definition>'
+        '<definition>s(t,y) = -y + abs(3*delta(t, 2))</definition>'))
+
+    def solve(name):
+        return diffeqs.solve(user_namespace.retrieve(name), 0, np.array([1.0]),
+                             6, "RK45", None)
+
+    # the jumps of r and s aren't linear in their impulses
+    for name, times in [("p", [2, 4]), ("q", [2]), ("r", [2]), ("s", [2])]:
+        dense = solve(name)
+        assert [t0 for t0, t1, sol in dense.segments] == [0] + times
+        before = dense.segments[0][2](2)
+        after = dense.segments[1][2](2)
+        assert np.allclose(after - before, 3)
+
+    with ThreadPoolExecutor(4) as pool:
+        concurrent = list(pool.map(solve, ["p", "q"] * 4))
+    for name, dense in zip(["p", "q"] * 4, concurrent):
+        assert np.array_equal(dense.sample(20), solve(name).sample(20))
+
+
+def test_impulse_probes():
+    from prefig.core import impulses, user_namespace
+
+    _build("", definitions=(
+        '<definition>p(t,y) = -y + 3*delta(t, 2) + 2*delta(t, 4)</definition>'))
+    p = user_namespace.retrieve("p")
+    calls = []
+
+    def f(t, y):
+        calls.append(t)
+        return p(t, y)
+
+    schedule = impulses.ImpulseSchedule(f, 0, np.array([1.0]), 6)
+    assert schedule.times == [2, 4] and len(calls) == 1
+    # each jump costs two evaluations, with the impulses on and off
+    assert np.allclose(schedule.jump(2, np.array([1.0])), 3)
+    assert np.allclose(schedule.jump(4, np.array([1.0])), 2)
+    assert len(calls) == 5
@@ -0,0 +1,66 @@
+"""``<image>`` cache and linked-image tests.
+
+Builds an example containing a raster ``<image>`` twice and checks that the
+second build reuses the encoded image, then builds it with ``embed="no"`` and
+checks the image is referenced by its path relative to the output directory
+instead of being included, or by its ``data/`` path inside PreTeXt.  An image
+that cannot be read leaves no ``<image>`` element behind.
+"""
+
+from pathlib import Path
+
+import lxml.etree as ET
+
+from helpers.build_helper import find_publication, load_source, pushd
+
+SOURCE = Path(__file__).resolve().parent / "examples" / "extracted_from_docs" / "wasatch.xml"
+SVG_NS = "{http://www.w3.org/2000/svg}"
+
+
+def _build(embed=None, source=None, environment="pf_cli"):
+    from prefig.core import metrics, parse
+
+    build_metrics = metrics.BuildMetrics()
+    with pushd(SOURCE.parent):
+        diagram = load_source(SOURCE)
+        for image in diagram.iter("image"):
+            if embed is not None:
+                image.set("embed", embed)
+            if source is not None:
+                image.set("source", source)
+        svg, _ = parse.mk_diagram(diagram, "svg", find_publication(),
+                                  SOURCE.stem, False, None, environment,
+                                  return_string=True,
+                                  build_metrics=build_metrics)
+    image = ET.fromstring(svg.encode()).find(f".//{SVG_NS}image")
+    return image, build_metrics.record()["caches"].get("images")
+
+
+def test_encoded_images_are_cached():
+    from prefig.core import image
+
+    image.encoded_images.clear()
+    image, first = _build()
+    href = image.get("href")
+    assert href.startswith("data:image/png;base64,")
+    assert first == {"hits": 0, "misses": 1, "hit-rate": 0.0}
+    cached, second = _build()
+    assert cached.get("href") == href
+    assert second["hits"] == 1
+
+
+def test_linked_images():
+    image, caches = _build(embed="no")
+    assert image.get("href") == "../data/images/wasatch.png"
+    assert caches is None
+
+
+def test_linked_images_in_pretext():
+    image, _ = _build(embed="no", environment="pretext")
+    assert image.get("href") == "data/images/wasatch.png"
+
+
+def test_unreadable_image_is_not_added(caplog):
+    image, _ = _build(source="images/missing.png")
+    assert image is None
+    assert "Unable to read the image" in caplog.text
@@ -0,0 +1,92 @@
+"""Automatic label placement (``label-placement="auto"``) tests.
+
+Builds a crowded diagram of plain-text labels twice, with fixed and with
+automatic placement, and checks that automatic placement moves the labels so
+they overlap each other far less and stay inside the diagram, and that labels
+with an explicit alignment are left alone.  Also checks that the chosen
+alignments aren't written onto the source and that the polylines found for
+obstacles follow relative, closed, and repeated path commands.
+"""
+
+import random
+
+import lxml.etree as ET
+import shapely
+
+
+def _build(placement, extra=""):
+    from prefig.core import label_placement, parse
+
+    rng = random.Random(1)
+    labels = "".join(
+        f'<point p="({rng.uniform(-4, 4):.2f},{rng.uniform(-4, 4):.2f})"/>'
+        f'<label p="({rng.uniform(-4, 4):.2f},{rng.uniform(-4, 4):.2f})">P{k}</label>'
+        for k in range(60)
+    )
+    source = (f'<diagram dimensions="(300,300)" label-placement="{placement}">'
+              f'<coordinates bbox="(-4,-4,4,4)">'
+              f'<definition>f(x) = 3*sin(x)</definition><graph function="f"/>'
+              f'{labels}{extra}</coordinates></diagram>')
+    svg = parse.mk_diagram(ET.fromstring(source), "svg", None, "placement",
+                           False, None, "pf_cli", return_string=True)
+    assert svg is not None
+    return [label["box"] for label in label_placement.placed_labels]
+
+
+def _overlap(boxes):
+    return sum(boxes[i].intersection(boxes[j]).area
+               for i in range(len(boxes)) for j in range(i))
+
+
+def _outside(boxes):
+    bounds = shapely.box(0, 0, 300, 300)
+    return sum(box.difference(bounds).area for box in boxes)
+
+
+def test_auto_placement_reduces_overlap():
+    fixed = _build("fixed")
+    auto = _build("auto")
+    assert _overlap(auto) < 0.5 * _overlap(fixed)
+    assert _outside(auto) <= _outside(fixed)
+
+
+def test_explicit_alignment_is_kept():
+    extra = '<label p="(0,0)" alignment="sw">fixed</label>'
+    fixed = _build("fixed", extra)
+    auto = _build("auto", extra)
+    assert fixed[-1].equals(auto[-1])
+
+
+def test_alignment_not_written_to_source():
+    from prefig.core import parse
+
+    source = ET.fromstring('<diagram dimensions="(100,100)" label-placement="auto">'
+                           '<coordinates bbox="(0,0,1,1)">'
+                           '<label p="(0.5,0.5)">A</label>'
+                           '<label p="(0.5,0.5)" alignment="2">B</label>'
+                           '</coordinates></diagram>')
+    labels = list(source.iter("label"))
+    parse.mk_diagram(source, "svg", None, "placement", False, None, "pf_cli",
+                     return_string=True)
+    assert labels[0].get("alignment") is None
+    assert labels[0].get("auto-placement") is None
+    assert labels[1].get("alignment") == "2"
+
+
+def test_path_geometry():
+    from prefig.core import label_placement
+
+    def coords(d):
+        return [list(line.coords) for line in label_placement.path_geometry(d)]
+
+    # each pair of a relative command continues from the one before
+    assert coords("m 0 0 l 10 0 10 10") == [[(0, 0), (10, 0), (20, 10)]]
+    # a relative moveto after closepath starts from the subpath's start
+    assert coords("M 2 2 L 5 2 z m 1 1 l 2 0") == [
+        [(2, 2), (5, 2), (2, 2)], [(3, 3), (5, 3)]
+    ]
+    # every arc of a repeated A command is followed
+    assert coords("M 0 0 A 1 1 0 0 1 5 5 1 1 0 0 1 10 0") == [
+        [(0, 0), (5, 5), (10, 0)]
+    ]
+    assert coords("M 0 0 c 1 1 2 2 3 3 1 1 2 2 3 3")[0][-1] == (6, 6)
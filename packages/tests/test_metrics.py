@@ -0,0 +1,85 @@
+"""Build metrics (``engine.build(..., metrics=True)``) tests.
+
+Builds a label-free example with a ``BuildMetrics`` record attached and checks
+the phase timings and byte counts it reports, including when the record is
+reused for a second build, then checks that ``engine.build`` hands back one
+record per build only when asked, that the ``--metrics-file`` sink appends each
+of them, and that ``prefig build --metrics`` prints them.
+"""
+
+import json
+from pathlib import Path
+
+from helpers.build_helper import load_source, pushd, temp_workdir
+
+EXAMPLES_DIR = Path(__file__).resolve().parent / "examples"
+SOURCE = EXAMPLES_DIR / "extracted_from_docs" / "graph.xml"
+
+
+def test_metrics_record_phases():
+    from prefig.core import metrics, parse
+
+    build_metrics = metrics.BuildMetrics(trace_memory=True)
+    with pushd(SOURCE.parent):
+        svg, _ = parse.mk_diagram(load_source(SOURCE), "svg", None,
+                                  SOURCE.stem, False, None, "pf_cli",
+                                  return_string=True,
+                                  build_metrics=build_metrics)
+    record = build_metrics.record()
+    assert record["status"] == "ok"
+
+    # a second build with the same record replaces what it holds
+    with pushd(SOURCE.parent):
+        parse.mk_diagram(load_source(SOURCE), "svg", None, SOURCE.stem,
+                         False, None, "pf_cli", return_string=True,
+                         build_metrics=build_metrics)
+    again = build_metrics.record()
+    assert sum(again["phases"].values()) <= again["total"]
+    assert again["bytes-written"] == record["bytes-written"]
+    assert again["counters"] == record["counters"]
+    assert list(record["phases"]) == metrics.phases
+    assert sum(record["phases"].values()) <= record["total"]
+    assert record["bytes-written"] == len(svg.encode("utf-8"))
+    assert record["peak-memory"] > 0
+    assert record["labels"] == 0
+    # nothing is recorded once the build is over
+    assert metrics.current is None
+
+
+def test_metrics_file_appends_json_lines():
+    from prefig import engine
+
+    with temp_workdir("test_metrics") as workdir:
+        source = workdir / SOURCE.name
+        source.write_text(SOURCE.read_text())
+        metrics_file = workdir / "metrics.jsonl"
+        metrics_file.unlink(missing_ok=True)
+        for _ in range(2):
+            filename, records = engine.build("svg", str(source),
+                                             ignore_publication=True,
+                                             environment="pf_cli",
+                                             metrics=True,
+                                             metrics_file=str(metrics_file))
+        assert filename == str(source) and len(records) == 1
+        assert engine.build("svg", str(source), ignore_publication=True,
+                            environment="pf_cli") == str(source)
+        record = records[0]
+        lines = metrics_file.read_text().splitlines()
+        assert len(lines) == 2
+        assert json.loads(lines[-1])["bytes-written"] == record["bytes-written"]
+        assert record["bytes-written"] == (workdir / "output" / "graph.svg").stat().st_size
+
+
+def test_cli_prints_metrics():
+    from click.testing import CliRunner
+
+    from prefig import cli
+
+    with temp_workdir("test_metrics") as workdir:
+        source = workdir / SOURCE.name
+        source.write_text(SOURCE.read_text())
+        result = CliRunner().invoke(cli.main, ["build", "--ignore_publication",
+                                               "--metrics", str(source)])
+    assert result.exit_code == 0
+    record = json.loads(result.output.splitlines()[-1])
+    assert record["bytes-written"] > 0
@@ -0,0 +1,62 @@
+"""``<network bulk="yes">`` tests.
+
+Builds a large graph in bulk mode and checks that its edges are drawn as one
+path and its nodes as ``<use>`` references to a single marker, while edges and
+nodes with their own ``<edge>`` or ``<node>`` elements are still drawn
+individually.
+"""
+
+import lxml.etree as ET
+
+SVG_NS = "{http://www.w3.org/2000/svg}"
+XLINK_HREF = "{http://www.w3.org/1999/xlink}href"
+SIZE = 200
+GRAPH = "{" + ", ".join(f"{i}: [{(i + 1) % SIZE}, {(i + 17) % SIZE}]"
+                        for i in range(SIZE)) + "}"
+
+
+def _build(body="", graph=GRAPH):
+    from prefig.core import parse
+
+    source = ('<diagram dimensions="(300,300)" margins="5">'
+              '<coordinates bbox="(0,0,10,10)">'
+              f'<network graph="{graph}" seed="3" bulk="yes">{body}</network>'
+              '</coordinates></diagram>')
+    svg, _ = parse.mk_diagram(ET.fromstring(source), "svg", None, "network",
+                              False, None, "pf_cli", return_string=True)
+    return ET.fromstring(svg.encode())
+
+
+def _edge_paths(root):
+    return [p for p in root.iter(f"{SVG_NS}path") if p.get("stroke") == "black"
+            and p.get("fill") == "none"]
+
+
+def test_bulk_network():
+    root = _build()
+    paths = _edge_paths(root)
+    assert len(paths) == 1
+    assert paths[0].get("d").count("M") == 2 * SIZE
+    uses = list(root.iter(f"{SVG_NS}use"))
+    assert len(uses) == SIZE
+    hrefs = {use.get("href", use.get(XLINK_HREF)) for use in uses}
+    assert len(hrefs) == 1
+    marker = root.find(f".//{SVG_NS}defs/*[@id='{hrefs.pop()[1:]}']")
+    assert marker is not None
+
+
+def test_decorated_elements_are_drawn_individually():
+    root = _build('<edge vertices="(0,1)" stroke="red"/><node at="5" fill="blue"/>')
+    paths = _edge_paths(root)
+    assert len(paths) == 1
+    assert paths[0].get("d").count("M") == 2 * SIZE - 1
+    assert len([p for p in root.iter(f"{SVG_NS}path")
+                if p.get("stroke") == "red"]) == 1
+    assert len(list(root.iter(f"{SVG_NS}use"))) == SIZE - 1
+
+
+def test_multiple_edges_are_curved():
+    root = _build('<edge vertices="(1,2)" stroke="red"/>',
+                  graph="{0: [1, 1, 2], 1: [2]}")
+    d = _edge_paths(root)[0].get("d")
+    assert d.count("M") == 3 and d.count("L") == 1 and d.count("Q") == 4
@@ -0,0 +1,116 @@
+"""``<network>`` layout cache tests.
+
+Checks that a network built again reuses its cached layout and gives the same
+SVG, that the cache survives a round trip through a cache file, and that a
+spring layout with ``warm-start="yes"`` keeps the nodes unaffected by a change
+to the graph where the cached layout put them.  Also checks that a bipartite
+layout whose set is given by name is found again when the value of the name
+changes, and that the same graph written in a different order doesn't share a
+cached layout.
+"""
+
+from pathlib import Path
+
+import lxml.etree as ET
+import networkx as nx
+import numpy as np
+
+from helpers.build_helper import find_publication, load_source, pushd, temp_workdir
+
+EXAMPLES = Path(__file__).resolve().parent / "examples" / "extracted_from_docs"
+GRAPH = "{" + ", ".join(f"{i}: [{(i + 1) % 20}, {(i + 7) % 20}]" for i in range(20)) + "}"
+
+
+def _build():
+    from prefig.core import metrics, parse
+
+    source = ('<diagram dimensions="(300,300)" margins="5">'
+              '<coordinates bbox="(0,0,10,10)">'
+              f'<network graph="{GRAPH}" seed="3"/>'
+              '</coordinates></diagram>')
+    build_metrics = metrics.BuildMetrics()
+    svg, _ = parse.mk_diagram(ET.fromstring(source), "svg", None, "network",
+                              False, None, "pf_cli", return_string=True,
+                              build_metrics=build_metrics)
+    return svg, build_metrics.record()["caches"]["network-layouts"]
+
+
+def test_layouts_are_cached():
+    from prefig.core import network
+
+    network.layout_cache.clear()
+    svg, caches = _build()
+    assert caches["misses"] == 1
+    again, caches = _build()
+    assert caches["hits"] == 1 and again == svg
+
+    with temp_workdir("test_network_layout") as workdir:
+        network.load_layout_cache(str(workdir / "layouts.json"))
+        network.save_layout_cache()
+        network.layout_cache.clear()
+        network.load_layout_cache(str(workdir / "layouts.json"))
+        network.layout_cache_file = None
+    from_file, caches = _build()
+    assert caches["hits"] == 1 and from_file == svg
+
+
+def test_warm_start():
+    from prefig.core import network
+
+    network.layout_cache.clear()
+    element = ET.Element("network", {"warm-start": "yes"})
+    G = nx.cycle_graph([str(i) for i in range(30)])
+    before = network.layout_positions(G, element)
+
+    G.add_edge("29", "new")
+    after = network.layout_positions(G, element)
+    for node in G.nodes():
+        if node not in ("29", "new"):
+            assert np.array_equal(after[node], before[node])
+    assert not np.array_equal(after["29"], before["29"])
+
+    # a graph that has changed too much is laid out afresh
+    G.add_edges_from((str(i), f"other{i}") for i in range(10))
+    fresh = network.layout_positions(G, element)
+    assert np.array_equal(fresh["0"], nx.spring_layout(G, seed=1)["0"])
+
+
+def test_bipartite_set_by_name():
+    from prefig.core import network, user_namespace
+
+    network.layout_cache.clear()
+    element = ET.Element("network", {"layout": "bipartite", "bipartite-set": "S"})
+    G = nx.complete_bipartite_graph(2, 2)
+    G = nx.relabel_nodes(G, str)
+    user_namespace.define("S=[0,1]")
+    first = network.layout_positions(G, element)
+    user_namespace.define("S=[0,2]")
+    second = network.layout_positions(G, element)
+    assert first["1"][1] == first["0"][1]
+    assert second["2"][1] == second["0"][1]
+    assert second["1"][1] != second["0"][1]
+
+
+def _build_example(name):
+    from prefig.core import parse
+
+    source = EXAMPLES / f"{name}.xml"
+    with pushd(source.parent):
+        svg, _ = parse.mk_diagram(load_source(source), "svg", find_publication(),
+                                  source.stem, False, None, "pf_cli",
+                                  return_string=True)
+    return svg
+
+
+def test_graph_order_is_part_of_the_key():
+    from prefig.core import network
+
+    # both examples describe the same graph, with the edges added in
+    # different orders
+    fresh = {}
+    for name in ["network-intro", "network-verbose"]:
+        network.layout_cache.clear()
+        fresh[name] = _build_example(name)
+    network.layout_cache.clear()
+    for name in ["network-intro", "network-verbose"]:
+        assert _build_example(name) == fresh[name]
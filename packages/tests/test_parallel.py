@@ -0,0 +1,108 @@
+"""Parallel builds.
+
+Builds a diagram with implicit curves, a slope field, a network, and an ODE
+solution serially and with a pool of processes, and checks that the SVG is
+identical, that work done in the pool is used, and that work whose inputs
+change before its element is reached is done again.  Also checks that a
+diagram forks its pool only once, even with repeats, and that a build leaves
+no parallel state behind, even when it fails.
+"""
+
+import lxml.etree as ET
+import pytest
+
+from helpers.build_helper import temp_workdir
+
+SOURCE = """<diagram dimensions="(300,300)" margins="5">
+<definition>f(x,y) = x^2 + y^2 - 4 + sin(3*x*y)</definition>
+<definition>g(t,y) = (y[1], -y[0] - 0.1*y[1])</definition>
+<coordinates bbox="(-4,-4,4,4)">
+<implicit-curve function="f" depth="7" stroke="red"/>
+<slope-field function="g" system="yes" spacings="((-4,0.5,4),(-4,0.5,4))"/>
+<definition>f(x,y) = x^2 - y^2 - 1</definition>
+<implicit-curve function="f" depth="7"/>
+<network graph="{0:[1,2,3], 1:[2], 3:[4]}" seed="2"/>
+<plot-de-solution function="g" t0="0" y0="(1,0)" t1="10" axes="(y0,y1)"/>
+</coordinates></diagram>"""
+
+
+@pytest.fixture
+def used(monkeypatch):
+    from prefig.core import parallel
+
+    used = []
+    install = parallel.Batch.install
+
+    def recording_install(self, child, diagram):
+        install(self, child, diagram)
+        if child.tag in ("implicit-curve", "slope-field", "network",
+                         "plot-de-solution"):
+            used.append(diagram.get_source_data(child, "prefetched") is not None)
+
+    monkeypatch.setattr(parallel.Batch, "install", recording_install)
+    yield used
+    parallel.init()
+
+
+def _build(processes=None):
+    from prefig.core import network, parallel, parse
+
+    network.layout_cache.clear()
+    parallel.init(processes)
+    svg, _ = parse.mk_diagram(ET.fromstring(SOURCE), "svg", None, "parallel",
+                              False, None, "pf_cli", return_string=True)
+    return svg
+
+
+def test_parallel_build_is_identical(used):
+    serial = _build()
+    assert used == []
+    assert _build(2) == serial
+    # the second implicit curve reads a function redefined before it
+    assert used == [True, True, False, True, True]
+
+
+def test_changed_inputs_are_found(used, monkeypatch):
+    from prefig.core import parallel
+
+    serial = _build()
+    # without looking ahead at the definitions, the work of the second
+    # implicit curve is started and must be found to be out of date
+    monkeypatch.setattr(parallel, "writes", lambda element: set())
+    assert _build(2) == serial
+    assert used == [True, True, False, True, True]
+
+
+def test_pool_is_forked_once(used, monkeypatch):
+    import multiprocessing
+
+    from prefig.core import parallel, parse, user_namespace
+
+    source = ('<diagram dimensions="(300,300)" margins="5">'
+              '<definition>f(x,y) = x^2 + y^2 - 4</definition>'
+              '<coordinates bbox="(-4,-4,4,4)">'
+              '<implicit-curve function="f" depth="6"/>'
+              '<repeat parameter="k=1..3">'
+              '<implicit-curve function="f" depth="6" stroke="red"/>'
+              '</repeat></coordinates></diagram>')
+    contexts = []
+    get_context = multiprocessing.get_context
+    monkeypatch.setattr(multiprocessing, "get_context",
+                        lambda method=None: contexts.append(method) or get_context(method))
+    parallel.init(2)
+    parse.mk_diagram(ET.fromstring(source), "svg", None, "parallel",
+                     False, None, "pf_cli", return_string=True)
+    assert contexts == ["fork"]
+    assert used == [True]
+    assert user_namespace.write_log is None
+
+
+def test_failed_build_resets_parallel():
+    from prefig import engine
+    from prefig.core import parallel
+
+    with temp_workdir("test_parallel") as workdir, pytest.raises(OSError):
+        engine.build("svg", str(workdir / "missing.xml"),
+                     ignore_publication=True, environment="pf_cli",
+                     parallel=2)
+    assert parallel.workers is None
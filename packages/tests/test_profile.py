@@ -0,0 +1,69 @@
+"""Build profiler (``prefig build --profile``) tests.
+
+Builds a label-free example with a ``BuildProfiler`` attached and checks that
+every dispatched element is recorded, that nested elements report inclusive
+measurements at least as large as their self measurements, and that the
+collapsed-stack output is well formed.  Also checks that ``engine.build`` hands
+the text report back to its caller rather than printing it.
+"""
+
+from pathlib import Path
+
+from helpers.build_helper import load_source, pushd, temp_workdir
+
+EXAMPLES_DIR = Path(__file__).resolve().parent / "examples"
+SOURCE = EXAMPLES_DIR / "extracted_from_docs" / "nested-repeat.xml"
+
+
+def _profile(source):
+    from prefig.core import parse, profile
+
+    profiler = profile.BuildProfiler()
+    with pushd(source.parent):
+        diagram = load_source(source)
+        parse.mk_diagram(diagram, "svg", None, source.stem, False, None,
+                         "pf_cli", return_string=True, profiler=profiler)
+    return profiler
+
+
+def test_profile_records_every_element():
+    profiler = _profile(SOURCE)
+    tags = {record["tag"] for record in profiler.records}
+    assert {"coordinates", "repeat", "rectangle"} <= tags
+    for record in profiler.records:
+        for measure, value in record["self"].items():
+            assert 0 <= value <= record["inclusive"][measure]
+
+    rectangles = [e for e in profiler.summarize() if e["tag"] == "rectangle"]
+    assert len(rectangles) == 1
+    assert rectangles[0]["calls"] == 25
+    assert rectangles[0]["line"] is not None
+    assert rectangles[0]["inclusive"]["svg-nodes"] >= 25
+    assert rectangles[0]["inclusive"]["expressions"] > 0
+
+
+def test_profile_collapsed_stacks():
+    profiler = _profile(SOURCE)
+    stacks = profiler.collapsed_stacks()
+    assert stacks
+    for line in stacks:
+        stack, micros = line.rsplit(" ", 1)
+        assert stack.startswith("diagram;")
+        assert int(micros) >= 0
+    assert "rectangle" in profiler.report()
+
+
+def test_profile_report_returned(capsys):
+    from prefig import engine
+
+    with temp_workdir("test_profile") as workdir:
+        source = workdir / SOURCE.name
+        source.write_text(SOURCE.read_text())
+        report = []
+        engine.build("svg", str(source), ignore_publication=True,
+                     environment="pf_cli", profile=True,
+                     profile_report=report)
+        assert (workdir / "output" / "nested-repeat-profile.json").exists()
+    assert len(report) == 1 and "rectangle" in report[0]
+    # the library leaves printing the report to its caller
+    assert "rectangle" not in capsys.readouterr().out
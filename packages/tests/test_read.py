@@ -0,0 +1,80 @@
+"""``<read>`` data loading tests.
+
+Checks that the columnar loader gives float columns for numerical data and
+string columns for ``string-columns``, falls back to per-entry conversion when
+a numerical column has other entries, and that a file read again is served
+from the parsed-data cache as a fresh copy. Also checks that ``.npy`` and
+``.npz`` files are memory-mapped and appear as named columns.
+"""
+
+from pathlib import Path
+
+import lxml.etree as ET
+import numpy as np
+
+from helpers.build_helper import temp_workdir
+
+IRIS = Path(__file__).resolve().parent / "examples" / "extracted_from_docs" / "data" / "iris.data"
+
+
+def _load(filename, string_columns="[]"):
+    from prefig.core import metrics, read, user_namespace
+
+    element = ET.Element("read", {"string-columns": string_columns})
+    build_metrics = metrics.BuildMetrics()
+    metrics.activate(build_metrics)
+    try:
+        read.load_csv(element, None, filename, "df")
+    finally:
+        metrics.deactivate()
+    return user_namespace.df, build_metrics.record()["caches"]["csv"]
+
+
+def test_columns_and_cache():
+    from prefig.core import read
+
+    read.csv_cache.clear()
+    df, caches = _load(IRIS, "['species']")
+    assert caches["misses"] == 1
+    assert df["sepal length"].dtype == float and len(df["sepal length"]) == 150
+    assert df["species"][0] == "Iris-setosa"
+
+    df["sepal length"][0] = -1
+    again, caches = _load(IRIS, "['species']")
+    assert caches["hits"] == 1
+    assert again["sepal length"][0] == 5.1
+
+
+def test_mixed_column():
+    with temp_workdir("test_read") as workdir:
+        source = workdir / "mixed.csv"
+        source.write_text("a,b\n1,x\n2.5,4\n")
+        df, _ = _load(source)
+    assert np.array_equal(df["a"], [1, 2.5])
+    assert list(df["b"]) == ["x", "4.0"]
+
+
+def test_numpy_files():
+    from prefig.core import math_utilities, read, user_namespace
+
+    data = np.zeros(4, dtype=[("t", float), ("group", int)])
+    data["t"] = [0.5, 1.5, 2.5, 3.5]
+    data["group"] = [0, 1, 0, 1]
+    with temp_workdir("test_read") as workdir:
+        np.save(workdir / "structured.npy", data)
+        np.savez(workdir / "arrays.npz", t=data["t"], group=data["group"])
+        np.savez_compressed(workdir / "compressed.npz", t=data["t"])
+        for filename in ["structured.npy", "arrays.npz", "compressed.npz"]:
+            read.load_numpy(ET.Element("read"), None, workdir / filename, "df",
+                            filename.split(".")[1])
+            df = user_namespace.df
+            assert np.array_equal(df["t"], data["t"])
+            assert not df["t"].flags.writeable
+            if filename != "compressed.npz":
+                assert isinstance(df["t"], np.memmap)
+                assert np.array_equal(math_utilities.filter(df, "t", "group", 1), [1.5, 3.5])
+
+        np.save(workdir / "plain.npy", np.arange(6.0).reshape(3, 2))
+        read.load_numpy(ET.Element("read", columns="['x','y']"), None,
+                        workdir / "plain.npy", "df", "npy")
+        assert np.array_equal(user_namespace.df["y"], [1, 3, 5])
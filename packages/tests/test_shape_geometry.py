@@ -0,0 +1,94 @@
+"""Shapely geometries kept for ``<define-shapes>``.
+
+Checks that a shape's geometry is built once however many operations use it,
+that a shape defined by an operation keeps the geometry the operation produced,
+that repeating an operation reuses its result, and that curves are flattened
+to within a tolerance with fewer pieces for smaller curves.
+"""
+
+import lxml.etree as ET
+import numpy as np
+import shapely
+
+SVG_NS = "{http://www.w3.org/2000/svg}"
+
+
+def test_shape_geometries_are_reused():
+    from prefig.core import metrics, parse
+
+    source = ('<diagram dimensions="(200,200)" margins="5">'
+              '<coordinates bbox="(-4,-4,4,4)">'
+              '<define-shapes>'
+              '<circle at="a" center="(-1,0)" radius="2"/>'
+              '<circle at="b" center="(1,0)" radius="2"/>'
+              '<circle at="c" center="(0,1)" radius="2"/>'
+              '<shape at="ab" shapes="a,b" operation="intersection"/>'
+              '</define-shapes>'
+              '<shape shapes="ab,c" operation="intersection" fill="blue"/>'
+              '<shape shapes="ab,c" operation="intersection" stroke="red"/>'
+              '<shape shapes="a,c" operation="union" fill="green"/>'
+              '</coordinates></diagram>')
+    build_metrics = metrics.BuildMetrics()
+    svg, _ = parse.mk_diagram(ET.fromstring(source), "svg", None, "shapes",
+                              False, None, "pf_cli", return_string=True,
+                              build_metrics=build_metrics)
+    caches = build_metrics.record()["caches"]
+    # a, b, and c are each built from their paths once while ab is
+    # reused from its definition and a and c again for the union
+    assert (caches["shape-geometries"]["hits"],
+            caches["shape-geometries"]["misses"]) == (3, 3)
+    assert (caches["shape-operations"]["hits"],
+            caches["shape-operations"]["misses"]) == (1, 3)
+
+    root = ET.fromstring(svg.encode())
+    fill = [p for p in root.iter(f"{SVG_NS}path") if p.get("fill") == "blue"]
+    stroke = [p for p in root.iter(f"{SVG_NS}path") if p.get("stroke") == "red"]
+    assert fill[0].get("d") == stroke[0].get("d")
+
+
+def test_adaptive_flattening():
+    from prefig.core import shape
+
+    # a quadratic quarter circle of radius r deviates from its chord by
+    # about r/4, so a large one is divided into many more pieces
+    def pieces(r, tolerance=shape.default_tolerance):
+        d = f"M {r} 0 Q {r} {r} 0 {r} Z"
+        geometry = shape.build_shapely_geom(d, tolerance=tolerance)
+        return len(geometry.geoms[0].exterior.coords)
+
+    assert pieces(0.5) <= 4
+    assert pieces(200) > 3 * pieces(5)
+    assert pieces(200, tolerance=1) < pieces(200)
+
+    # the pieces of a cubic stay within the tolerance of the curve
+    d = "M 0 0 C 0 100 100 100 100 0 L 100 -10 L 0 -10 Z"
+    geometry = shape.build_shapely_geom(d, tolerance=0.25)
+    t = np.linspace(0, 1, 2001)
+    curve = np.column_stack((300 * t**2 * (1 - t) + 100 * t**3,
+                             300 * t * (1 - t)))
+    assert np.max(shapely.distance(geometry.boundary,
+                                   shapely.points(curve))) < 0.25
+
+
+def _convex_hull_size(shape_attributes="", templates=""):
+    from prefig.core import parse
+
+    source = ('<diagram dimensions="(200,200)" margins="5">'
+              f'<templates>{templates}</templates>'
+              '<coordinates bbox="(-4,-4,4,4)">'
+              '<define-shapes>'
+              '<rectangle at="r" center="(0,0)" dimensions="(4,4)" corner-radius="30"/>'
+              '</define-shapes>'
+              f'<shape shapes="r" operation="convex-hull" stroke="red" {shape_attributes}/>'
+              '</coordinates></diagram>')
+    svg, _ = parse.mk_diagram(ET.fromstring(source), "svg", None, "shapes",
+                              False, None, "pf_cli", return_string=True)
+    root = ET.fromstring(svg.encode())
+    path = [p for p in root.iter(f"{SVG_NS}path") if p.get("stroke") == "red"][0]
+    return len(path.get("d").split())
+
+
+def test_tolerance_is_configurable():
+    default = _convex_hull_size()
+    assert _convex_hull_size('tolerance="2"') < default
+    assert _convex_hull_size(templates='<shape tolerance="2"/>') < default
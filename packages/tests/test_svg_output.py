@@ -0,0 +1,103 @@
+"""Writing the SVG output files.
+
+Builds diagrams inside PreTeXt, which writes the SVG along with SVG 1.1 and
+diagcess versions, and with ``-f svg11``, and checks that the files, written
+together one top-level element at a time, are byte-identical to what the
+original writer produced: the whole tree written once per file, converted to
+SVG 1.1 in place, with the diagcess version trading the width and height for an
+aspect-ratio style.  The SVG 1.1 versions are converted from copies so the
+diagram's own tree is left as SVG 2.
+"""
+
+import copy
+
+import lxml.etree as ET
+
+from helpers.build_helper import temp_workdir
+
+ARROWS = """<diagram dimensions="(200,120)" margins="5">
+<coordinates bbox="(0,0,10,6)">
+<line endpoints="((1,1),(9,5))" arrows="2" at="segment"/>
+<circle center="(5,3)" radius="2" fill="lightblue"/>
+</coordinates>
+{}
+</diagram>"""
+ANNOTATIONS = """<annotations>
+<annotation ref="figure" text="A segment and a circle">
+<annotation ref="segment" text="A segment with arrows"/>
+</annotation>
+</annotations>"""
+
+
+def _write(root, filename):
+    with ET.xmlfile(filename, encoding="utf-8") as xf:
+        xf.write(root, pretty_print=True)
+
+
+def _build(workdir, source, environment, format="svg"):
+    from prefig import engine
+    from prefig.core import diagram
+
+    captured = []
+    write_svg = diagram.Diagram.write_svg
+
+    def capturing_write_svg(self, outputs):
+        captured.append((self, copy.deepcopy(self.root)))
+        return write_svg(self, outputs)
+
+    path = workdir / "figure.xml"
+    path.write_text(source)
+    diagram.Diagram.write_svg = capturing_write_svg
+    try:
+        engine.build(format, str(path), ignore_publication=True,
+                     environment=environment)
+    finally:
+        diagram.Diagram.write_svg = write_svg
+    assert len(captured) == 1
+    return captured[0]
+
+
+def _serialize(workdir, root):
+    _write(root, workdir / "expected.svg")
+    return (workdir / "expected.svg").read_bytes()
+
+
+def _expected(workdir, diagram, root, svg2):
+    expected = {}
+    # the SVG 2 version comes first, then the tree is converted in place
+    if svg2:
+        expected["figure.svg"] = _serialize(workdir, root)
+    diagram.svg11_conversion(root)
+    expected["figure-11.svg"] = _serialize(workdir, root)
+    if svg2 and diagram.author_annotations_present:
+        width = root.attrib.pop("width")
+        height = root.attrib.pop("height")
+        root.set("style", f"aspect-ratio: {width} / {height};")
+        expected["figure-diagcess.svg"] = _serialize(workdir, root)
+    return expected
+
+
+def test_pretext_outputs_match_original_writer():
+    for annotations, files in [
+            ("", ["figure-11.svg", "figure.svg"]),
+            (ANNOTATIONS, ["figure-11.svg", "figure-diagcess.svg", "figure.svg"])
+    ]:
+        with temp_workdir("test_svg_output") as workdir:
+            for name in ["figure.svg", "figure-11.svg", "figure-diagcess.svg"]:
+                (workdir / "output" / name).unlink(missing_ok=True)
+            diagram, root = _build(workdir, ARROWS.format(annotations), "pretext")
+            expected = _expected(workdir, diagram, root, True)
+            assert sorted(expected) == files
+            for name in files:
+                assert (workdir / "output" / name).read_bytes() == expected[name]
+            if not annotations:
+                assert not (workdir / "output" / "figure-diagcess.svg").exists()
+            assert b"arrow-head-start" not in ET.tostring(diagram.root)
+
+
+def test_svg11_output_matches_original_writer():
+    with temp_workdir("test_svg_output") as workdir:
+        diagram, root = _build(workdir, ARROWS.format(""), "pf_cli", "svg11")
+        expected = _expected(workdir, diagram, root, False)
+        assert (workdir / "output" / "figure-11.svg").read_bytes() == expected["figure-11.svg"]
+        assert b"arrow-head-start" in expected["figure-11.svg"]
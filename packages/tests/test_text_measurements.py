@@ -0,0 +1,29 @@
+"""Plain-text label measurement tests.
+
+Checks the bundled font-metric measurer used when pycairo is not installed:
+measurements are deterministic, scale with the font size, respect bold and
+italic widths, and give descenders a depth below the baseline.
+"""
+
+def test_font_metric_measurements():
+    from prefig.core import label_tools
+
+    measurer = label_tools.FontMetricTextMeasurements()
+    width, above, below = measurer.measure_text("Hello", ["sans-serif", 14, False, False, None])
+    # Helvetica advance widths: H 722, e 556, l 222, l 222, o 556
+    assert abs(width - 14 * 2278 / 1000) < 1e-9
+    assert above > 0 and below == 0
+
+    assert measurer.measure_text("Hello", ["sans-serif", 28, False, False, None])[0] == 2 * width
+    assert measurer.measure_text("Hello", ["sans-serif", 14, False, True, None])[0] > width
+    assert measurer.measure_text("mmm", ["monospace", 10, False, False, None])[0] == 18
+    assert measurer.measure_text("y", ["serif", 14, True, False, None])[2] > 0
+
+
+def test_font_metric_fallbacks():
+    from prefig.core import font_metrics
+
+    # characters outside ASCII and unknown families still get a measurement
+    width, above, below = font_metrics.measure("αβ", "fantasy", 10, False, False)
+    assert width > 0 and above > 0
+    assert font_metrics.measure("", "serif", 10, False, False) == [0, 0, 0]
@@ -0,0 +1,90 @@
+"""Values given to generated elements without formatting them as strings.
+
+Checks that a value entered with ``user_namespace.value_token`` is returned by
+``valid_eval`` without parsing, that each element receives its own copy, and
+that the lines of a ``<slope-field>`` and the points of a ``<scatter>`` are
+evaluated without parsing an expression for each of them.  Coordinates that
+were once written with ``pt2long_str`` keep its four decimal places.
+"""
+
+import lxml.etree as ET
+import numpy as np
+
+
+def _parsed_expressions(monkeypatch, body):
+    import ast
+
+    from prefig.core import parse
+
+    parsed = []
+    ast_parse = ast.parse
+
+    def recording_parse(source, *args, **kwargs):
+        parsed.append(source)
+        return ast_parse(source, *args, **kwargs)
+
+    source = ('<diagram dimensions="(200,200)" margins="5">'
+              '<definition>f(t,y) = (y[1], -y[0])</definition>'
+              f'<coordinates bbox="(-4,-4,4,4)">{body}</coordinates></diagram>')
+    # user_namespace is reloaded by the build so we watch the parser itself
+    with monkeypatch.context() as m:
+        m.setattr(ast, "parse", recording_parse)
+        svg, _ = parse.mk_diagram(ET.fromstring(source), "svg", None, "typed",
+                                  False, None, "pf_cli", return_string=True)
+    return parsed, ET.fromstring(svg.encode())
+
+
+def test_value_token(monkeypatch):
+    from prefig.core import user_namespace as un
+
+    value = np.array([1.5, -2.25])
+    token = un.value_token(value)
+
+    def fail(*args):
+        raise AssertionError("a typed value was parsed")
+
+    with monkeypatch.context() as m:
+        m.setattr(un, "validate", fail)
+        received = un.valid_eval(token)
+        assert np.array_equal(received, value) and received is not value
+        un.valid_eval(token, "v")
+    assert np.array_equal(un.retrieve("v"), value)
+    # the token may also appear in an expression
+    assert np.array_equal(un.valid_eval(f"2*{token}"), 2*value)
+
+
+def test_generated_elements_are_not_parsed(monkeypatch):
+    from prefig.core import user_namespace as un
+
+    svg_ns = "{http://www.w3.org/2000/svg}"
+    parsed, root = _parsed_expressions(
+        monkeypatch,
+        '<slope-field function="f" system="yes" spacings="((-4,0.5,4),(-4,0.5,4))"/>'
+    )
+    lines = len(list(root.iter(f"{svg_ns}line")))
+    assert lines > 200
+    assert len(un.typed_values) == 2*lines
+    assert not any("__value_" in expr for expr in parsed)
+
+    points = [(0.1*k, np.sin(k)) for k in range(40)]
+    parsed, root = _parsed_expressions(
+        monkeypatch,
+        f'<definition>pts = {[tuple(p) for p in points]}</definition>'
+        '<scatter points="pts"/>'
+    )
+    assert len(list(root.iter(f"{svg_ns}circle"))) == len(points)
+    assert len(un.typed_values) == len(points)
+    assert not any("__value_" in expr for expr in parsed)
+
+
+def test_long_values_keep_four_places():
+    from prefig.core import user_namespace as un
+    from prefig.core import utilities
+
+    points = np.array([[201.34567, 12.30004], [-0.00004, 1 / 3]])
+    element = ET.Element("line")
+    utilities.set_long_value(element, "endpoints", points)
+    value = un.valid_eval(element.get("endpoints"))
+    written = ",".join("(" + utilities.pt2long_str(p, spacer=",") + ")"
+                       for p in points)
+    assert np.array_equal(value, un.valid_eval(written))